@@ -0,0 +1,228 @@
+"""
+Stored probabilities and zero-inference aggregation.
+
+The scorer saves the full softmax vector of every chunk for every head to
+data/probs/<name>.npz. Everything in results.csv can then be recomputed from
+those arrays for any threshold or weight_map without running a model:
+
+    python aggregate.py --threshold 0.7 --out results_t07.csv
+    python aggregate.py --sweep 0.5 0.95 0.05 --out threshold_sweep.csv
+
+Stored arrays per report:
+    relate, relate_labels       detector probs for every chunk
+    candidates                  chunk indices the downstream heads ran on
+                                (detector "yes" with score >= detector_floor)
+    <head>, <head>_labels       probs for each downstream head, one row per candidate
+    detector_floor              lowest detector threshold the file supports
+    prefiltered                 (optional) chunk indices the prefilter skipped;
+                                their relate row is a one-hot "no"
+"""
+
+import argparse
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+PROBS_DIR = "data/probs"
+
+DEFAULT_THRESHOLD = 0.8
+
+# risk=2, neutral=1, opportunity=0
+SENTIMENT_WEIGHTS = {
+    "risk": 2,
+    "neutral": 1,
+    "opportunity": 0,
+}
+TCFD_CATEGORIES = ["metrics", "strategy", "governance", "risk"]
+
+# weight_map per downstream head (same defaults as main.specificity/sentiment/commitment)
+DEFAULT_WEIGHT_MAPS = {
+    "spec": {"spec": 1},
+    "senti": SENTIMENT_WEIGHTS,
+    "commit": {"yes": 1},
+}
+
+RESULT_COLUMNS = ["name", "relate", "spec", "senti", "commit", "metrics", "strategy", "governance", "risk"]
+
+
+def build_result_row(name, relate, spec, senti, commit, tcfd):
+    sum_tcfd = sum(tcfd.values())
+
+    return {
+        "name": name,
+        "relate": relate,
+        "spec": spec,
+        "senti": senti,
+        "commit": commit,
+        "metrics": (tcfd.get("metrics", 0)/ sum_tcfd) if sum_tcfd > 0 else 0,
+        "strategy": (tcfd.get("strategy", 0)/ sum_tcfd) if sum_tcfd > 0 else 0,
+        "governance": (tcfd.get("governance", 0)/ sum_tcfd) if sum_tcfd > 0 else 0,
+        "risk": (tcfd.get("risk", 0)/ sum_tcfd) if sum_tcfd > 0 else 0,
+    }
+
+
+# ----------------------------------
+# Persistence
+# ----------------------------------
+
+def save_report_probs(path, name, relate, relate_labels, candidates, heads, detector_floor, prefiltered=None):
+    """
+    relate:      (n_chunks, n_labels) detector probabilities
+    candidates:  chunk indices the downstream heads were run on
+    heads:       {head: (probs (n_candidates, n_labels), labels)}
+    prefiltered: chunk indices the detector never saw (see prefilter.py)
+    """
+    arrays = {
+        "name": np.array(name),
+        "relate": np.asarray(relate, dtype=np.float32),
+        "relate_labels": np.array(relate_labels),
+        "candidates": np.asarray(candidates, dtype=np.int32),
+        "detector_floor": np.array(detector_floor, dtype=np.float64),
+    }
+    if prefiltered is not None:
+        arrays["prefiltered"] = np.asarray(prefiltered, dtype=np.int32)
+    for head, (probs, labels) in heads.items():
+        arrays[head] = np.asarray(probs, dtype=np.float32)
+        arrays[f"{head}_labels"] = np.array(labels)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.savez_compressed(path, **arrays)
+
+
+def load_report_probs(path):
+    with np.load(path) as data:
+        report = {key: data[key] for key in data.files}
+    report["name"] = str(report["name"])
+    report["detector_floor"] = float(report["detector_floor"])
+    return prepare(report)
+
+
+def load_probs_dir(probs_dir=PROBS_DIR):
+    return [load_report_probs(path) for path in sorted(glob.glob(os.path.join(probs_dir, "*.npz")))]
+
+
+def prepare(report):
+    """Precompute top label / score per head so repeated aggregations are cheap."""
+    # an empty candidate list would otherwise be float64 and unusable as an index
+    report["candidates"] = np.asarray(report["candidates"], dtype=np.int64)
+    for head in ["relate", *DEFAULT_WEIGHT_MAPS, "tcfd"]:
+        probs = report[head]
+        if len(probs):
+            # compare in float64 like the python-float scores the pipelines return
+            report[f"{head}_score"] = probs.max(axis=1).astype(np.float64)
+            report[f"{head}_label"] = probs.argmax(axis=1)
+        else:
+            report[f"{head}_score"] = np.zeros(0, dtype=np.float64)
+            report[f"{head}_label"] = np.zeros(0, dtype=np.int64)
+    return report
+
+
+# ----------------------------------
+# Aggregation
+# ----------------------------------
+
+def _weighted_tally(report, head, mask, threshold, weight_map):
+    labels = report[f"{head}_labels"]
+    weights = np.array([weight_map.get(str(label), 0) for label in labels])
+
+    confident = mask & (report[f"{head}_score"] >= threshold)
+    total = int(confident.sum())
+    count = weights[report[f"{head}_label"][confident]].sum()
+    return count, total
+
+
+def aggregate_report(report, threshold=DEFAULT_THRESHOLD, detector_threshold=None, weight_maps=None):
+    """
+    Recompute one results.csv row from stored probabilities.
+    `threshold` applies to the downstream heads, `detector_threshold`
+    (defaults to `threshold`) to the climate detector.
+    """
+    detector_threshold = threshold if detector_threshold is None else detector_threshold
+    if detector_threshold < report["detector_floor"]:
+        raise ValueError(
+            f"{report['name']}: detector threshold {detector_threshold} is below the stored "
+            f"floor {report['detector_floor']}; re-score with a lower DETECTOR_FLOOR"
+        )
+    weight_maps = {**DEFAULT_WEIGHT_MAPS, **(weight_maps or {})}
+
+    yes = int(np.flatnonzero(report["relate_labels"] == "yes")[0])
+    confident = report["relate_score"] >= detector_threshold
+    kept = confident & (report["relate_label"] == yes)
+
+    total = int(confident.sum())
+    relate = int(kept.sum()) / total if total > 0 else 0
+
+    # downstream heads only count chunks kept by the detector at this threshold
+    in_kept = kept[report["candidates"]]
+
+    count, total = _weighted_tally(report, "spec", in_kept, threshold, weight_maps["spec"])
+    spec = float(count / total) if total > 0 else 0
+
+    count, total = _weighted_tally(report, "senti", in_kept, threshold, weight_maps["senti"])
+    senti = round(float(count / (total * 2)), 2) if total > 0 else 0
+
+    count, total = _weighted_tally(report, "commit", in_kept, threshold, weight_maps["commit"])
+    commit = round(float(count / total), 2) if total > 0 else 0
+
+    tcfd_labels = report["tcfd_label"][in_kept & (report["tcfd_score"] >= threshold)]
+    counts = np.bincount(tcfd_labels, minlength=len(report["tcfd_labels"]))
+    tcfd = {label: 0 for label in TCFD_CATEGORIES}
+    for label, n in zip(report["tcfd_labels"], counts):
+        if str(label) in tcfd:
+            tcfd[str(label)] = int(n)
+
+    return build_result_row(report["name"], relate, spec, senti, commit, tcfd)
+
+
+def aggregate(reports, threshold=DEFAULT_THRESHOLD, detector_threshold=None, weight_maps=None):
+    """results.csv for every stored report at the given threshold / weights."""
+    rows = [aggregate_report(report, threshold, detector_threshold, weight_maps) for report in reports]
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+
+def sweep(reports, thresholds, detector_thresholds=None, weight_maps=None):
+    """
+    Metric curves: one row per (report, threshold[, detector_threshold]).
+    Without detector_thresholds the same threshold is used for every head.
+    """
+    frames = []
+    for detector_threshold in (detector_thresholds if detector_thresholds is not None else [None]):
+        for threshold in thresholds:
+            df = aggregate(reports, threshold, detector_threshold, weight_maps)
+            df.insert(1, "threshold", threshold)
+            df.insert(2, "detector_threshold", threshold if detector_threshold is None else detector_threshold)
+            frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute results.csv from stored probabilities.")
+    parser.add_argument("--probs-dir", default=PROBS_DIR)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--detector-threshold", type=float, default=None)
+    parser.add_argument("--sweep", type=float, nargs=3, metavar=("START", "STOP", "STEP"),
+                        help="threshold grid, STOP inclusive")
+    parser.add_argument("--out", default=None, help="CSV path, prints to stdout if omitted")
+    args = parser.parse_args()
+
+    reports = load_probs_dir(args.probs_dir)
+
+    if args.sweep:
+        start, stop, step = args.sweep
+        thresholds = np.round(np.arange(start, stop + step / 2, step), 6)
+        detector = [args.detector_threshold] if args.detector_threshold is not None else None
+        df = sweep(reports, thresholds, detector)
+    else:
+        df = aggregate(reports, args.threshold, args.detector_threshold)
+
+    if args.out:
+        df.to_csv(args.out, index=False)
+        print(f"Wrote {len(df)} rows to {args.out}")
+    else:
+        print(df.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark funcs chunking on the processed corpus.
+
+    python bench_chunker.py                          # data/processed_txt_2024
+    python bench_chunker.py --tokenizer climatebert/distilroberta-base-climate-detector
+
+Each *_chunks.txt file is turned back into report text (chunks joined with
+spaces) and split into ~3000 character "pages". The textwrap-based
+split_and_quote from before the streaming chunker is the baseline; the
+compat mode must reproduce it exactly. With --tokenizer the token mode
+reports how many chunks it produces and how many tokens the longest one has,
+counted on the quoted line with special tokens, as the model receives it.
+"""
+
+import argparse
+import glob
+import os
+import textwrap
+import time
+import tracemalloc
+
+import funcs
+
+PAGE_CHARS = 3000
+
+
+def legacy_split_and_quote(text, width=500):
+    """split_and_quote as it was before iter_split_and_quote (the baseline)."""
+    text = (
+        text.replace("\n", " ")
+            .replace("\r", " ")
+            .replace('"', '')
+    )
+    chunks = textwrap.wrap(text, width=width, break_long_words=True, drop_whitespace=True)
+    return [f"\"{chunk}\"" for chunk in chunks]
+
+
+def load_reports(corpus_dir):
+    reports = {}
+    for path in sorted(glob.glob(os.path.join(corpus_dir, "*_chunks.txt"))):
+        with open(path, encoding="utf-8") as f:
+            reports[os.path.basename(path)] = " ".join(line.strip().strip('"') for line in f)
+    return reports
+
+
+def pages(text):
+    return [text[i:i + PAGE_CHARS] for i in range(0, len(text), PAGE_CHARS)]
+
+
+def measure(name, chunk_report, reports):
+    """
+    Run chunk_report(text) -> list of chunks over every report. Prints the
+    total time, and the peak traced memory of chunking the largest report
+    (a separate run, tracemalloc slows everything down).
+    """
+    start = time.perf_counter()
+    outputs = {key: chunk_report(text) for key, text in reports.items()}
+    elapsed = time.perf_counter() - start
+
+    largest = max(reports.values(), key=len)
+    tracemalloc.start()
+    chunk_report(largest)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    n_chunks = sum(len(chunks) for chunks in outputs.values())
+    print(f"{name:28s} {elapsed:8.2f}s {peak / 1e6:9.1f} MB {n_chunks:9d}")
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the chunker against the textwrap baseline.")
+    parser.add_argument("corpus_dir", nargs="?", default="data/processed_txt_2024")
+    parser.add_argument("--tokenizer", default=None, help="Hugging Face tokenizer for the token-budget mode")
+    parser.add_argument("--max-tokens", type=int, default=funcs.MAX_CHUNK_TOKENS)
+    parser.add_argument("--overlap", type=int, default=64)
+    args = parser.parse_args()
+
+    reports = load_reports(args.corpus_dir)
+    total = sum(len(text) for text in reports.values())
+    print(f"{len(reports)} reports, {total / 1e6:.1f}M characters\n")
+    print(f"{'mode':28s} {'time':>9s} {'peak mem*':>12s} {'chunks':>9s}")
+
+    baseline = measure("split_and_quote (textwrap)", legacy_split_and_quote, reports)
+    compat = measure("compat, whole text", funcs.split_and_quote, reports)
+    streamed = measure("compat, streamed pages",
+                       lambda text: list(funcs.iter_chunks(pages(text), sep="")), reports)
+
+    mismatched = [key for key in reports if not (baseline[key] == compat[key] == streamed[key])]
+    print("* peak traced memory while chunking the largest report, output list included")
+    print(f"\ncompat output identical to baseline: {not mismatched}")
+    for key in mismatched:
+        print(f"   !! differs: {key}")
+
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+        chunked = measure(f"{args.max_tokens} tokens, overlap {args.overlap}",
+                          lambda text: list(funcs.iter_chunks(pages(text), max_tokens=args.max_tokens,
+                                                              tokenizer=tokenizer, overlap=args.overlap)),
+                          reports)
+        # what the model reads: the quoted line plus <s> and </s>
+        limit = args.max_tokens + 2
+
+        def model_tokens(chunk):
+            return len(tokenizer(chunk, verbose=False)["input_ids"])
+
+        longest = max(model_tokens(chunk) for chunks in chunked.values() for chunk in chunks)
+        over = sum(model_tokens(chunk) > limit for chunks in chunked.values() for chunk in chunks)
+        # chunks of the legacy format that the model silently truncates
+        truncated = sum(model_tokens(chunk) > limit for chunks in baseline.values() for chunk in chunks)
+        print(f"\nlongest token chunk: {longest} model tokens (limit {limit}), {over} over the limit; "
+              f"baseline chunks over {limit}: {truncated}")
+        if over:
+            raise SystemExit(1)
+
+    if mismatched:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
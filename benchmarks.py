@@ -0,0 +1,401 @@
+"""
+End-to-end benchmark suite, runnable offline on a CPU-only machine.
+
+    python benchmarks.py                                   # run all, write bench_results.json
+    python benchmarks.py --only split_and_quote pdf_extract
+    python benchmarks.py --save-baseline                   # store as benchmarks_baseline.json
+    python benchmarks.py --check                           # exit 1 on a regression vs the baseline
+
+Every input is generated here from a fixed seed: report-like text, a PDF
+(PyMuPDF), an HTML page with boilerplate, a model output file, and a small
+randomly initialised distilroberta-style classifier with a word-level
+tokenizer, so nothing is downloaded and numbers are comparable between runs
+on the same machine.
+
+Each benchmark runs in its own spawned process, so its peak RSS
+(ru_maxrss) is its own; the best of --repeat timed runs is reported as
+chunks/s and MB/s. A process that crashes or outlives --timeout is reported
+as failed. --check fails when a benchmark fails, throughput drops, or peak
+RSS grows, by more than --tolerance relative to the baseline.
+
+The committed benchmarks_baseline.json was recorded on a 1-CPU Linux box
+(see its "machine" / "cpus" fields). Numbers only compare on the same
+hardware, so on a new machine first record your own from a known-good
+commit with python benchmarks.py --save-baseline.
+"""
+
+import argparse
+import atexit
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import os
+import platform
+import queue as queue_module
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+RESULTS_PATH = "bench_results.json"
+BASELINE_PATH = "benchmarks_baseline.json"
+TOLERANCE = 0.25
+# seconds a benchmark process may run before it is killed and reported as failed
+TIMEOUT = 1800
+SEED = 0
+
+_WORDS = (
+    "climate emissions scope energy renewable transition risk governance strategy metrics target "
+    "carbon reduction board committee disclosure water waste supply chain customers employees "
+    "report sustainability performance investment capital operations facilities reporting year "
+    "we our the and of to in for with on by from as is are was be will have has"
+).split()
+_PHRASES = [
+    "science-based target", "scope 1", "scope 2", "scope 3", "net zero", "1.5°C", "paris-aligned",
+    "limited assurance", "internal carbon price", "tcfd", "scenario analysis", "aims to", "may be",
+    "could affect", "subject to", "forward-looking statements", "carbon credits", "offsets",
+]
+
+
+# ----------------------------------
+# Fixtures
+# ----------------------------------
+
+def fixture_text(n_chars, seed=SEED):
+    """Report-like text with sentences, numbers and the green/red phrases."""
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    while size < n_chars:
+        words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 30))]
+        if rng.random() < 0.3:
+            words.insert(rng.randrange(len(words)), rng.choice(_PHRASES))
+        if rng.random() < 0.2:
+            words.append(f"{rng.randint(1, 99)}.{rng.randint(0, 9)}%")
+        sentence = " ".join(words).capitalize() + ". "
+        parts.append(sentence)
+        size += len(sentence)
+    return "".join(parts)[:n_chars]
+
+
+def fixture_chunks(n_chunks, seed=SEED):
+    import funcs
+
+    chunks = funcs.split_and_quote(fixture_text(n_chunks * 500, seed), width=500)
+    return chunks[:n_chunks]
+
+
+def fixture_pdf(n_pages, seed=SEED):
+    import fitz  # PyMuPDF
+
+    text = fixture_text(n_pages * 2500, seed)
+    doc = fitz.open()
+    for i in range(n_pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(40, 40, 560, 800), text[i * 2500:(i + 1) * 2500], fontsize=8)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def fixture_html(n_paragraphs, seed=SEED):
+    rng = random.Random(seed)
+    text = fixture_text(n_paragraphs * 400, seed)
+    body = "".join(f"<p>{text[i * 400:(i + 1) * 400]}</p>\n" for i in range(n_paragraphs))
+    nav = "".join(f'<li><a href="/p{i}">Link {i}</a></li>' for i in range(50))
+    related = "".join(f'<p><a href="/r{i}">Related story {i}</a></p>' for i in range(50))
+    cookie = '<div class="cookie-banner">We use cookies. By continuing you accept our cookie policy.</div>'
+    script = "var x = %d;" % rng.randint(0, 10 ** 6)
+    return (
+        f"<html><head><style>p {{ margin: 0 }}</style><script>{script}</script></head><body>{cookie}"
+        f"<header>Company</header><nav><ul>{nav}</ul></nav><main>{body}</main><div>{related}</div>"
+        f"<footer>Copyright</footer></body></html>"
+    ).encode("utf-8")
+
+
+def fixture_model(out_dir, labels=("no", "yes"), hidden=64, layers=2, seed=SEED):
+    """Random distilroberta-shaped classifier + word-level tokenizer, saved to out_dir."""
+    import torch
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers, processors
+    from transformers import PreTrainedTokenizerFast, RobertaConfig, RobertaForSequenceClassification
+
+    torch.manual_seed(seed)
+    vocab = {"<s>": 0, "<pad>": 1, "</s>": 2, "<unk>": 3}
+    for word in sorted(set(fixture_text(200_000, seed).lower().split())):
+        vocab.setdefault(word, len(vocab))
+
+    tok = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tok.normalizer = normalizers.Lowercase()
+    tok.pre_tokenizer = pre_tokenizers.Whitespace()
+    tok.post_processor = processors.RobertaProcessing(("</s>", 2), ("<s>", 0))
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tok, bos_token="<s>", eos_token="</s>", unk_token="<unk>",
+        pad_token="<pad>", cls_token="<s>", sep_token="</s>", model_max_length=512,
+    )
+
+    config = RobertaConfig(
+        vocab_size=len(vocab), hidden_size=hidden, num_hidden_layers=layers, num_attention_heads=2,
+        intermediate_size=hidden * 4, max_position_embeddings=514, pad_token_id=1,
+        id2label=dict(enumerate(labels)), label2id={label: i for i, label in enumerate(labels)},
+    )
+    RobertaForSequenceClassification(config).save_pretrained(out_dir)
+    tokenizer.save_pretrained(out_dir)
+    return out_dir
+
+
+# ----------------------------------
+# Benchmarks: setup(scale) -> run() -> {"chunks", "bytes"}; only run() is timed
+# ----------------------------------
+
+def bench_split_and_quote(scale):
+    import funcs
+
+    text = fixture_text(int(4_000_000 * scale))
+
+    def run():
+        return {"chunks": len(funcs.split_and_quote(text, width=500)), "bytes": len(text.encode("utf-8"))}
+    return run
+
+
+def bench_pdf_extract(scale):
+    import data_scrape
+    import funcs
+
+    pdf = fixture_pdf(max(1, int(300 * scale)))
+
+    def run():
+        # the scraper's path: pages extracted in the shared pool (pdf_extract.py)
+        text = "\n".join(data_scrape.iter_text_pieces(pdf, "pdf", ""))
+        return {"chunks": len(funcs.split_and_quote(text, width=500)), "bytes": len(pdf)}
+    return run
+
+
+def bench_html_extract(scale):
+    import data_scrape
+    import funcs
+
+    html = fixture_html(max(1, int(4000 * scale)))
+
+    def run():
+        text = data_scrape.extract_html_text_from_bytes(html)
+        return {"chunks": len(funcs.split_and_quote(text, width=500)), "bytes": len(html)}
+    return run
+
+
+def bench_html_extract_bs4(scale):
+    import funcs
+    import html_extract
+
+    html = fixture_html(max(1, int(4000 * scale)))
+
+    def run():
+        text = html_extract.extract_bs4(html)
+        return {"chunks": len(funcs.split_and_quote(text, width=500)), "bytes": len(html)}
+    return run
+
+
+def bench_count_matches(scale):
+    import word_counts
+
+    chunks = fixture_chunks(int(5000 * scale))
+    patterns = word_counts.GREEN_PATTERNS + word_counts.RED_PATTERNS
+
+    def run():
+        for chunk in chunks:
+            word_counts.count_matches(chunk, patterns)
+        return {"chunks": len(chunks), "bytes": sum(len(c.encode("utf-8")) for c in chunks)}
+    return run
+
+
+def bench_count_words(scale):
+    import model_outputs
+
+    chunks = fixture_chunks(int(20000 * scale))
+    fd, path = tempfile.mkstemp(suffix=".txt")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write("\n".join(chunks) + "\n")
+    atexit.register(os.remove, path)
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            model_outputs.count_words(Path(path))
+        return {"chunks": len(chunks), "bytes": os.path.getsize(path)}
+    return run
+
+
+def bench_run_binary_classifier(scale):
+    # no output cache, CPU only, set before main is imported
+    os.environ["INFERENCE_CACHE"] = ""
+    os.environ.setdefault("SCORER_BACKEND", "cpu")
+    import main
+    from transformers import pipeline
+
+    model_dir = fixture_model(tempfile.mkdtemp(prefix="bench_model_"))
+    atexit.register(shutil.rmtree, model_dir, True)
+    pipe = pipeline("text-classification", model=model_dir, tokenizer=model_dir, device=-1)
+    dataset = main.load_text_dataset(fixture_chunks(int(1000 * scale)))
+    main.run_binary_classifier(pipe, dataset.select(range(min(16, len(dataset)))), "yes")  # warm-up
+
+    def run():
+        with contextlib.redirect_stderr(io.StringIO()):
+            main.run_binary_classifier(pipe, dataset, "yes")
+        return {"chunks": len(dataset), "bytes": sum(len(t.encode("utf-8")) for t in dataset["text"])}
+    return run
+
+
+BENCHMARKS = {
+    "split_and_quote": bench_split_and_quote,
+    "pdf_extract": bench_pdf_extract,
+    "html_extract": bench_html_extract,
+    "html_extract_bs4": bench_html_extract_bs4,
+    "count_matches": bench_count_matches,
+    "count_words": bench_count_words,
+    "run_binary_classifier": bench_run_binary_classifier,
+}
+
+
+# ----------------------------------
+# Runner
+# ----------------------------------
+
+def _child(name, scale, repeat, queue):
+    try:
+        run = BENCHMARKS[name](scale)
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            out = run()
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best[0]:
+                best = (elapsed, out)
+        elapsed, out = best
+        queue.put({
+            "seconds": elapsed,
+            "chunks": out["chunks"],
+            "bytes": out["bytes"],
+            "chunks_per_s": out["chunks"] / elapsed,
+            "mb_per_s": out["bytes"] / 1e6 / elapsed,
+            # kilobytes on Linux
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        })
+    except Exception as e:
+        queue.put({"error": repr(e)})
+    finally:
+        # a multiprocessing child joins its own children before atexit hooks
+        # run, so the shared PDF extraction pool would never be told to exit
+        if "pdf_extract" in sys.modules:
+            sys.modules["pdf_extract"].shutdown_pool()
+
+
+def run_benchmark(name, scale=1.0, repeat=3, timeout=TIMEOUT):
+    """Result dict of one benchmark, {"error": ...} if it raised, died (OOM, crash in C code) or timed out."""
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(name, scale, repeat, queue))
+    proc.start()
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            result = queue.get(timeout=1.0)
+            break
+        except queue_module.Empty:
+            if not proc.is_alive():
+                # the result may have landed between the get and the check
+                try:
+                    result = queue.get(timeout=1.0)
+                except queue_module.Empty:
+                    result = {"error": f"benchmark process died (exit code {proc.exitcode})"}
+                break
+            if time.monotonic() > deadline:
+                proc.kill()
+                result = {"error": f"timed out after {timeout}s"}
+                break
+    proc.join()
+    return result
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """List of regression messages: throughput down or peak RSS up by more than `tolerance`."""
+    problems = []
+    for name, now in results.items():
+        before = baseline.get("benchmarks", {}).get(name)
+        if before is None or "error" in before:
+            continue
+        if "error" in now:
+            problems.append(f"{name}: failed ({now['error']})")
+            continue
+        if now["chunks_per_s"] < before["chunks_per_s"] * (1 - tolerance):
+            problems.append(
+                f"{name}: {now['chunks_per_s']:.1f} chunks/s vs baseline {before['chunks_per_s']:.1f} "
+                f"({now['chunks_per_s'] / before['chunks_per_s'] - 1:+.0%})"
+            )
+        if now["peak_rss_mb"] > before["peak_rss_mb"] * (1 + tolerance):
+            problems.append(
+                f"{name}: peak RSS {now['peak_rss_mb']:.0f} MB vs baseline {before['peak_rss_mb']:.0f} MB "
+                f"({now['peak_rss_mb'] / before['peak_rss_mb'] - 1:+.0%})"
+            )
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite with baseline regression checks.")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--scale", type=float, default=1.0, help="input size multiplier")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark, best is kept")
+    parser.add_argument("--out", default=RESULTS_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to --baseline")
+    parser.add_argument("--check", action="store_true", help="exit 1 on a regression vs --baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--timeout", type=float, default=TIMEOUT, help="seconds per benchmark before it counts as failed")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'benchmark':24s} {'seconds':>8s} {'chunks/s':>10s} {'MB/s':>8s} {'peak RSS':>9s}")
+    for name in args.only:
+        result = run_benchmark(name, args.scale, args.repeat, args.timeout)
+        results[name] = result
+        if "error" in result:
+            print(f"{name:24s} !! {result['error']}")
+        else:
+            print(f"{name:24s} {result['seconds']:8.3f} {result['chunks_per_s']:10.1f} "
+                  f"{result['mb_per_s']:8.2f} {result['peak_rss_mb']:7.0f}MB")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "machine": platform.platform(),
+        "cpus": os.cpu_count(),
+        "scale": args.scale,
+        "benchmarks": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.out}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline {args.baseline}")
+
+    if args.check:
+        if not os.path.exists(args.baseline):
+            raise SystemExit(f"no baseline at {args.baseline}, run with --save-baseline first")
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("scale") != args.scale:
+            raise SystemExit(f"baseline was recorded at --scale {baseline.get('scale')}, not {args.scale}")
+        problems = compare(results, baseline, args.tolerance)
+        for problem in problems:
+            print(f"   !! regression: {problem}")
+        if problems:
+            raise SystemExit(1)
+        print(f"No regressions vs {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,44 @@
+import argparse
 import os
-import glob
-import pandas as pd
+
+import chunk_store
 
 CHUNK_DIR = "data/processed_txt_2024"
+STORE_DIR = chunk_store.STORE_DIR
 OUT_CSV = "data/comp_reports_compiled.csv"
 
-rows = []
-
-for path in glob.glob(os.path.join(CHUNK_DIR, "*_chunks.txt")):
-    base = os.path.basename(path)
-    # Expecting something like TICKER_2024_chunks.txt
-    name, _ = os.path.splitext(base)
-    parts = name.split("_")
-    ticker = parts[0]
-    year = parts[1]
-
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            text = line.rstrip("\n")
-            if not text:
-                continue  # skip empty lines if there are blank separators
-
-            rows.append({
-                "company": ticker,   # same as before, ticker as company placeholder
-                "ticker": ticker,
-                "year": year,
-                "text": text,
-            })
-
-df = pd.DataFrame(rows)
-df.to_csv(OUT_CSV, index=False)
-print(f"Wrote {len(df)} rows to {OUT_CSV}")
+
+def write_csv(store_dir, out_csv):
+    """The old comp_reports_compiled.csv layout, streamed from the store batch by batch."""
+    tmp_path = out_csv + ".tmp"
+    n_rows = 0
+    header = True
+    for batch in chunk_store.iter_chunk_batches(store_dir, columns=["company", "ticker", "year", "text"]):
+        df = batch.to_pandas()
+        df.to_csv(tmp_path, mode="w" if header else "a", header=header, index=False)
+        header = False
+        n_rows += len(df)
+    if header:
+        open(tmp_path, "w").close()
+    os.replace(tmp_path, out_csv)
+    return n_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the partitioned Parquet chunk store from *_chunks.txt files.")
+    parser.add_argument("--chunk-dir", default=CHUNK_DIR)
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--csv", nargs="?", const=OUT_CSV, default=None,
+                        help=f"also write the old single CSV (default path {OUT_CSV})")
+    args = parser.parse_args()
+
+    total = chunk_store.build_from_txt(args.chunk_dir, args.store)
+    print(f"Wrote {total} rows to {args.store}")
+
+    if args.csv:
+        n_rows = write_csv(args.store, args.csv)
+        print(f"Wrote {n_rows} rows to {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
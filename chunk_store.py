@@ -0,0 +1,165 @@
+"""
+Parquet chunk store, partitioned by year and ticker.
+
+    data/chunks/year=2024/ticker=XOM/part-0.parquet
+
+One row per chunk: chunk_id, company, seq, text, text_hash (plus the year
+and ticker partition columns). chunk_id is "{ticker}_{year}_{seq:06d}",
+where seq is the line number of the chunk in its *_chunks.txt, so ids are
+the same every time the store is rebuilt from the same files. text_hash is
+inference_cache.text_hash of the text.
+
+Files are written one company at a time in fixed-size record batches, so
+building the store takes the same memory for 40 or 40,000 reports. Readers
+only touch the partitions and columns they ask for:
+
+    df = read_chunks(columns=["ticker", "text"], tickers=["XOM", "CVX"])
+    for batch in iter_chunk_batches(columns=["chunk_id", "text"]):
+        ...
+"""
+
+import glob
+import os
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+from funcs import read_chunk_lines
+from inference_cache import text_hash
+
+STORE_DIR = "data/chunks"
+BATCH_ROWS = 10_000
+
+FILE_SCHEMA = pa.schema([
+    ("chunk_id", pa.string()),
+    ("company", pa.string()),
+    ("seq", pa.int32()),
+    ("text", pa.string()),
+    ("text_hash", pa.binary(16)),
+])
+PARTITIONING = ds.partitioning(pa.schema([("year", pa.int32()), ("ticker", pa.string())]), flavor="hive")
+
+
+def chunk_id(ticker, year, seq):
+    return f"{ticker}_{year}_{seq:06d}"
+
+
+def partition_dir(store_dir, ticker, year):
+    return os.path.join(store_dir, f"year={int(year)}", f"ticker={ticker}")
+
+
+# ----------------------------------
+# Writing
+# ----------------------------------
+
+def iter_chunk_lines(path):
+    """(seq, text) for every non-empty line of a *_chunks.txt file; seq is its line index."""
+    for seq, text in enumerate(read_chunk_lines(path)):
+        if text:
+            yield seq, text
+
+
+def write_company(store_dir, ticker, year, lines, company=None, batch_rows=BATCH_ROWS):
+    """
+    Write one company/year partition from an iterable of (seq, text), replacing
+    any previous partition. Returns the number of rows written.
+    """
+    company = company or ticker
+    out_dir = partition_dir(store_dir, ticker, year)
+    os.makedirs(out_dir, exist_ok=True)
+    tmp_path = os.path.join(out_dir, "part-0.parquet.tmp")
+
+    n_rows = 0
+    batch = []
+
+    def flush(writer):
+        writer.write_batch(pa.RecordBatch.from_pydict({
+            "chunk_id": [chunk_id(ticker, year, seq) for seq, _ in batch],
+            "company": [company] * len(batch),
+            "seq": [seq for seq, _ in batch],
+            "text": [text for _, text in batch],
+            "text_hash": [text_hash(text) for _, text in batch],
+        }, schema=FILE_SCHEMA))
+
+    with pq.ParquetWriter(tmp_path, FILE_SCHEMA, compression="zstd") as writer:
+        for seq, text in lines:
+            batch.append((seq, text))
+            if len(batch) >= batch_rows:
+                flush(writer)
+                n_rows += len(batch)
+                batch = []
+        if batch:
+            flush(writer)
+            n_rows += len(batch)
+
+    # drop stale parts from an older layout before the new file becomes visible
+    for old in glob.glob(os.path.join(out_dir, "*.parquet")):
+        os.remove(old)
+    os.replace(tmp_path, os.path.join(out_dir, "part-0.parquet"))
+    return n_rows
+
+
+def build_from_txt(chunk_dir, store_dir=STORE_DIR, batch_rows=BATCH_ROWS):
+    """Write every {TICKER}_{YEAR}_chunks.txt in chunk_dir to the store. Returns total rows."""
+    total = 0
+    for path in sorted(glob.glob(os.path.join(chunk_dir, "*_chunks.txt"))):
+        # Expecting something like TICKER_2024_chunks.txt
+        name, _ = os.path.splitext(os.path.basename(path))
+        parts = name.split("_")
+        ticker, year = parts[0], int(parts[1])
+
+        n = write_company(store_dir, ticker, year, iter_chunk_lines(path), batch_rows=batch_rows)
+        print(f"{ticker} {year}: {n} chunks")
+        total += n
+    return total
+
+
+# ----------------------------------
+# Reading
+# ----------------------------------
+
+def open_store(store_dir=STORE_DIR):
+    """pyarrow Dataset over the store (files are memory-mapped, nothing is read yet)."""
+    return ds.dataset(
+        store_dir,
+        format="parquet",
+        partitioning=PARTITIONING,
+        filesystem=pafs.LocalFileSystem(use_mmap=True),
+    )
+
+
+def _filter(tickers=None, years=None):
+    expr = None
+    if tickers is not None:
+        expr = ds.field("ticker").isin(list(tickers))
+    if years is not None:
+        year_expr = ds.field("year").isin([int(y) for y in years])
+        expr = year_expr if expr is None else expr & year_expr
+    return expr
+
+
+def read_table(store_dir=STORE_DIR, columns=None, tickers=None, years=None):
+    """Arrow table with only `columns` (default all) of the selected partitions."""
+    return open_store(store_dir).to_table(columns=columns, filter=_filter(tickers, years))
+
+
+def read_chunks(store_dir=STORE_DIR, columns=None, tickers=None, years=None):
+    """read_table as a pandas DataFrame, rows in (year, ticker, seq) order."""
+    df = read_table(store_dir, columns, tickers, years).to_pandas()
+    order = [c for c in ("year", "ticker", "seq") if c in df.columns]
+    if order:
+        df = df.sort_values(order, kind="stable").reset_index(drop=True)
+    return df
+
+
+def iter_chunk_batches(store_dir=STORE_DIR, columns=None, tickers=None, years=None, batch_size=BATCH_ROWS):
+    """Stream record batches, for stages that never need the whole corpus in memory."""
+    yield from open_store(store_dir).to_batches(columns=columns, filter=_filter(tickers, years), batch_size=batch_size)
+
+
+def iter_texts(ticker, year, store_dir=STORE_DIR):
+    """Chunk texts of one report in file order (what main.py reads from {ticker}_{year}_chunks.txt)."""
+    table = read_table(store_dir, columns=["seq", "text"], tickers=[ticker], years=[year]).sort_by("seq")
+    return table.column("text").to_pylist()
@@ -1,40 +1,46 @@
 import os
 import io
+import threading
+import time
 import requests
-import fitz  # PyMuPDF
-from bs4 import BeautifulSoup
 import pandas as pd
 import funcs
+import html_extract
+import instrument
+import pdf_extract
+from raw_store import RAW_DIR, RawStore
 
 # Config
 
 LINKS_CSV = "data/report_links_2024.csv"
 OUT_DIR = "data/processed_txt_2024"
-os.makedirs(OUT_DIR, exist_ok=True)
+# None keeps the 500-character chunks; set to pack chunks by token count (see funcs.iter_chunks)
+CHUNK_MAX_TOKENS = None
+CHUNK_OVERLAP = 0
+# token budgets are counted with the tokenizer the detector reads the chunks with
+CHUNK_TOKENIZER = "climatebert/distilroberta-base-climate-detector"
 
-# Text extractors (no local PDF saving)
+_local = threading.local()
 
 
-def extract_pdf_text_from_bytes(pdf_bytes: bytes) -> str:
-    """
-    Extract text from a PDF in memory using PyMuPDF (fitz),
-    which is generally more robust than pdfplumber/pdfminer for complex reports.
-    """
-    text_parts = []
-    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
-        for page in doc:
-            # "text" gives plain text; you could use "blocks" or "dict" if you want structure
-            text_parts.append(page.get_text("text") or "")
-    return "\n".join(text_parts)
+def chunk_tokenizer():
+    """CHUNK_TOKENIZER, one per thread: a fast tokenizer can't be called from two threads at once."""
+    if getattr(_local, "tokenizer", None) is None:
+        from transformers import AutoTokenizer
+
+        _local.tokenizer = AutoTokenizer.from_pretrained(CHUNK_TOKENIZER)
+    return _local.tokenizer
+
+# Text extractors (no local PDF saving)
 
 
 def extract_html_text_from_bytes(html_bytes: bytes) -> str:
-    soup = BeautifulSoup(html_bytes, "html.parser")
-    # Remove obvious junk
-    for tag in soup(["script", "style", "nav", "footer", "header", "form"]):
-        tag.decompose()
-    text = soup.get_text(separator="\n")
-    return text
+    """
+    Main text of an HTML page, menus / cookie banners / link lists dropped.
+    Backend and boilerplate stripping are set by HTML_EXTRACTOR and
+    HTML_BOILERPLATE (see html_extract.py).
+    """
+    return html_extract.extract(html_bytes)
 
 
 def guess_format(url: str, fmt: str | None) -> str:
@@ -56,15 +62,6 @@ def safe_filename(s: str) -> str:
     return "".join(c for c in s if c.isalnum() or c in ("_", "-"))
 
 
-# ---------- Load report links ----------
-
-links = pd.read_csv(LINKS_CSV)
-# expected columns: ticker, company_name, year, report_url, format (optional)
-
-print("Total rows in links file:", len(links))
-
-# ---------- Main loop: fetch → extract → chunk → write txt ----------
-
 # Browser-like headers to reduce 403s
 BASE_HEADERS = {
     "User-Agent": (
@@ -76,60 +73,199 @@ BASE_HEADERS = {
     "Accept-Language": "en-US,en;q=0.9",
 }
 
-for idx, row in links.iterrows():
-    ticker = str(row["ticker"]).strip()
-    year = int(row.get("year", 2024))
-    url = row["report_url"]
 
-    if pd.isna(url) or not str(url).strip():
-        print(f"[{idx}] {ticker}: missing URL, skipping")
-        continue
+def plan_downloads(links, out_dir=OUT_DIR, refresh=False):
+    """
+    Yield one job dict per row that still needs fetching.
+    Rows without a URL, or (unless refresh) with an existing
+    {ticker}_{year}_chunks.txt, are skipped.
+    """
+    for idx, row in links.iterrows():
+        ticker = str(row["ticker"]).strip()
+        year = int(row.get("year", 2024))
+        url = row["report_url"]
+
+        if pd.isna(url) or not str(url).strip():
+            print(f"[{idx}] {ticker}: missing URL, skipping")
+            continue
+
+        fmt = guess_format(url, row.get("format"))
 
-    fmt = guess_format(url, row.get("format"))
+        out_path = os.path.join(out_dir, f"{safe_filename(ticker)}_{year}_chunks.txt")
+        if os.path.exists(out_path) and not refresh:
+            print(f"[{idx}] {ticker}: already processed -> {out_path}")
+            continue
 
-    out_path = os.path.join(OUT_DIR, f"{safe_filename(ticker)}_{year}_chunks.txt")
-    if os.path.exists(out_path):
-        print(f"[{idx}] {ticker}: already processed -> {out_path}")
-        continue
+        yield {"idx": idx, "ticker": ticker, "year": year, "url": url, "fmt": fmt, "out_path": out_path}
 
-    print(f"[{idx}] Fetching {ticker} {year} ({fmt}) from {url}")
 
-    try:
-        resp = requests.get(url, headers=BASE_HEADERS, timeout=45)
-        resp.raise_for_status()
-    except Exception as e:
-        print(f"   !! Failed to download {ticker}: {e}")
-        continue
+def iter_text_pieces(content: bytes, fmt: str, url: str):
+    """
+    Text of a downloaded report, as pieces to be joined with "\n": one per
+    PDF page (extracted in parallel, see pdf_extract.py), or the whole HTML
+    text. Formats other than "html" are read as PDF if the URL says so.
+    """
+    if fmt == "pdf" or (fmt != "html" and url.lower().endswith(".pdf")):
+        return pdf_extract.iter_pdf_pages(content)
+    return [extract_html_text_from_bytes(content)]
+
 
+def report_name(job):
+    return f"{job['ticker']}_{job['year']}"
+
+
+def process_download(job, content: bytes):
+    """extract -> chunk -> write txt for one downloaded report. Returns #chunks written."""
+    with instrument.report(report_name(job)):
+        return _process_download(job, content)
+
+
+def _process_download(job, content):
+    ticker = job["ticker"]
+    out_path = job["out_path"]
+    tmp_path = out_path + ".tmp"
+
+    # pages are chunked as they are extracted and chunks written as they are
+    # produced; the .tmp file only replaces out_path once the report is complete
+    n_chunks = 0
     try:
-        if fmt == "pdf":
-            raw_text = extract_pdf_text_from_bytes(resp.content)
-        elif fmt == "html":
-            raw_text = extract_html_text_from_bytes(resp.content)
-        else:
-            # fallback guess
-            if url.lower().endswith(".pdf"):
-                raw_text = extract_pdf_text_from_bytes(resp.content)
-            else:
-                raw_text = extract_html_text_from_bytes(resp.content)
+        # "process" covers extract + chunk + write; "extract" only the time spent waiting for pages
+        with instrument.span("process", bytes=len(content)) as s, open(tmp_path, "w", encoding="utf-8") as f:
+            pieces = instrument.timed_iter(iter_text_pieces(content, job["fmt"], job["url"]), "extract")
+            # Chunk into your training format
+            tokenizer = chunk_tokenizer() if CHUNK_MAX_TOKENS else None
+            for line in funcs.iter_chunks(pieces, sep="\n", width=500, max_tokens=CHUNK_MAX_TOKENS,
+                                          tokenizer=tokenizer, overlap=CHUNK_OVERLAP):
+                f.write(line + "\n")
+                n_chunks += 1
+            s.add(items=n_chunks)
     except Exception as e:
         print(f"   !! Failed to extract text for {ticker}: {e}")
-        continue
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return 0
 
-    if not raw_text or not raw_text.strip():
+    if not n_chunks:
         print(f"   !! Empty text for {ticker}, skipping write")
-        continue
+        os.remove(tmp_path)
+        return 0
+
+    os.replace(tmp_path, out_path)
+    print(f"   -> Wrote {n_chunks} chunks to {out_path}")
+    return n_chunks
+
+
+def fetch_report(job, store=None, timeout=45):
+    """
+    GET one report. With a RawStore the request is conditional on the stored
+    copy; a 304 is served from disk and a 200 is saved to the store.
+    Returns the body bytes, or None if the download failed.
+    """
+    url = job["url"]
+    headers = {**BASE_HEADERS, **store.conditional_headers(url)} if store else BASE_HEADERS
+    try:
+        start = time.perf_counter()
+        resp = requests.get(url, headers=headers, timeout=timeout)
+        instrument.record("download_not_modified" if resp.status_code == 304 else "download",
+                          time.perf_counter() - start, items=1, bytes=len(resp.content), report=report_name(job))
+        if store and resp.status_code == 304:
+            print(f"   -> {job['ticker']}: not modified, using stored copy")
+            return store.not_modified(url)
+        resp.raise_for_status()
+    except Exception as e:
+        print(f"   !! Failed to download {job['ticker']}: {e}")
+        return None
+
+    if store:
+        store.save_response(url, resp.content, resp.headers)
+    return resp.content
+
+
+def iter_downloads(jobs, store=None, timeout=45):
+    """
+    Serial download loop with one download of lookahead: the next report is
+    fetched in a background thread while the current one is extracted.
+    Yields (job, content) for each successful download.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def fetch(job):
+        print(f"[{job['idx']}] Fetching {job['ticker']} {job['year']} ({job['fmt']}) from {job['url']}")
+        return fetch_report(job, store, timeout)
+
+    with ThreadPoolExecutor(max_workers=1) as downloader:
+        pending = downloader.submit(fetch, jobs[0]) if jobs else None
+        for i, job in enumerate(jobs):
+            content = pending.result()
+            pending = downloader.submit(fetch, jobs[i + 1]) if i + 1 < len(jobs) else None
+            if content is not None:
+                yield job, content
+
+
+def rechunk_stored(jobs, store, workers=4):
+    """
+    Re-extract and re-chunk reports from the raw store only (no network).
+    Several reports are in flight at once so the pdf_extract pool stays busy.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def rechunk(job):
+        content = store.load_url(job["url"])
+        if content is None:
+            print(f"[{job['idx']}] {job['ticker']}: not in {store.root}, skipping")
+            return 0
+        print(f"[{job['idx']}] Re-chunking {job['ticker']} {job['year']} from {store.root}")
+        return process_download(job, content)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(rechunk, jobs))
+
+
+# ---------- Main loop: fetch → extract → chunk → write txt ----------
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Download reports and write per-company chunk files.")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="concurrent fetch with per-host limits (see fetch_async.py)")
+    parser.add_argument("--concurrency", type=int, default=16, help="max open connections (with --async)")
+    parser.add_argument("--per-host", type=int, default=2, help="max concurrent requests per host (with --async)")
+    parser.add_argument("--raw-dir", default=RAW_DIR, help="local store of downloaded reports")
+    parser.add_argument("--no-store", action="store_true", help="don't keep downloaded bytes (old behaviour)")
+    parser.add_argument("--refresh", action="store_true",
+                        help="re-fetch rows that already have chunks (conditional GET against the store)")
+    parser.add_argument("--rechunk", action="store_true",
+                        help="rewrite every chunk file from the stored raw reports, without downloading")
+    args = parser.parse_args()
+
+    os.makedirs(OUT_DIR, exist_ok=True)
+
+    links = pd.read_csv(LINKS_CSV)
+    # expected columns: ticker, company_name, year, report_url, format (optional)
+
+    print("Total rows in links file:", len(links))
+
+    store = None if args.no_store else RawStore(args.raw_dir)
+    jobs = list(plan_downloads(links, refresh=args.refresh or args.rechunk))
+
+    if args.rechunk:
+        if store is None:
+            parser.error("--rechunk needs the raw store")
+        total = rechunk_stored(jobs, store)
+        print(f"Re-chunked {total} chunks from {args.raw_dir}")
+        return
+
+    if args.use_async:
+        import fetch_async
 
-    # Chunk into your training format
-    chunks = funcs.split_and_quote(raw_text, width=500)
+        fetch_async.run(jobs, process_download, concurrency=args.concurrency, per_host=args.per_host, store=store)
+        return
 
-    if not chunks:
-        print(f"   !! No chunks produced for {ticker}, skipping write")
-        continue
+    for job, content in iter_downloads(jobs, store):
+        process_download(job, content)
 
-    # Write per-company TXT with quoted lines
-    with open(out_path, "w", encoding="utf-8") as f:
-        for line in chunks:
-            f.write(line + "\n")
 
-    print(f"   -> Wrote {len(chunks)} chunks to {out_path}")
+if __name__ == "__main__":
+    main()
+    instrument.finish()
@@ -0,0 +1,237 @@
+"""
+Near-duplicate chunks (forward-looking-statement disclaimers, footers,
+methodology boilerplate) within and across reports, so each is scored once.
+
+    python dedup.py build                       # data/processed_txt_2024 -> data/dedup/
+    python dedup.py build --threshold 0.9 --top 20
+
+Chunks are MinHash-ed over word 3-shingles and bucketed with banded LSH.
+Clustering is leader-based in file order: a chunk joins the most similar
+existing representative whose estimated Jaccard similarity is >= threshold,
+otherwise it becomes a representative itself. So every member is close to
+the chunk it is scored as, and clusters do not chain.
+
+Output in data/dedup/:
+    fanout.parquet   one row per chunk: file, line, text_hash, cluster
+    reps.parquet     one row per cluster: cluster, file, line, text
+
+main.py scores each chunk as its cluster's representative when DEDUP
+points at the directory, and fans the outputs back out to every member, so
+per-company counts in results.csv still cover every chunk. A chunk whose
+text no longer matches the map (re-chunked file) is scored as itself.
+"""
+
+import argparse
+import glob
+import os
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from funcs import read_chunk_lines, unquote_related
+from inference_cache import text_hash
+
+DEDUP_DIR = "data/dedup"
+CHUNK_DIR = "data/processed_txt_2024"
+OUTPUTS_DIR = "data/model_outputs"
+
+NUM_PERM = 128
+BANDS = 16  # 16 bands x 8 rows: pairs above ~0.7 Jaccard almost always share a bucket
+SHINGLE = 3
+THRESHOLD = 0.8
+BATCH_DOCS = 1000
+N_HEADS = 5
+
+# a * x + b mod a Mersenne prime; a, b, x < 2**31 so a * x fits in uint64
+_PRIME = np.uint64((1 << 31) - 1)
+_TOKEN = re.compile(r"\w+")
+
+
+# ----------------------------------
+# MinHash + LSH
+# ----------------------------------
+
+def shingles(text, k=SHINGLE):
+    tokens = _TOKEN.findall(text.lower())
+    if len(tokens) < k:
+        grams = [" ".join(tokens)] if tokens else []
+    else:
+        grams = {" ".join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64)
+
+
+class MinHasher:
+    def __init__(self, num_perm=NUM_PERM, seed=0):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, int(_PRIME), num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, int(_PRIME), num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signatures(self, texts):
+        """(n, num_perm) uint32 signatures; rows of texts without words are all 0xFFFFFFFF."""
+        sigs = np.full((len(texts), self.num_perm), 0xFFFFFFFF, dtype=np.uint32)
+        for start in range(0, len(texts), BATCH_DOCS):
+            parts = [shingles(text) for text in texts[start:start + BATCH_DOCS]]
+            rows = [i for i, part in enumerate(parts) if len(part)]
+            if not rows:
+                continue
+            x = np.concatenate([parts[i] for i in rows]) % _PRIME
+            offsets = np.cumsum([0] + [len(parts[i]) for i in rows[:-1]])
+            hashed = (self.a[:, None] * x[None, :] + self.b[:, None]) % _PRIME
+            sigs[start + np.array(rows)] = np.minimum.reduceat(hashed, offsets, axis=1).T
+        return sigs
+
+
+def cluster(sigs, threshold=THRESHOLD, bands=BANDS):
+    """
+    Leader clustering over LSH candidates. Returns rep[i], the index of the
+    representative of chunk i (rep[i] == i for representatives).
+    """
+    n, num_perm = sigs.shape
+    rows = num_perm // bands
+    buckets = [defaultdict(list) for _ in range(bands)]
+    rep = np.arange(n)
+    empty = (sigs == 0xFFFFFFFF).all(axis=1)
+
+    for i in range(n):
+        if empty[i]:
+            continue
+        keys = [sigs[i, band * rows:(band + 1) * rows].tobytes() for band in range(bands)]
+        candidates = {j for band, key in enumerate(keys) for j in buckets[band].get(key, ())}
+        if candidates:
+            candidates = np.fromiter(candidates, dtype=np.int64)
+            similarity = (sigs[candidates] == sigs[i]).mean(axis=1)
+            best = int(np.argmax(similarity))
+            if similarity[best] >= threshold:
+                rep[i] = candidates[best]
+                continue
+        for band, key in enumerate(keys):
+            buckets[band][key].append(i)
+    return rep
+
+
+# ----------------------------------
+# Building the fanout map
+# ----------------------------------
+
+def load_chunks(chunk_dir=CHUNK_DIR):
+    """Every line of every chunk file, as main.score_file reads it: file, line, text."""
+    rows = []
+    for path in sorted(glob.glob(os.path.join(chunk_dir, "*_chunks.txt"))):
+        for line_no, line in enumerate(read_chunk_lines(path)):
+            rows.append((os.path.basename(path), line_no, unquote_related(line)))
+    return pd.DataFrame(rows, columns=["file", "line", "text"])
+
+
+def build(chunk_dir=CHUNK_DIR, out_dir=DEDUP_DIR, threshold=THRESHOLD):
+    chunks = load_chunks(chunk_dir)
+    rep = cluster(MinHasher().signatures(chunks["text"].tolist()), threshold)
+
+    reps = np.unique(rep)
+    cluster_of = np.searchsorted(reps, rep)
+    fanout = pd.DataFrame({
+        "file": chunks["file"],
+        "line": chunks["line"],
+        "text_hash": [text_hash(text) for text in chunks["text"]],
+        "cluster": cluster_of,
+    })
+    rep_rows = chunks.iloc[reps].reset_index(drop=True)
+    rep_rows.insert(0, "cluster", np.arange(len(reps)))
+
+    os.makedirs(out_dir, exist_ok=True)
+    fanout.to_parquet(os.path.join(out_dir, "fanout.parquet"), index=False)
+    rep_rows.to_parquet(os.path.join(out_dir, "reps.parquet"), index=False)
+    return chunks, fanout, rep_rows
+
+
+def saved_passes(chunks, fanout, outputs_dir=OUTPUTS_DIR):
+    """
+    Forward passes saved by scoring each cluster once. The detector runs on
+    every chunk, so it saves one pass per duplicate. The four downstream
+    heads only run on detector-kept chunks, estimated from the *_related.txt
+    files in `outputs_dir` (0 where a report has none).
+    """
+    kept = set()
+    for path in glob.glob(os.path.join(outputs_dir, "*_chunks_related.txt")):
+        with open(path, encoding="utf-8") as f:
+            kept.update(unquote_related(line) for line in f.read().splitlines())
+
+    related = chunks["text"].isin(kept).to_numpy()
+    n = len(fanout)
+    n_clusters = fanout["cluster"].nunique()
+    related_clusters = fanout.loc[related, "cluster"].nunique()
+    return {
+        "chunks": n,
+        "clusters": n_clusters,
+        "detector_saved": n - n_clusters,
+        "downstream_saved": (int(related.sum()) - related_clusters) * (N_HEADS - 1),
+        "total_passes": n + int(related.sum()) * (N_HEADS - 1),
+    }
+
+
+# ----------------------------------
+# Using the map
+# ----------------------------------
+
+class Fanout:
+    """Looks up the representative text to score for each chunk of a file."""
+
+    def __init__(self, dedup_dir=DEDUP_DIR):
+        fanout = pd.read_parquet(os.path.join(dedup_dir, "fanout.parquet"))
+        reps = pd.read_parquet(os.path.join(dedup_dir, "reps.parquet"), columns=["cluster", "text"])
+        self._rep_text = reps.set_index("cluster")["text"]
+        self._files = {file: rows for file, rows in fanout.groupby("file", sort=False)}
+
+    def representatives(self, dataset_name, texts):
+        """Text to score for each of `texts` (the lines of `dataset_name`)."""
+        rows = self._files.get(os.path.basename(dataset_name))
+        if rows is None:
+            return list(texts)
+
+        by_line = dict(zip(rows["line"], zip(rows["text_hash"], rows["cluster"])))
+        scored = []
+        for line_no, text in enumerate(texts):
+            entry = by_line.get(line_no)
+            # a stale map (file re-chunked since dedup.py build) must not swap texts
+            scored.append(self._rep_text[entry[1]] if entry and entry[0] == text_hash(text) else text)
+        return scored
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Near-duplicate chunk clusters for scoring each once.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    build_cmd = sub.add_parser("build", help="cluster every chunk file and write the fanout map")
+    build_cmd.add_argument("--chunk-dir", default=CHUNK_DIR)
+    build_cmd.add_argument("--out-dir", default=DEDUP_DIR)
+    build_cmd.add_argument("--outputs-dir", default=OUTPUTS_DIR, help="detector output used to estimate downstream savings")
+    build_cmd.add_argument("--threshold", type=float, default=THRESHOLD, help="min estimated Jaccard similarity")
+    build_cmd.add_argument("--top", type=int, default=10, help="print the largest clusters")
+    args = parser.parse_args()
+
+    chunks, fanout, reps = build(args.chunk_dir, args.out_dir, args.threshold)
+    stats = saved_passes(chunks, fanout, args.outputs_dir)
+
+    files_per_cluster = fanout.groupby("cluster")["file"].nunique()
+    sizes = fanout["cluster"].value_counts()
+    cross = fanout["cluster"].map(files_per_cluster) > 1
+
+    print(f"{stats['chunks']} chunks -> {stats['clusters']} clusters "
+          f"({stats['chunks'] - stats['clusters']} duplicates, {int(cross.sum())} chunks in cross-report clusters)")
+    saved = stats["detector_saved"] + stats["downstream_saved"]
+    print(f"Forward passes saved: {stats['detector_saved']} detector + {stats['downstream_saved']} downstream "
+          f"= {saved} of {stats['total_passes']} ({saved / max(stats['total_passes'], 1):.1%})")
+
+    print(f"\n{'size':>5s} {'reports':>7s}  representative")
+    for cluster_id, size in sizes.head(args.top).items():
+        if size < 2:
+            break
+        text = reps.at[cluster_id, "text"]
+        print(f"{size:5d} {files_per_cluster[cluster_id]:7d}  {text[:90]!r}")
+    print(f"\nWrote {args.out_dir}/fanout.parquet and reps.parquet")
+
+
+if __name__ == "__main__":
+    main()
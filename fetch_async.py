@@ -0,0 +1,173 @@
+"""
+Concurrent report fetcher for data_scrape.py.
+
+asyncio + aiohttp with one pooled keep-alive session, a global connection
+cap and a per-host concurrency limit, so one slow investor-relations site
+only holds its own slots. 403/429/5xx responses and network errors are
+retried with exponential backoff (Retry-After is honoured). Bodies are
+streamed in chunks, and each finished download is handed to a worker
+thread for extraction while the other downloads continue.
+
+    python data_scrape.py --async --concurrency 16 --per-host 2
+
+`fetch_all` only needs job dicts with a "url" key, so it can be pointed at
+a local stand-in HTTP server.
+"""
+
+import asyncio
+import random
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import aiohttp
+
+import instrument
+from data_scrape import BASE_HEADERS, report_name
+
+RETRY_STATUSES = {403, 429, 500, 502, 503, 504}
+STREAM_CHUNK = 64 * 1024
+
+
+def _report(job):
+    # fetch_all only requires a "url"; jobs from data_scrape also carry ticker/year
+    return report_name(job) if "ticker" in job and "year" in job else job["url"]
+
+
+class FetchStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.bytes = 0
+        self.ok = 0
+        self.failed = 0
+        self.retries = 0
+        self.not_modified = 0
+        self.latency = defaultdict(list)   # host -> seconds per successful download
+        self.ttfb = defaultdict(list)      # host -> seconds to response headers
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        rows = []
+        for host, values in sorted(self.latency.items()):
+            values = sorted(values)
+            rows.append({
+                "host": host,
+                "requests": len(values),
+                "p50_s": values[len(values) // 2],
+                "max_s": values[-1],
+                "ttfb_p50_s": sorted(self.ttfb[host])[len(self.ttfb[host]) // 2],
+            })
+        return {
+            "elapsed_s": elapsed,
+            "bytes": self.bytes,
+            "bytes_per_s": self.bytes / elapsed if elapsed > 0 else 0,
+            "ok": self.ok,
+            "failed": self.failed,
+            "retries": self.retries,
+            "not_modified": self.not_modified,
+            "hosts": rows,
+        }
+
+    def print_summary(self):
+        s = self.summary()
+        print(
+            f"\nFetched {s['ok']} ok / {s['not_modified']} not modified / {s['failed']} failed, {s['retries']} retries, "
+            f"{s['bytes'] / 1e6:.1f} MB in {s['elapsed_s']:.1f}s ({s['bytes_per_s'] / 1e6:.2f} MB/s)"
+        )
+        print(f"{'host':45s} {'reqs':>5s} {'p50_s':>7s} {'max_s':>7s} {'ttfb_s':>7s}")
+        for row in s["hosts"]:
+            print(f"{row['host']:45s} {row['requests']:5d} {row['p50_s']:7.2f} {row['max_s']:7.2f} {row['ttfb_p50_s']:7.2f}")
+
+
+def _retry_delay(attempt, resp=None, base=1.0, cap=60.0):
+    if resp is not None:
+        retry_after = resp.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), cap)
+    return min(base * 2 ** attempt, cap) * (0.5 + random.random() / 2)
+
+
+async def fetch_one(session, job, host_limits, stats, retries=4, timeout=45, headers=None, store=None):
+    """
+    Download one job's URL. Returns the body bytes, or None after the last failed attempt.
+    With a RawStore the GET is conditional and a 304 is answered from the stored copy.
+    """
+    url = job["url"]
+    host = urlsplit(url).netloc
+    headers = headers or BASE_HEADERS
+    if store is not None:
+        headers = {**headers, **store.conditional_headers(url)}
+
+    for attempt in range(retries + 1):
+        async with host_limits[host]:
+            start = time.perf_counter()
+            try:
+                async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                    stats.ttfb[host].append(time.perf_counter() - start)
+
+                    if resp.status == 304 and store is not None:
+                        stats.not_modified += 1
+                        instrument.record("download_not_modified", time.perf_counter() - start, items=1,
+                                          report=_report(job))
+                        return await asyncio.get_running_loop().run_in_executor(None, store.not_modified, url)
+                    if resp.status in RETRY_STATUSES and attempt < retries:
+                        delay = _retry_delay(attempt, resp)
+                    else:
+                        resp.raise_for_status()
+                        body = bytearray()
+                        async for chunk in resp.content.iter_chunked(STREAM_CHUNK):
+                            body.extend(chunk)
+                        stats.bytes += len(body)
+                        stats.latency[host].append(time.perf_counter() - start)
+                        instrument.record("download", time.perf_counter() - start, items=1, bytes=len(body),
+                                          report=_report(job))
+                        stats.ok += 1
+                        body = bytes(body)
+                        if store is not None:
+                            # disk + sqlite write off the event loop
+                            await asyncio.get_running_loop().run_in_executor(
+                                None, store.save_response, url, body, resp.headers
+                            )
+                        return body
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                permanent = isinstance(e, aiohttp.ClientResponseError) and e.status not in RETRY_STATUSES
+                if permanent or attempt >= retries:
+                    print(f"   !! Failed to download {job.get('ticker', url)}: {e}")
+                    stats.failed += 1
+                    return None
+                delay = _retry_delay(attempt)
+
+        # back off outside the host slot so other requests to the host can run
+        stats.retries += 1
+        await asyncio.sleep(delay)
+
+    stats.failed += 1
+    return None
+
+
+async def fetch_all(jobs, on_result, concurrency=16, per_host=2, retries=4, timeout=45, headers=None, store=None):
+    """
+    Fetch every job concurrently and call on_result(job, body) in a worker
+    thread for each successful download. Returns FetchStats.
+    """
+    stats = FetchStats()
+    host_limits = defaultdict(lambda: asyncio.Semaphore(per_host))
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=per_host, ttl_dns_cache=300)
+    loop = asyncio.get_running_loop()
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def handle(job):
+            print(f"[{job.get('idx', '')}] Fetching {job.get('ticker', '')} {job.get('year', '')} ({job.get('fmt', '')}) from {job['url']}")
+            body = await fetch_one(session, job, host_limits, stats, retries, timeout, headers, store)
+            if body is not None:
+                await loop.run_in_executor(None, on_result, job, body)
+
+        await asyncio.gather(*(handle(job) for job in jobs))
+
+    return stats
+
+
+def run(jobs, on_result, concurrency=16, per_host=2, retries=4, timeout=45, store=None):
+    stats = asyncio.run(fetch_all(jobs, on_result, concurrency, per_host, retries, timeout, store=store))
+    stats.print_summary()
+    return stats
@@ -13,20 +13,254 @@ def split_and_quote(text, width=500):
     if pd.isna(text):
         return []
 
-    # Clean out newlines + internal quotes
-    text = (
-        text.replace("\n", " ")
-            .replace("\r", " ")
-            .replace('"', '')
-    )
-
-    # Create 500-character chunks
-    chunks = textwrap.wrap(
-        text,
-        width=width,
-        break_long_words=True,
-        drop_whitespace=True
-    )
-
-    # Add exactly one " at start and end
-    return [f"\"{chunk}\"" for chunk in chunks]
\ No newline at end of file
+    return list(iter_split_and_quote([text], width=width))
+
+
+def quote_line(text):
+    """
+    Wrap a chunk in exactly one pair of quotes for writing to a txt file.
+    Chunks from split_and_quote already carry their quotes and are left as-is.
+    """
+    if len(text) >= 2 and text[0] == text[-1] == '"':
+        return text
+    return f"\"{text}\""
+
+
+def unquote_related(line):
+    """
+    Undo the double wrapping in older *_related.txt files (""chunk"" -> "chunk"),
+    so a chunk read back from disk is the same text the detector saw.
+    """
+    if len(line) >= 4 and line.startswith('""') and line.endswith('""'):
+        return line[1:-1]
+    return line
+
+
+def read_chunk_lines(path):
+    """
+    Every line of a *_chunks.txt file. Line i is chunk i everywhere (probs
+    npz rows, dedup fanout, chunk store seq), so all readers split lines
+    here: str.splitlines, the same splitting as datasets.load_dataset("text").
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def _clean(text):
+    # newlines -> spaces, no internal quotes (str.replace is much faster than str.translate here)
+    return text.replace("\n", " ").replace("\r", " ").replace('"', '')
+
+
+def iter_split_and_quote(pieces, width=500, sep=""):
+    """
+    Streaming split_and_quote: consumes an iterable of text pieces (e.g. PDF
+    pages) and yields exactly the chunks split_and_quote(sep.join(pieces))
+    would return, without ever building the joined text. Only the text after
+    the last finished line is held in memory.
+    """
+    wrapper = textwrap.TextWrapper(width=width, break_long_words=True, drop_whitespace=True)
+
+    state = {"line": None, "lines_started": False}
+    tail = ""             # text after the last whitespace run, not split yet
+    column = 0            # output column, for tab expansion across pieces
+    first = True
+
+    for piece in pieces:
+        text = (piece or "") if first else sep + (piece or "")
+        first = False
+
+        # same cleaning as split_and_quote, one page at a time instead of on the whole report
+        text = _clean(text)
+        # textwrap's whitespace munging, with tab stops continuing from the previous piece
+        if "\t" in text:
+            offset = column % wrapper.tabsize
+            text = ("x" * offset + text).expandtabs(wrapper.tabsize)[offset:]
+        column += len(text)
+        text = text.translate(wrapper.unicode_whitespace_trans)
+
+        chunks = wrapper._split(tail + text)
+
+        # chunks up to the last whitespace run that is followed by more text
+        # are final: whatever comes next cannot change how they split
+        cut = len(chunks) - 1
+        while cut > 0 and chunks[cut - 1][0] != " ":
+            cut -= 1
+        if cut <= 0:
+            tail = "".join(chunks)
+            continue
+
+        tail = "".join(chunks[cut:])
+        for line in _wrap_settled(wrapper, chunks[:cut], state, final=False):
+            yield f"\"{line}\""
+
+    for line in _wrap_settled(wrapper, wrapper._split(tail) if tail else [], state, final=True):
+        yield f"\"{line}\""
+
+
+def _wrap_settled(wrapper, chunks, state, final):
+    """
+    textwrap.TextWrapper._wrap_chunks (no indents, no max_lines) that can
+    stop when the available chunks run out. `state` carries the unfinished
+    line (None when the next chunk starts a new one) and whether any line
+    has been emitted yet.
+    """
+    width = wrapper.width
+    lines = []
+    chunks = list(reversed(chunks))
+    cur_line = state["line"]
+
+    while chunks or cur_line is not None:
+        if cur_line is None:
+            cur_line = []
+            # drop leading whitespace, except at the very start of the text
+            if chunks[-1].strip() == '' and state["lines_started"]:
+                del chunks[-1]
+        cur_len = sum(map(len, cur_line))
+
+        while chunks:
+            length = len(chunks[-1])
+            if cur_len + length <= width:
+                cur_line.append(chunks.pop())
+                cur_len += length
+            else:
+                break
+
+        if not chunks and not final:
+            # the line could still take chunks from the next piece
+            break
+
+        if chunks and len(chunks[-1]) > width:
+            wrapper._handle_long_word(chunks, cur_line, cur_len, width)
+
+        if cur_line and cur_line[-1].strip() == '':
+            del cur_line[-1]
+
+        if cur_line:
+            lines.append(''.join(cur_line))
+            state["lines_started"] = True
+        cur_line = None
+
+    state["line"] = cur_line
+    return lines
+
+
+# ----------------------------------
+# Token-budget chunking
+# ----------------------------------
+
+MAX_CHUNK_TOKENS = 510  # 512 minus <s> and </s>
+# room left for the quotes around every chunk line when packing; each line is
+# then re-tokenized on its own and trimmed if it still doesn't fit
+QUOTE_TOKENS = 2
+
+
+def tokenizer_spans(tokenizer):
+    """Span function counting real tokens with a fast (offset-mapping) Hugging Face tokenizer."""
+    def spans(text):
+        encoded = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+        return [span for span in encoded["offset_mapping"] if span[1] > span[0]]
+    return spans
+
+
+def tokenizer_count(tokenizer):
+    """Number of tokens `tokenizer` turns a line into, special tokens excluded."""
+    def count(line):
+        return len(tokenizer(line, add_special_tokens=False, verbose=False)["input_ids"])
+    return count
+
+
+def iter_chunks(pieces, sep="", width=500, max_tokens=None, tokenizer=None, overlap=0):
+    """
+    Chunk an iterable of text pieces (pages, lines, one big string) lazily.
+
+    With max_tokens=None this is iter_split_and_quote, i.e. byte-for-byte the
+    output of split_and_quote(sep.join(pieces), width). With max_tokens set,
+    chunks are packed so that the quoted line the model reads is at most
+    max_tokens tokens of `tokenizer` (required: no cheap approximation bounds
+    subword counts), cut at word boundaries, and consecutive chunks share
+    `overlap` tokens.
+    """
+    if max_tokens is None:
+        return iter_split_and_quote(pieces, width=width, sep=sep)
+    if tokenizer is None:
+        raise ValueError("max_tokens needs the tokenizer of the model that will read the chunks")
+    return _iter_token_chunks(pieces, sep, max_tokens, overlap, tokenizer_spans(tokenizer), tokenizer_count(tokenizer))
+
+
+def _iter_token_chunks(pieces, sep, max_tokens, overlap, spans_of, count_of):
+    if not 0 <= overlap < max_tokens - QUOTE_TOKENS:
+        raise ValueError(f"overlap must be in [0, max_tokens - {QUOTE_TOKENS}), got {overlap}")
+    budget = max_tokens - QUOTE_TOKENS
+
+    buf = ""
+    first = True
+    for piece in pieces:
+        text = (piece or "") if first else sep + (piece or "")
+        first = False
+        # same cleaning as split_and_quote, plus whitespace runs -> one space
+        text = _clean(text)
+        words = " ".join(text.split())
+        if buf and text[:1].isspace():
+            words = " " + words
+        buf += words + (" " if words and text[-1:].isspace() else "")
+
+        # only tokens that end before the last space are final, the last word
+        # may still continue in the next piece
+        settled = buf.rfind(" ")
+        spans = [span for span in spans_of(buf) if span[1] <= settled]
+        start = 0
+        while len(spans) - start > budget:
+            line, end = _fitted_line(buf, spans, start, _word_cut(buf, spans, start, start + budget),
+                                     max_tokens, count_of)
+            yield line
+            start = _overlap_start(buf, spans, start, end, overlap)
+        if start:
+            buf = buf[spans[start][0]:]
+
+    spans = spans_of(buf)
+    start = 0
+    while start < len(spans):
+        line, end = _fitted_line(buf, spans, start, _word_cut(buf, spans, start, min(start + budget, len(spans))),
+                                 max_tokens, count_of)
+        yield line
+        if end == len(spans):
+            break
+        start = _overlap_start(buf, spans, start, end, overlap)
+
+
+def _fitted_line(buf, spans, start, end, max_tokens, count_of):
+    """
+    The quoted line of tokens [start, end) and its end, cut shorter until the
+    line on its own is at most max_tokens tokens: a subword split can depend
+    on the text around it (the first word has no leading space, for one), so
+    counts taken in the running buffer are only an estimate.
+    """
+    while True:
+        line = f"\"{buf[spans[start][0]:spans[end - 1][1]]}\""
+        excess = count_of(line) - max_tokens
+        if excess <= 0 or end - start <= 1:
+            return line, end
+        end = _word_cut(buf, spans, start, max(end - excess, start + 1))
+
+
+def _word_start(buf, spans, i):
+    """True if token i begins a new whitespace-separated word."""
+    return i == 0 or buf[spans[i - 1][1]:spans[i][0] + 1].find(" ") != -1
+
+
+def _word_cut(buf, spans, start, end):
+    """Largest cut <= end that doesn't split a word (a hard cut at `end` if the word is huge)."""
+    if end == len(spans):
+        return end
+    for cut in range(end, start + (end - start) // 2, -1):
+        if _word_start(buf, spans, cut):
+            return cut
+    return end
+
+
+def _overlap_start(buf, spans, start, end, overlap):
+    """First token of the next chunk: `overlap` tokens before `end`, moved forward to a word start."""
+    nxt = max(end - overlap, start + 1)
+    while nxt < end and not _word_start(buf, spans, nxt):
+        nxt += 1
+    return nxt
@@ -0,0 +1,409 @@
+"""
+HTML report text extraction, with boilerplate stripping.
+
+    python html_extract.py bench page.html other.html      # MB/s per backend
+    python html_extract.py bench --raw-dir data/raw        # every HTML report in the raw store
+    python html_extract.py diff page.html --show           # what the fast extractor drops vs bs4
+    python html_extract.py diff --raw-dir data/raw --out html_diff.csv
+
+Backends (HTML_EXTRACTOR):
+    selectolax  Lexbor, a C parser (default)
+    lxml        libxml2, used when selectolax is not installed
+    bs4         BeautifulSoup's pure-Python html.parser: the old extractor, kept as the reference
+
+selectolax and lxml both turn the page into text blocks (one per paragraph,
+list item, table cell, heading, ...), skipping the same script/style/nav/
+footer/header/form subtrees the old extractor removed. With
+HTML_BOILERPLATE=1 (the default) blocks are then classified by text and
+link density, in the style of boilerpipe / jusText:
+
+    link-heavy blocks (menus, repeated link lists)        dropped
+    blocks of MIN_WORDS+ words with few links             kept
+    short blocks                                          kept only between kept blocks
+    headings                                              kept if a kept block follows
+
+and subtrees that are boilerplate by markup (cookie / consent banners,
+breadcrumbs, navbars, sidebars, hidden elements, ARIA navigation roles) are
+skipped outright. If no block qualifies (a page of captions, say) every block with
+few links is kept, so a report never comes out empty.
+"""
+
+import argparse
+import collections
+import glob
+import os
+import re
+import time
+
+BACKEND = os.environ.get("HTML_EXTRACTOR", "selectolax")
+STRIP_BOILERPLATE = os.environ.get("HTML_BOILERPLATE", "1") != "0"
+
+# what the old extractor decomposed
+JUNK_TAGS = {"script", "style", "nav", "footer", "header", "form"}
+# also skipped when stripping boilerplate
+BOILERPLATE_TAGS = {"head", "noscript", "template", "svg", "iframe", "aside", "button", "select", "dialog"}
+# id/class tokens that only ever name boilerplate. Generic words ("social",
+# "share", "menu", "modal") are left out: on ESG sites id="social" is the S
+# pillar and "share-of-renewables" is content; link density handles real menus.
+BOILERPLATE_NAMES = {
+    "cookie", "cookies", "consent", "gdpr", "breadcrumb", "breadcrumbs", "nav", "navbar", "navigation",
+    "megamenu", "sidebar", "newsletter", "skip",
+}
+BOILERPLATE_ROLES = {"navigation", "banner", "contentinfo", "menu", "menubar", "dialog", "alertdialog", "search"}
+
+BLOCK_TAGS = {
+    "address", "article", "blockquote", "body", "br", "caption", "dd", "details", "div", "dl", "dt",
+    "fieldset", "figcaption", "figure", "h1", "h2", "h3", "h4", "h5", "h6", "hr", "html", "li", "main",
+    "ol", "p", "pre", "section", "summary", "table", "tbody", "td", "tfoot", "th", "thead", "tr", "ul",
+}
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+
+MIN_WORDS = 15
+MAX_LINK_DENSITY = 0.33
+HEADING_DISTANCE = 3  # blocks after a heading searched for kept text
+
+Block = collections.namedtuple("Block", "text words link_words heading")
+
+_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([\w-]+)""", re.I)
+_NAME_PARTS = re.compile(r"[\s_-]+")
+
+
+def decode(html_bytes):
+    """Page text: BOM, then <meta charset>, then UTF-8, then cp1252."""
+    if html_bytes.startswith(b"\xef\xbb\xbf"):
+        return html_bytes[3:].decode("utf-8", errors="replace")
+    match = _CHARSET.search(html_bytes[:4096])
+    for encoding in ([match.group(1).decode("ascii")] if match else []) + ["utf-8"]:
+        try:
+            return html_bytes.decode(encoding)
+        except (LookupError, UnicodeDecodeError):
+            continue
+    return html_bytes.decode("cp1252", errors="replace")
+
+
+# ----------------------------------
+# Text blocks
+# ----------------------------------
+
+class _BlockBuilder:
+    """Collects text blocks from a parser walk: start(tag) / text(s) / end(tag)."""
+
+    def __init__(self, strip_boilerplate):
+        self.strip_boilerplate = strip_boilerplate
+        self.skip_tags = JUNK_TAGS | BOILERPLATE_TAGS if strip_boilerplate else JUNK_TAGS
+        self.blocks = []
+        self._parts = []
+        self._link_words = 0
+        self._links = 0
+        self._headings = 0
+
+    def skip(self, tag, attrs):
+        """True if the element and everything under it is left out."""
+        if tag in self.skip_tags:
+            return True
+        if not self.strip_boilerplate or not attrs:
+            return False
+        if "hidden" in attrs or attrs.get("aria-hidden") == "true":
+            return True
+        if (attrs.get("role") or "").lower() in BOILERPLATE_ROLES:
+            return True
+        names = f"{attrs.get('id') or ''} {attrs.get('class') or ''}".lower()
+        return any(part in BOILERPLATE_NAMES for part in _NAME_PARTS.split(names))
+
+    def start(self, tag):
+        if tag in BLOCK_TAGS:
+            self.flush()
+        if tag == "a":
+            self._links += 1
+        elif tag in HEADING_TAGS:
+            self._headings += 1
+
+    def end(self, tag):
+        if tag in BLOCK_TAGS:
+            self.flush()
+        if tag == "a":
+            self._links -= 1
+        elif tag in HEADING_TAGS:
+            self._headings -= 1
+
+    def text(self, s):
+        if s:
+            self._parts.append(s)
+            if self._links:
+                self._link_words += len(s.split())
+
+    def flush(self):
+        words = "".join(self._parts).split()
+        if words:
+            self.blocks.append(Block(" ".join(words), len(words), min(self._link_words, len(words)), self._headings > 0))
+        self._parts = []
+        self._link_words = 0
+
+
+def _selectolax_blocks(html, strip_boilerplate):
+    from selectolax.lexbor import LexborHTMLParser
+
+    builder = _BlockBuilder(strip_boilerplate)
+    # explicit stack: deeply nested pages would overflow a recursive walk
+    stack = [(LexborHTMLParser(html).root, False)]
+    while stack:
+        node, leaving = stack.pop()
+        if node is None:
+            continue
+        tag = node.tag
+        if leaving:
+            builder.end(tag)
+        elif tag == "-text":
+            builder.text(node.text_content)
+        elif tag[0] not in "-_#!" and not builder.skip(tag, node.attributes):
+            builder.start(tag)
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(list(node.iter(include_text=True))))
+    builder.flush()
+    return builder.blocks
+
+
+def _lxml_blocks(html, strip_boilerplate):
+    import lxml.html
+    from lxml import etree
+
+    builder = _BlockBuilder(strip_boilerplate)
+    try:
+        root = lxml.html.document_fromstring(html)
+    except etree.ParserError:  # empty document
+        return []
+    stack = [(root, False)]
+    while stack:
+        el, leaving = stack.pop()
+        if leaving:
+            builder.end(el.tag)
+            builder.text(el.tail)
+        elif not isinstance(el.tag, str):  # comment, processing instruction
+            builder.text(el.tail)
+        elif builder.skip(el.tag, el.attrib):
+            builder.text(el.tail)
+        else:
+            builder.start(el.tag)
+            builder.text(el.text)
+            stack.append((el, True))
+            stack.extend((child, False) for child in reversed(el))
+    builder.flush()
+    return builder.blocks
+
+
+_WALKERS = {"selectolax": _selectolax_blocks, "lxml": _lxml_blocks}
+
+
+def resolve_backend(backend=BACKEND):
+    """`backend`, or lxml if it is selectolax and selectolax is not installed."""
+    if backend not in (*_WALKERS, "bs4"):
+        raise ValueError(f"Unknown HTML_EXTRACTOR {backend!r}; expected one of {sorted([*_WALKERS, 'bs4'])}")
+    if backend == "selectolax":
+        try:
+            import selectolax.lexbor  # noqa: F401
+        except ImportError:
+            return "lxml"
+    return backend
+
+
+def text_blocks(html_bytes, backend=BACKEND, strip_boilerplate=STRIP_BOILERPLATE):
+    """Every text block of the page, in document order (before classification)."""
+    return _WALKERS[resolve_backend(backend)](decode(html_bytes), strip_boilerplate)
+
+
+# ----------------------------------
+# Boilerplate classification
+# ----------------------------------
+
+def link_density(block):
+    return block.link_words / block.words
+
+
+def classify_blocks(blocks, min_words=MIN_WORDS, max_link_density=MAX_LINK_DENSITY):
+    """Boolean mask of the blocks that are main content."""
+    # True = content, False = boilerplate, None = short: decided by its neighbours
+    labels = []
+    for block in blocks:
+        if link_density(block) > max_link_density:
+            labels.append(False)
+        elif block.words >= min_words:
+            labels.append(True)
+        else:
+            labels.append(None)
+
+    if not any(labels):
+        return [link_density(block) <= max_link_density for block in blocks]
+
+    # nearest decided label on each side of every block
+    before, last = [], None
+    for label in labels:
+        before.append(last)
+        if label is not None:
+            last = label
+    after, last = [None] * len(labels), None
+    for i in range(len(labels) - 1, -1, -1):
+        after[i] = last
+        if labels[i] is not None:
+            last = labels[i]
+
+    keep = []
+    for i, (block, label) in enumerate(zip(blocks, labels)):
+        if label is not None:
+            keep.append(label)
+        elif block.heading:
+            keep.append(any(labels[j] for j in range(i + 1, min(i + 1 + HEADING_DISTANCE, len(labels)))))
+        else:
+            keep.append(before[i] is not False and after[i] is not False)
+    return keep
+
+
+# ----------------------------------
+# Extraction
+# ----------------------------------
+
+def extract_bs4(html_bytes):
+    """The original extractor: BeautifulSoup html.parser, junk tags decomposed, every text node kept."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html_bytes, "html.parser")
+    # Remove obvious junk
+    for tag in soup(["script", "style", "nav", "footer", "header", "form"]):
+        tag.decompose()
+    text = soup.get_text(separator="\n")
+    return text
+
+
+def extract(html_bytes, backend=BACKEND, strip_boilerplate=STRIP_BOILERPLATE):
+    """Page text for chunking, one block per line. bs4 never strips boilerplate."""
+    if resolve_backend(backend) == "bs4":
+        return extract_bs4(html_bytes)
+    blocks = text_blocks(html_bytes, backend, strip_boilerplate)
+    if strip_boilerplate:
+        blocks = [block for block, keep in zip(blocks, classify_blocks(blocks)) if keep]
+    return "\n".join(block.text for block in blocks)
+
+
+# ----------------------------------
+# Benchmark and diff against bs4
+# ----------------------------------
+
+def load_pages(paths=(), raw_dir=None):
+    """(name, bytes) of the given files (globs allowed) and of every HTML report in the raw store."""
+    pages = []
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            with open(path, "rb") as f:
+                pages.append((os.path.basename(path), f.read()))
+    if raw_dir:
+        from raw_store import RawStore
+
+        store = RawStore(raw_dir)
+        for url in store.urls():
+            content = store.load_url(url)
+            if content and not content.startswith(b"%PDF") and b"<html" in content[:4096].lower():
+                pages.append((url, content))
+        store.close()
+    return pages
+
+
+def bench(pages, backends=("bs4", "lxml", "selectolax"), repeat=3):
+    """Best-of-`repeat` seconds over all pages, MB/s and output size, per backend/boilerplate setting."""
+    total_mb = sum(len(content) for _, content in pages) / 1e6
+    rows = []
+    for backend in backends:
+        for strip_boilerplate in ([False] if backend == "bs4" else [False, True]):
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                chars = sum(len(extract(content, backend, strip_boilerplate)) for _, content in pages)
+                best = min(best, time.perf_counter() - start)
+            rows.append({
+                "backend": backend,
+                "boilerplate": "stripped" if strip_boilerplate else "kept",
+                "seconds": best,
+                "mb_per_s": total_mb / best if best else 0.0,
+                "chars": chars,
+            })
+    return rows
+
+
+def diff_page(html_bytes, backend=BACKEND, strip_boilerplate=STRIP_BOILERPLATE):
+    """
+    Compare one page against the bs4 extractor: sizes, chunk counts, and the
+    words bs4 keeps that `backend` drops (and the reverse), as multisets.
+    bs4 puts a newline between every text node, so a word split by inline
+    markup ("emiss<b>ions</b>") shows up as dropped pieces and one added word.
+    """
+    import funcs
+
+    old = extract_bs4(html_bytes)
+    new = extract(html_bytes, backend, strip_boilerplate)
+    old_words = collections.Counter(old.split())
+    new_words = collections.Counter(new.split())
+    n_old = sum(old_words.values())
+    return {
+        "old_chars": len(old),
+        "new_chars": len(new),
+        "old_chunks": len(funcs.split_and_quote(old, width=500)),
+        "new_chunks": len(funcs.split_and_quote(new, width=500)),
+        "words_dropped": sum((old_words - new_words).values()),
+        "words_added": sum((new_words - old_words).values()),
+        "kept_share": sum((old_words & new_words).values()) / n_old if n_old else 1.0,
+    }
+
+
+def _print_dropped(html_bytes, backend):
+    blocks = text_blocks(html_bytes, backend, strip_boilerplate=True)
+    for block, keep in zip(blocks, classify_blocks(blocks)):
+        if not keep:
+            print(f"    - [{block.words:4d} words, {link_density(block):4.0%} links] {block.text[:100]!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the HTML extractors and diff them against bs4.")
+    parser.add_argument("cmd", choices=["bench", "diff"])
+    parser.add_argument("pages", nargs="*", help="HTML files (globs allowed)")
+    parser.add_argument("--raw-dir", default=None, help="also use every HTML report in this raw store")
+    parser.add_argument("--backend", default=BACKEND, choices=["selectolax", "lxml"], help="diff: backend to compare")
+    parser.add_argument("--keep-boilerplate", action="store_true", help="diff: don't strip boilerplate")
+    parser.add_argument("--repeat", type=int, default=3, help="bench: timed runs per backend")
+    parser.add_argument("--show", action="store_true", help="diff: print the blocks classified as boilerplate")
+    parser.add_argument("--out", default=None, help="write the table to this CSV")
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages, args.raw_dir)
+    if not pages:
+        parser.error("no HTML pages: pass files or --raw-dir")
+
+    import pandas as pd
+
+    if args.cmd == "bench":
+        backends = ["bs4", "lxml"] + (["selectolax"] if resolve_backend("selectolax") == "selectolax" else [])
+        table = pd.DataFrame(bench(pages, backends, args.repeat))
+        total_mb = sum(len(content) for _, content in pages) / 1e6
+        print(f"{len(pages)} pages, {total_mb:.1f} MB, best of {args.repeat}")
+        print(f"\n{'backend':>10s} {'boilerplate':>11s} {'seconds':>8s} {'MB/s':>7s} {'chars':>10s}")
+        for row in table.itertuples():
+            print(f"{row.backend:>10s} {row.boilerplate:>11s} {row.seconds:8.3f} {row.mb_per_s:7.1f} {row.chars:10d}")
+    else:
+        strip_boilerplate = not args.keep_boilerplate
+        rows = []
+        for name, content in pages:
+            rows.append({"page": name, **diff_page(content, args.backend, strip_boilerplate)})
+            row = rows[-1]
+            print(f"{name}: chunks {row['old_chunks']} -> {row['new_chunks']}, chars {row['old_chars']} -> "
+                  f"{row['new_chars']}, {row['kept_share']:.1%} of bs4 words kept, "
+                  f"{row['words_dropped']} dropped, {row['words_added']} added")
+            if args.show and strip_boilerplate:
+                _print_dropped(content, args.backend)
+        table = pd.DataFrame(rows)
+        print(f"\nTotal: chunks {table['old_chunks'].sum()} -> {table['new_chunks'].sum()}, "
+              f"words dropped {table['words_dropped'].sum()}, added {table['words_added'].sum()}")
+
+    if args.out:
+        table.to_csv(args.out, index=False)
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
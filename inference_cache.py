@@ -0,0 +1,171 @@
+"""
+Content-addressed, on-disk cache of classifier outputs.
+
+Each row is keyed by (chunk text hash, model name, model revision) and
+stores the top label, its score and, when known, the full probability
+vector. Unchanged chunks are never sent to a model twice, so re-scoring a
+report after a re-scrape, or adding one new metric, only runs the
+chunks/models that are actually missing.
+"""
+
+import glob
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+CACHE_PATH = "data/inference_cache.sqlite"
+
+# sqlite's default limit on bound parameters is 999
+_LOOKUP_BATCH = 500
+
+
+def text_hash(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def local_revision(path):
+    """
+    Revision of a local checkpoint directory: a hash of the size and mtime of
+    its config and weight files, so retrained weights saved to the same path
+    don't hit outputs cached for the old ones. "local" if `path` isn't a directory.
+    """
+    files = sorted(
+        p for pattern in ("config.json", "*.safetensors", "*.bin", "*.pt", "*.onnx")
+        for p in glob.glob(os.path.join(path, pattern))
+    ) if os.path.isdir(path) else []
+    if not files:
+        return "local"
+    stamp = "|".join(f"{os.path.basename(p)}:{os.path.getsize(p)}:{os.path.getmtime(p)}" for p in files)
+    return "local-" + hashlib.blake2b(stamp.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def model_key(model):
+    """
+    (name, revision) used to key cached outputs of `model`.
+    Backends that wrap a checkpoint (e.g. ONNX) set cache_name/cache_revision.
+    """
+    config = model.config
+    name = getattr(model, "cache_name", None) or config._name_or_path
+    revision = (getattr(model, "cache_revision", None) or getattr(config, "_commit_hash", None)
+                or local_revision(config._name_or_path))
+    return name, revision
+
+
+def _probs_blob(probs):
+    if probs is None:
+        return None
+    return np.asarray(probs, dtype=np.float32).tobytes()
+
+
+class InferenceCache:
+    def __init__(self, path=CACHE_PATH, journal_mode="WAL"):
+        # WAL needs shared memory between readers, so it only works when every
+        # process is on one host; "DELETE" (rollback journal) works over network mounts
+        self.path = path
+        self.journal_mode = journal_mode
+        self._conn = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self._conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS outputs (
+                    text_hash BLOB NOT NULL,
+                    model TEXT NOT NULL,
+                    revision TEXT NOT NULL,
+                    label TEXT NOT NULL,
+                    score REAL NOT NULL,
+                    probs BLOB,
+                    PRIMARY KEY (model, revision, text_hash)
+                ) WITHOUT ROWID
+                """
+            )
+            # caches created before probabilities were stored
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(outputs)")]
+            if "probs" not in columns:
+                self._conn.execute("ALTER TABLE outputs ADD COLUMN probs BLOB")
+        return self._conn
+
+    def get_many(self, model_name, revision, hashes):
+        """
+        Bulk lookup. Returns {hash: {"label", "score"[, "probs"]}} for the hashes
+        that are cached ("probs" is a float32 array when it was stored).
+        """
+        hashes = list(set(hashes))
+        found = {}
+
+        with self._lock:
+            conn = self._connect()
+            for start in range(0, len(hashes), _LOOKUP_BATCH):
+                part = hashes[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(part))
+                rows = conn.execute(
+                    f"SELECT text_hash, label, score, probs FROM outputs "
+                    f"WHERE model = ? AND revision = ? AND text_hash IN ({placeholders})",
+                    [model_name, revision, *part],
+                )
+                for key, label, score, probs in rows:
+                    found[key] = {"label": label, "score": score}
+                    if probs is not None:
+                        found[key]["probs"] = np.frombuffer(probs, dtype=np.float32)
+
+        self.hits += len(found)
+        self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, model_name, revision, items):
+        """Batched write of (hash, {"label", "score"[, "probs"]}) pairs in one transaction."""
+        rows = [
+            (key, model_name, revision, out["label"], out["score"], _probs_blob(out.get("probs")))
+            for key, out in items
+        ]
+        if not rows:
+            return
+
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO outputs (text_hash, model, revision, label, score, probs) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def cached_classify(cache, model, texts, classify):
+    """
+    Look up every text in `cache`, run `classify(missing_texts)` on the misses
+    only, store the new outputs, and return outputs aligned with `texts`.
+    """
+    texts = list(texts)
+    if cache is None:
+        return classify(texts)
+
+    name, revision = model_key(model)
+    keys = [text_hash(text) for text in texts]
+    found = cache.get_many(name, revision, keys)
+
+    missing = [i for i, key in enumerate(keys) if key not in found]
+    if missing:
+        results = classify([texts[i] for i in missing])
+        new = {keys[i]: out for i, out in zip(missing, results)}
+        cache.put_many(name, revision, new.items())
+        found.update(new)
+
+    return [found[key] for key in keys]
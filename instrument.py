@@ -0,0 +1,248 @@
+"""
+Lightweight per-stage timing for scraping and scoring runs.
+
+Off unless INSTRUMENT=1 (or configure(enabled=True)); when off, span()
+returns one shared no-op context manager and record() returns immediately.
+When on, every span records its stage, the current report and model, wall
+time, item count and bytes:
+
+    with instrument.report(name):
+        with instrument.span("forward", model=head, items=len(batch)) as s:
+            ...
+            s.add(bytes=n)
+
+Exports (INSTRUMENT_DIR, default data/instrument):
+    spans.jsonl     one JSON object per span, appended
+    metrics.prom    Prometheus textfile-collector format, totals per
+                    stage/report/model, rewritten by finish()
+
+finish() also prints a per-stage summary table.
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+INSTRUMENT_DIR = os.environ.get("INSTRUMENT_DIR", "data/instrument")
+METRIC_PREFIX = "greenbeans_stage"
+
+_enabled = os.environ.get("INSTRUMENT", "0") == "1"
+_out_dir = INSTRUMENT_DIR
+_lock = threading.Lock()
+_totals = defaultdict(lambda: [0, 0.0, 0, 0])  # (stage, report, model) -> calls, seconds, items, bytes
+_buffer = []
+_FLUSH_EVERY = 1000
+
+_report = contextvars.ContextVar("instrument_report", default="")
+
+
+def configure(enabled=None, out_dir=None):
+    global _enabled, _out_dir
+    if enabled is not None:
+        _enabled = enabled
+    if out_dir is not None:
+        _out_dir = out_dir
+
+
+def enabled():
+    return _enabled
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, items=0, bytes=0):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Span:
+    __slots__ = ("stage", "report", "model", "items", "bytes", "start")
+
+    def __init__(self, stage, model, items, bytes):
+        self.stage = stage
+        self.report = _report.get()
+        self.model = model or ""
+        self.items = items
+        self.bytes = bytes
+
+    def add(self, items=0, bytes=0):
+        self.items += items
+        self.bytes += bytes
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.stage, self.report, self.model, time.perf_counter() - self.start, self.items, self.bytes)
+        return False
+
+
+def span(stage, model=None, items=0, bytes=0):
+    """Context manager timing one stage (a no-op when instrumentation is off)."""
+    if not _enabled:
+        return _NO_SPAN
+    return Span(stage, model, items, bytes)
+
+
+def record(stage, seconds, model=None, items=0, bytes=0, report=None):
+    """Record an already measured duration (e.g. from an async download)."""
+    if _enabled:
+        _record(stage, _report.get() if report is None else report, model or "", seconds, items, bytes)
+
+
+@contextmanager
+def report(name):
+    """Attribute every span inside the block to report `name`."""
+    token = _report.set(name)
+    try:
+        yield
+    finally:
+        _report.reset(token)
+
+
+def timed_iter(iterable, stage, model=None, size=None):
+    """
+    Yield from `iterable`, timing only the time spent producing items (e.g.
+    PDF pages) and not the consumer's work between them. One span is
+    recorded when the iterator is exhausted or closed; `size(item)` gives
+    bytes per item.
+    """
+    if not _enabled:
+        yield from iterable
+        return
+
+    current = _report.get()
+    seconds = 0.0
+    items = 0
+    n_bytes = 0
+    it = iter(iterable)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                seconds += time.perf_counter() - start
+                break
+            seconds += time.perf_counter() - start
+            items += 1
+            if size is not None:
+                n_bytes += size(item)
+            yield item
+    finally:
+        _record(stage, current, model or "", seconds, items, n_bytes)
+
+
+def _record(stage, report_name, model, seconds, items, n_bytes):
+    with _lock:
+        totals = _totals[(stage, report_name, model)]
+        totals[0] += 1
+        totals[1] += seconds
+        totals[2] += items
+        totals[3] += n_bytes
+        _buffer.append({
+            "ts": time.time(),
+            "stage": stage,
+            "report": report_name,
+            "model": model,
+            "seconds": seconds,
+            "items": items,
+            "bytes": n_bytes,
+        })
+        if len(_buffer) >= _FLUSH_EVERY:
+            _flush_locked()
+
+
+def _flush_locked():
+    if not _buffer:
+        return
+    os.makedirs(_out_dir, exist_ok=True)
+    with open(os.path.join(_out_dir, "spans.jsonl"), "a", encoding="utf-8") as f:
+        f.writelines(json.dumps(row) + "\n" for row in _buffer)
+    _buffer.clear()
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def write_prometheus(path=None):
+    path = path or os.path.join(_out_dir, "metrics.prom")
+    with _lock:
+        totals = {key: list(value) for key, value in _totals.items()}
+
+    lines = []
+    for suffix, i, help_text in [
+        ("calls_total", 0, "Number of spans"),
+        ("seconds_total", 1, "Wall time spent in the stage"),
+        ("items_total", 2, "Items (chunks, pages, files) processed"),
+        ("bytes_total", 3, "Bytes processed"),
+    ]:
+        name = f"{METRIC_PREFIX}_{suffix}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for (stage, report_name, model), values in sorted(totals.items()):
+            labels = f'stage="{_label(stage)}",report="{_label(report_name)}",model="{_label(model)}"'
+            lines.append(f"{name}{{{labels}}} {values[i]}")
+
+    # the textfile collector may read at any time, so replace the file atomically
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+
+
+def summary():
+    """Totals per (stage, model) across reports, slowest first."""
+    with _lock:
+        totals = {key: list(value) for key, value in _totals.items()}
+
+    by_stage = defaultdict(lambda: [0, 0.0, 0, 0])
+    for (stage, _, model), values in totals.items():
+        row = by_stage[(stage, model)]
+        for i, value in enumerate(values):
+            row[i] += value
+
+    rows = [
+        {"stage": stage, "model": model, "calls": calls, "seconds": seconds, "items": items, "bytes": n_bytes}
+        for (stage, model), (calls, seconds, items, n_bytes) in by_stage.items()
+    ]
+    return sorted(rows, key=lambda row: -row["seconds"])
+
+
+def print_summary():
+    rows = summary()
+    if not rows:
+        return
+    total = sum(row["seconds"] for row in rows) or 1.0
+    print(f"\n{'stage':22s} {'model':28s} {'calls':>7s} {'seconds':>9s} {'share':>6s} {'items/s':>10s} {'MB/s':>8s}")
+    for row in rows:
+        per_s = row["items"] / row["seconds"] if row["seconds"] > 0 else 0
+        mb_s = row["bytes"] / 1e6 / row["seconds"] if row["seconds"] > 0 else 0
+        print(f"{row['stage']:22s} {row['model'][-28:]:28s} {row['calls']:7d} {row['seconds']:9.2f} "
+              f"{row['seconds'] / total:6.1%} {per_s:10.1f} {mb_s:8.2f}")
+    print("(spans can nest, so shares of nested stages overlap)")
+
+
+def finish():
+    """Flush spans.jsonl, write metrics.prom and print the summary (no-op when off)."""
+    if not _enabled:
+        return
+    with _lock:
+        _flush_locked()
+    write_prometheus()
+    print_summary()
+    print(f"Instrumentation written to {_out_dir}")
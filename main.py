@@ -1,29 +1,162 @@
 from transformers import AutoModelForSequenceClassification, AutoTokenizer, pipeline
-from transformers.pipelines.pt_utils import KeyDataset
 import datasets
 from tqdm.auto import tqdm
+import numpy as np
+import torch
 import os
 import csv
-
-def load_text_dataset(dataset_name):
-    return datasets.load_dataset("text", data_files=dataset_name)["train"]
-
-def load_model_and_pipe(model_name):
-    model = AutoModelForSequenceClassification.from_pretrained(model_name)
-    tokenizer = AutoTokenizer.from_pretrained(model_name, max_len=512)
+import instrument
+from funcs import quote_line, read_chunk_lines, unquote_related
+from model_registry import ModelRegistry
+from batching import MAX_BATCH_SIZE, MAX_BATCH_TOKENS, classify_texts, token_budget_batches
+from aggregate import (
+    PROBS_DIR,
+    SENTIMENT_WEIGHTS,
+    TCFD_CATEGORIES,
+    aggregate_report,
+    build_result_row,
+    prepare,
+    save_report_probs,
+)
+from inference_cache import CACHE_PATH, InferenceCache, cached_classify, model_key, text_hash
+
+DETECTOR_MODEL = "climatebert/distilroberta-base-climate-detector"
+SPECIFICITY_MODEL = "climatebert/distilroberta-base-climate-specificity"
+SENTIMENT_MODEL = "climatebert/distilroberta-base-climate-sentiment"
+COMMITMENT_MODEL = "climatebert/distilroberta-base-climate-commitment"
+TCFD_MODEL = "climatebert/distilroberta-base-climate-tcfd"
+
+# head name -> checkpoint used by the single-pass scorer
+HEAD_MODELS = {
+    "relate": DETECTOR_MODEL,
+    "spec": SPECIFICITY_MODEL,
+    "senti": SENTIMENT_MODEL,
+    "commit": COMMITMENT_MODEL,
+    "tcfd": TCFD_MODEL,
+}
+DOWNSTREAM_HEADS = ["spec", "senti", "commit", "tcfd"]
+
+DEVICE = 0
+
+# "cuda" (GPU DEVICE), "cpu" (torch on CPU), "onnx" or "onnx-int8" (ONNX Runtime on CPU)
+BACKEND = os.environ.get("SCORER_BACKEND", "cuda")
+# 0 = library default
+CPU_INTRA_OP_THREADS = int(os.environ.get("CPU_INTRA_OP_THREADS", 0))
+CPU_INTER_OP_THREADS = int(os.environ.get("CPU_INTER_OP_THREADS", 0))
+
+if BACKEND == "cpu":
+    if CPU_INTRA_OP_THREADS:
+        torch.set_num_threads(CPU_INTRA_OP_THREADS)
+    if CPU_INTER_OP_THREADS:
+        torch.set_num_interop_threads(CPU_INTER_OP_THREADS)
+
+# converted checkpoints (model_store.py convert), unset = from_pretrained
+MODEL_STORE = os.environ.get("MODEL_STORE", "")
+
+# cap on resident model weights, unset = keep every model loaded. Only the
+# legacy per-metric path (run_all_metrics_for_file_legacy) is bounded by it:
+# single-pass scoring needs all five heads resident for every batch
+MODEL_CACHE_MB = float(os.environ.get("MODEL_CACHE_MB", 0)) or None
+
+# on-disk cache of classifier outputs, INFERENCE_CACHE="" (or 0/false/off) disables it
+INFERENCE_CACHE_PATH = os.environ.get("INFERENCE_CACHE", CACHE_PATH)
+if INFERENCE_CACHE_PATH.strip().lower() in ("", "0", "false", "no", "off"):
+    INFERENCE_CACHE_PATH = ""
+cache = InferenceCache(INFERENCE_CACHE_PATH) if INFERENCE_CACHE_PATH else None
+
+# full per-chunk probabilities are saved here for aggregate.py, "" disables it
+PROBS_OUT_DIR = os.environ.get("PROBS_DIR", PROBS_DIR)
+# downstream heads also run on detector "yes" chunks down to this score, so
+# stored probabilities support detector thresholds >= DETECTOR_FLOOR
+DETECTOR_FLOOR = float(os.environ.get("DETECTOR_FLOOR", 0.8))
+# also write each report's detector-kept chunks to {name}_related.txt
+WRITE_RELATED = os.environ.get("WRITE_RELATED", "0") == "1"
+
+# lexical gate in front of the detector (prefilter.py train), unset = detector sees every chunk
+PREFILTER_PATH = os.environ.get("PREFILTER", "")
+gate = None
+if PREFILTER_PATH:
+    from prefilter import Prefilter
+
+    gate = Prefilter.load(PREFILTER_PATH)
+
+# warm scoring service (score_server.py), unset = load the models in this process
+SCORE_SERVER = os.environ.get("SCORE_SERVER", "")
+
+# near-duplicate clusters (dedup.py build), unset = every chunk is scored as itself
+DEDUP_DIR = os.environ.get("DEDUP", "")
+fanout = None
+if DEDUP_DIR:
+    from dedup import Fanout
+
+    fanout = Fanout(DEDUP_DIR)
+# forward passes run and saved by scoring each cluster once, over the whole run
+dedup_passes = {"run": 0, "saved": 0}
+
+def load_text_dataset(source):
+    """
+    `source` is a text file (one chunk per line) or an in-memory iterable of
+    chunks, e.g. the kept texts from filter_related.
+    """
+    with instrument.span("load_dataset") as s:
+        if isinstance(source, (str, os.PathLike)):
+            texts = datasets.load_dataset("text", data_files=source)["train"]["text"]
+            s.add(bytes=os.path.getsize(source))
+        else:
+            texts = source
+        dataset = datasets.Dataset.from_dict({"text": [unquote_related(text) for text in texts]})
+        s.add(items=len(dataset))
+    return dataset
+
+def _load_pipe_torch(model_name, device=DEVICE):
+    if MODEL_STORE:
+        import model_store
+
+        # mmap-backed weights shared by every process on the box
+        model, tokenizer = model_store.load(model_name, MODEL_STORE)
+    else:
+        model = AutoModelForSequenceClassification.from_pretrained(model_name)
+        tokenizer = AutoTokenizer.from_pretrained(model_name, max_len=512)
     return pipeline(
         "text-classification",
         model=model,
         tokenizer=tokenizer,
-        device=0,
+        device=device,
         truncation=True,
         padding=True,
         max_length=512
     )
 
 
+def _load_pipe(model_name):
+    if BACKEND in ("onnx", "onnx-int8"):
+        import onnx_backend
 
-def run_binary_classifier(pipe, dataset, positive_label, score_threshold=0.8, weight_map=None):
+        return onnx_backend.load_onnx_pipe(
+            model_name,
+            quantize=BACKEND == "onnx-int8",
+            intra_op_threads=CPU_INTRA_OP_THREADS,
+            inter_op_threads=CPU_INTER_OP_THREADS,
+        )
+
+    return _load_pipe_torch(model_name, device=DEVICE if BACKEND == "cuda" else "cpu")
+
+
+registry = ModelRegistry(_load_pipe, max_mb=MODEL_CACHE_MB)
+
+
+def load_model_and_pipe(model_name):
+    # each checkpoint is loaded once per process and reused across files
+    return registry.get(model_name)
+
+
+def classify(pipe, texts):
+    # only cache misses reach the model
+    with instrument.span("classify", model=getattr(pipe.model, "name_or_path", None), items=len(texts)):
+        return cached_classify(cache, pipe.model, texts, lambda missing: classify_texts(pipe, missing))
+
+
+def tally_outputs(outputs, positive_label, score_threshold=0.8, weight_map=None):
     total = 0
     count = 0
 
@@ -34,7 +167,7 @@ def run_binary_classifier(pipe, dataset, positive_label, score_threshold=0.8, we
         else:
             weight_map = {}
 
-    for out in tqdm(pipe(KeyDataset(dataset, "text"))):
+    for out in outputs:
         if out["score"] >= score_threshold:
             total += 1
             # treat unknown labels as weight 0
@@ -42,7 +175,54 @@ def run_binary_classifier(pipe, dataset, positive_label, score_threshold=0.8, we
 
     return count, total
 
-def relatedness(model_name, dataset_name, output_file="related_data.txt"):
+
+def tally_tcfd(outputs, score_threshold=0.8):
+    categories = {label: 0 for label in TCFD_CATEGORIES}
+
+    for out in outputs:
+        if out["score"] >= score_threshold:
+            if out["label"] in categories:
+                categories[out["label"]] += 1
+
+    return categories
+
+
+def prefilter_chunks(texts):
+    """Indices of the chunks the detector still has to see (all of them without a gate)."""
+    if gate is None:
+        return list(range(len(texts)))
+    with instrument.span("prefilter", items=len(texts)):
+        return np.flatnonzero(gate.keep(texts)).tolist()
+
+
+def gated_outputs(model, n, passed, found):
+    """
+    Detector outputs for all `n` chunks: `found` for the `passed` indices, and
+    a confident "no" (score 1.0) for every chunk the prefilter skipped. The
+    gate only skips plainly off-topic chunks, which the detector would have
+    scored the same way, so relatedness matches an ungated run.
+    """
+    id2label = model.config.id2label
+    probs = np.zeros(len(id2label), dtype=np.float32)
+    probs[next(i for i, label in id2label.items() if label == "no")] = 1.0
+    probs.flags.writeable = False  # shared by every skipped chunk
+    outputs = [{"label": "no", "score": 1.0, "probs": probs}] * n
+    for i, out in zip(passed, found):
+        outputs[i] = out
+    return outputs
+
+
+def run_binary_classifier(pipe, dataset, positive_label, score_threshold=0.8, weight_map=None):
+    outputs = classify(pipe, dataset["text"])
+    with instrument.span("tally", model=getattr(pipe.model, "name_or_path", None), items=len(outputs)):
+        return tally_outputs(outputs, positive_label, score_threshold, weight_map)
+
+def filter_related(model_name, dataset_name, output_file=None):
+    """
+    Run the climate detector and return (relatedness, kept chunks).
+    The kept chunks can be passed straight to specificity/sentiment/
+    commitment/climatetcfd; writing them to `output_file` is optional.
+    """
     dataset = load_text_dataset(dataset_name)
     pipe = load_model_and_pipe(model_name)
 
@@ -50,23 +230,37 @@ def relatedness(model_name, dataset_name, output_file="related_data.txt"):
     count = 0
     kept = []
 
-    for text, out in zip(dataset["text"], tqdm(pipe(KeyDataset(dataset, "text")))):
+    texts = list(dataset["text"])
+    passed = prefilter_chunks(texts)
+    outputs = gated_outputs(pipe.model, len(texts), passed, classify(pipe, [texts[i] for i in passed]))
+
+    for text, out in zip(texts, outputs):
         if out["score"] >= 0.8:
             total += 1
             if out["label"] == "yes":
                 count += 1
                 kept.append(text)
 
+    if output_file:
+        write_related(output_file, kept)
+
+    return (count / total if total > 0 else 0), kept
+
+
+def write_related(output_file, texts):
     with open(output_file, "w", encoding="utf-8") as f:
-        for line in kept:
-            f.write(f"\"{line}\"\n")
+        for line in texts:
+            f.write(quote_line(line) + "\n")
 
-    return count / total if total > 0 else 0
+
+def relatedness(model_name, dataset_name, output_file="related_data.txt"):
+    relate, _ = filter_related(model_name, dataset_name, output_file)
+    return relate
 
 
 def specificity(_, dataset_name):
     dataset = load_text_dataset(dataset_name)
-    pipe = load_model_and_pipe("climatebert/distilroberta-base-climate-specificity")
+    pipe = load_model_and_pipe(SPECIFICITY_MODEL)
 
     count, total = run_binary_classifier(pipe, dataset, positive_label="spec")
     return count / total if total > 0 else 0
@@ -74,22 +268,15 @@ def specificity(_, dataset_name):
 
 def sentiment(_, dataset_name):
     dataset = load_text_dataset(dataset_name)
-    pipe = load_model_and_pipe("climatebert/distilroberta-base-climate-sentiment")
+    pipe = load_model_and_pipe(SENTIMENT_MODEL)
 
-    # risk=2, neutral=1, opportunity=0
-    weight_map = {
-        "risk": 2,
-        "neutral": 1,
-        "opportunity": 0,
-    }
-
-    count, total = run_binary_classifier(pipe, dataset, positive_label="risk", weight_map=weight_map)
+    count, total = run_binary_classifier(pipe, dataset, positive_label="risk", weight_map=SENTIMENT_WEIGHTS)
     return round(count / (total * 2), 2) if total > 0 else 0
 
 
 def commitment(_, dataset_name):
     dataset = load_text_dataset(dataset_name)
-    pipe = load_model_and_pipe("climatebert/distilroberta-base-climate-commitment")
+    pipe = load_model_and_pipe(COMMITMENT_MODEL)
 
     count, total = run_binary_classifier(pipe, dataset, positive_label="yes")
     return round(count / total, 2) if total > 0 else 0
@@ -99,59 +286,232 @@ def climatetcfd(model_name, dataset_name):
     dataset = load_text_dataset(dataset_name)
     pipe = load_model_and_pipe(model_name)
 
-    categories = {"metrics": 0, "strategy": 0, "governance": 0, "risk": 0}
+    return tally_tcfd(classify(pipe, dataset["text"]))
+
+
+# ----------------------------------
+# Single-pass scoring: tokenize every chunk once and run all five heads
+# over the same padded batches
+# ----------------------------------
+
+def load_heads():
+    if SCORE_SERVER:
+        import score_server
+
+        return score_server.remote_heads(SCORE_SERVER)
+    return load_local_heads()
+
+
+def load_local_heads():
+    """
+    (tokenizer, {head: model}) for single-pass scoring. Every batch runs all
+    five heads, so the models are held here for the whole run and an LRU cap
+    (MODEL_CACHE_MB) can't evict them; the registry only records the loads.
+    """
+    # all five ClimateBERT checkpoints are fine-tuned from distilroberta-base
+    # and share its tokenizer, so one tokenizer serves every head
+    pipes = {head: load_model_and_pipe(model_name) for head, model_name in HEAD_MODELS.items()}
+    tokenizer = pipes["relate"].tokenizer
+    models = {head: pipe.model.eval() for head, pipe in pipes.items()}
+
+    return tokenizer, models
+
+
+def encode_chunks(tokenizer, texts):
+    with instrument.span("tokenize", items=len(texts)):
+        return tokenizer(texts, truncation=True, max_length=512)["input_ids"]
+
+
+def predict_heads(tokenizer, models, input_ids, indices, heads, keys=None,
+                  max_tokens=MAX_BATCH_TOKENS, max_batch_size=MAX_BATCH_SIZE):
+    """
+    Run every head in `heads` over the pre-tokenized chunks at `indices`.
+    Chunks are batched by length under a token budget; each batch is padded
+    and moved to the device once and shared by all heads.
+    With `keys` (text hashes aligned with input_ids) cached outputs are reused
+    and only the misses are run.
+    Returns {head: [{"label", "score", "probs"}, ...]} aligned with `indices`.
+    """
+    indices = list(indices)
+    outputs = {head: [None] * len(indices) for head in heads}
+    todo = {head: set(range(len(indices))) for head in heads}
+
+    if cache is not None and keys is not None:
+        for head in heads:
+            name, revision = model_key(models[head])
+            with instrument.span("cache_lookup", model=name, items=len(indices)):
+                found = cache.get_many(name, revision, [keys[i] for i in indices])
+                for pos, i in enumerate(indices):
+                    # entries cached without probabilities are recomputed
+                    if "probs" in found.get(keys[i], {}):
+                        outputs[head][pos] = found[keys[i]]
+                        todo[head].discard(pos)
+
+    pending = sorted(set().union(*todo.values()))
+    lengths = [len(input_ids[indices[pos]]) for pos in pending]
+    batches = list(token_budget_batches(lengths, max_tokens, max_batch_size))
+
+    for batch_positions in tqdm(batches):
+        positions = [pending[j] for j in batch_positions]
+        batch_ids = [input_ids[indices[pos]] for pos in positions]
+        with instrument.span("pad", items=len(positions)):
+            batch = tokenizer.pad({"input_ids": batch_ids}, return_tensors="pt")
+
+        with torch.inference_mode():
+            for head in heads:
+                if todo[head].isdisjoint(positions):
+                    continue
+                model = models[head]
+                # .tolist() waits for the device, so on CUDA the span covers the whole forward pass
+                with instrument.span("forward", model=HEAD_MODELS.get(head, head), items=len(positions)):
+                    batch = batch.to(model.device)
+                    probs = model(**batch).logits.softmax(dim=-1)
+                    scores, label_ids = probs.max(dim=-1)
+                    label_ids, scores = label_ids.tolist(), scores.tolist()
+                id2label = model.config.id2label
+
+                with instrument.span("postprocess", model=HEAD_MODELS.get(head, head), items=len(positions)):
+                    rows = zip(positions, label_ids, scores, probs.float().cpu().numpy())
+                    for pos, label_id, score, row in rows:
+                        outputs[head][pos] = {"label": id2label[label_id], "score": score, "probs": row}
+
+    if cache is not None and keys is not None:
+        for head in heads:
+            name, revision = model_key(models[head])
+            with instrument.span("cache_store", model=name, items=len(todo[head])):
+                cache.put_many(name, revision, ((keys[indices[pos]], outputs[head][pos]) for pos in todo[head]))
+
+    return outputs
+
+
+def score_file(dataset_name, heads=None, output_file=None, max_tokens=MAX_BATCH_TOKENS,
+               probs_dir=None, detector_floor=None):
+    """
+    Score one chunk file with all five heads in a single pass over the data.
+    Downstream heads see exactly the text the detector saw.
+    The full probabilities are saved to `probs_dir`/<name>.npz and the
+    result row is computed from them, so aggregate.py reproduces it exactly.
+    With a dedup fanout map (DEDUP), near-duplicate chunks are scored once
+    as their cluster's representative and the outputs copied to every member.
+    """
+    tokenizer, models = heads if heads is not None else load_heads()
+    name = os.path.splitext(os.path.basename(dataset_name))[0]
+    probs_dir = PROBS_OUT_DIR if probs_dir is None else probs_dir
+    detector_floor = min(DETECTOR_FLOOR if detector_floor is None else detector_floor, 0.8)
+
+    with instrument.span("load_dataset", bytes=os.path.getsize(dataset_name)) as s:
+        texts = [unquote_related(text) for text in read_chunk_lines(dataset_name)]
+        s.add(items=len(texts))
+
+    # chunk i is scored as scored[member[i]]: its cluster representative with a fanout map, else itself
+    if fanout is not None:
+        reps = fanout.representatives(dataset_name, texts)
+        scored = list(dict.fromkeys(reps))
+        slot = {text: j for j, text in enumerate(scored)}
+        member = [slot[text] for text in reps]
+    else:
+        scored, member = texts, list(range(len(texts)))
+
+    input_ids = encode_chunks(tokenizer, scored)
+    keys = [text_hash(text) for text in scored]
+
+    # 1) climate detector over every chunk the prefilter lets through
+    passed = prefilter_chunks(scored)
+    found = predict_heads(tokenizer, models, input_ids, passed, ["relate"], keys, max_tokens)["relate"]
+    detected_scored = gated_outputs(models["relate"], len(scored), passed, found)
+    detected = [detected_scored[j] for j in member]
+
+    candidates = [
+        i for i, out in enumerate(detected)
+        if out["label"] == "yes" and out["score"] >= detector_floor
+    ]
 
-    for out in tqdm(pipe(KeyDataset(dataset, "text"))):
-        if out["score"] >= 0.8:
-            if out["label"] in categories:
-                categories[out["label"]] += 1
+    if output_file:
+        write_related(output_file, [texts[i] for i in candidates if detected[i]["score"] >= 0.8])
 
-    return categories
+    # 2) remaining heads over the related chunks, sharing each batch
+    candidates_scored = sorted({member[i] for i in candidates})
+    found = predict_heads(tokenizer, models, input_ids, candidates_scored, DOWNSTREAM_HEADS, keys, max_tokens)
+    at = {j: pos for pos, j in enumerate(candidates_scored)}
+    outputs = {head: [found[head][at[member[i]]] for i in candidates] for head in DOWNSTREAM_HEADS}
+
+    is_passed = set(passed)
+    if fanout is not None:
+        run = len(passed) + len(candidates_scored) * len(DOWNSTREAM_HEADS)
+        dedup_passes["run"] += run
+        dedup_passes["saved"] += (sum(j in is_passed for j in member)
+                                  + len(candidates) * len(DOWNSTREAM_HEADS) - run)
+
+    report = {
+        "name": name,
+        "relate": _probs_matrix(detected, models["relate"]),
+        "relate_labels": _label_names(models["relate"]),
+        "candidates": np.asarray(candidates, dtype=np.int64),
+        "detector_floor": detector_floor,
+    }
+    for head in DOWNSTREAM_HEADS:
+        report[head] = _probs_matrix(outputs[head], models[head])
+        report[f"{head}_labels"] = _label_names(models[head])
+
+    if probs_dir:
+        save_report_probs(
+            os.path.join(probs_dir, f"{name}.npz"),
+            name,
+            report["relate"],
+            report["relate_labels"],
+            candidates,
+            {head: (report[head], report[f"{head}_labels"]) for head in DOWNSTREAM_HEADS},
+            detector_floor,
+            prefiltered=[i for i, j in enumerate(member) if j not in is_passed] if gate is not None else None,
+        )
 
-def run_all_metrics_for_file(dataset_name):
+    report = {key: np.asarray(value) if isinstance(value, list) else value for key, value in report.items()}
+    return aggregate_report(prepare(report))
+
+
+def _label_names(model):
+    id2label = model.config.id2label
+    return [id2label[i] for i in range(len(id2label))]
+
+
+def _probs_matrix(outputs, model):
+    if not outputs:
+        return np.zeros((0, len(model.config.id2label)), dtype=np.float32)
+    return np.stack([out["probs"] for out in outputs]).astype(np.float32)
+
+
+def run_all_metrics_for_file(dataset_name, heads=None, save_related=WRITE_RELATED):
     name = os.path.splitext(os.path.basename(dataset_name))[0]
+    output_file = f"{name}_related.txt" if save_related else None
 
-    filtered_file = f"{name}_related.txt"
+    with instrument.report(name):
+        return score_file(dataset_name, heads=heads, output_file=output_file)
 
-    relate = relatedness(
-        "climatebert/distilroberta-base-climate-detector",
-        dataset_name,
-        filtered_file,
-    )
 
-    spec = specificity(
-        "climatebert/distilroberta-base-climate-specificity",
-        filtered_file,
-    )
+def run_all_metrics_for_file_legacy(dataset_name, stream=True, save_related=WRITE_RELATED):
+    """
+    Per-metric flow. With stream=True the detector's kept chunks go straight
+    to the downstream classifiers; otherwise they are round-tripped through
+    {name}_related.txt as before.
+    """
+    name = os.path.splitext(os.path.basename(dataset_name))[0]
+    with instrument.report(name):
+        return _legacy_metrics(name, dataset_name, stream, save_related)
 
-    senti = sentiment(
-        "climatebert/distilroberta-base-climate-sentiment",
-        filtered_file,
-    )
 
-    commit = commitment(
-        "climatebert/distilroberta-base-climate-commitment",
-        filtered_file,
-    )
+def _legacy_metrics(name, dataset_name, stream, save_related):
+    filtered_file = f"{name}_related.txt"
+    write_file = save_related or not stream
 
-    tcfd = climatetcfd(
-        "climatebert/distilroberta-base-climate-tcfd",
-        filtered_file,
-    )
+    relate, kept = filter_related(DETECTOR_MODEL, dataset_name, filtered_file if write_file else None)
+    source = kept if stream else filtered_file
 
-    sum_tcfd = sum(tcfd.values())
+    spec = specificity(SPECIFICITY_MODEL, source)
+    senti = sentiment(SENTIMENT_MODEL, source)
+    commit = commitment(COMMITMENT_MODEL, source)
+    tcfd = climatetcfd(TCFD_MODEL, source)
 
-    return {
-        "name": name,
-        "relate": relate,
-        "spec": spec,
-        "senti": senti,
-        "commit": commit,
-        "metrics": (tcfd.get("metrics", 0)/ sum_tcfd) if sum_tcfd > 0 else 0,
-        "strategy": (tcfd.get("strategy", 0)/ sum_tcfd) if sum_tcfd > 0 else 0,
-        "governance": (tcfd.get("governance", 0)/ sum_tcfd) if sum_tcfd > 0 else 0,
-        "risk": (tcfd.get("risk", 0)/ sum_tcfd) if sum_tcfd > 0 else 0,
-    }
+    return build_result_row(name, relate, spec, senti, commit, tcfd)
 
 
 if __name__ == "__main__":
@@ -188,4 +548,10 @@ if __name__ == "__main__":
             row = run_all_metrics_for_file(path)
             writer.writerow(row)
 
-    print("results.csv updated")
\ No newline at end of file
+    print("results.csv updated")
+    registry.print_report()
+    if fanout is not None:
+        total = dedup_passes["run"] + dedup_passes["saved"]
+        print(f"Dedup: {dedup_passes['run']} forward passes run, {dedup_passes['saved']} saved "
+              f"({dedup_passes['saved'] / total if total else 0:.1%})")
+    instrument.finish()
\ No newline at end of file
@@ -1,21 +1,33 @@
-import pandas as pd
+import argparse
+import hashlib
+import io
+import json
 import os
 
-''' Merge all the data. Language data from model, company ESG and emissions data'''
+import pandas as pd
+
+''' Merge all the data. Language data from model, company ESG and emissions data
+
+Incremental: inputs are parsed into typed Parquet caches (data/build_cache)
+only when the CSV changed, results.csv is read from where the last build
+stopped, and only the rows of tickers whose results, ESG or emissions rows
+changed are recomputed in data/main_dataset_2024.csv. When results.csv has
+several rows for a ticker (a rescore appends a new one) the newest wins.
+
+    python main_data_build.py                  # incremental
+    python main_data_build.py --full           # rebuild from scratch
+'''
 
-# 1) Build text_metrics_2024.csv
 RESULTS_PATH = "results.csv"
-OUT_METRICS_PATH = "data/text_metrics_2024.csv"
+ESG_SCORES_PATH = "data/esg_scores.csv"
+EMISSIONS_PATH = "data/emissions_totals.csv"
 
-# Load results
-results = pd.read_csv(RESULTS_PATH)
+OUT_METRICS_PATH = "data/text_metrics_2024.csv"
+OUT_MERGED_ESG_TEXT_PATH = "data/esg_with_text_metrics_2024.csv"
+OUT_MAIN_DATASET_PATH = "data/main_dataset_2024.csv"
 
-# Extract ticker from model output name (e.g. "xel_2024_chunks" -> "XEL")
-results["ticker"] = (
-    results["name"]
-    .str.split("_", n=1).str[0]
-    .str.upper()
-)
+CACHE_DIR = "data/build_cache"
+STATE_PATH = os.path.join(CACHE_DIR, "state.json")
 
 # Keep columns of interest
 metrics_cols = [
@@ -30,73 +42,230 @@ metrics_cols = [
     "risk",
 ]
 
-metrics_df = results[metrics_cols].copy()
+# bytes before the stored results.csv offset that must be unchanged for an append-only read
+_TAIL_CHECK = 4096
 
-# Drop potential duplicates (if multiple files per ticker)
-metrics_df = metrics_df.drop_duplicates(subset=["ticker"])
 
-# Ensure output directory exists
-os.makedirs(os.path.dirname(OUT_METRICS_PATH), exist_ok=True)
+def _cache_path(name):
+    return os.path.join(CACHE_DIR, f"{name}.parquet")
 
-metrics_df.to_csv(OUT_METRICS_PATH, index=False)
-print(f"Saved text metrics → {OUT_METRICS_PATH}")
 
+def _file_sig(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
 
-# 2) Merge with ESG scores
-TEXT_METRICS_PATH = OUT_METRICS_PATH
-ESG_SCORES_PATH = "data/esg_scores.csv"
-OUT_MERGED_ESG_TEXT_PATH = "data/esg_with_text_metrics_2024.csv"
 
-# Load text metrics
-metrics = pd.read_csv(TEXT_METRICS_PATH)
-metrics["ticker"] = metrics["ticker"].str.upper()
+def load_state(full=False):
+    if full or not os.path.exists(STATE_PATH):
+        return {"sources": {}, "fingerprints": {}, "results": None}
+    with open(STATE_PATH) as f:
+        return json.load(f)
 
-# Load ESG scores
-esg = pd.read_csv(ESG_SCORES_PATH)
 
-# Normalize ESG ticker column
-if "ticker" in esg.columns:
-    esg["ticker"] = esg["ticker"].astype(str).str.upper()
-elif "Symbol" in esg.columns:
-    esg["ticker"] = esg["Symbol"].astype(str).str.upper()
-else:
-    raise ValueError("Could not find a 'ticker' or 'Symbol' column in esg_scores.csv")
+def save_state(state):
+    tmp_path = STATE_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, STATE_PATH)
 
-# Merge ESG + text metrics
-merged_esg_text = esg.merge(metrics, on="ticker", how="inner")
 
-print(f"\nESG + text metrics merged shape: {merged_esg_text.shape}")
-print("\nESG + text metrics example rows:")
-print(merged_esg_text.head())
+# ----------------------------------
+# 1) Text metrics: latest results.csv row per ticker
+# ----------------------------------
 
-# Save intermediate
-os.makedirs(os.path.dirname(OUT_MERGED_ESG_TEXT_PATH), exist_ok=True)
-merged_esg_text.to_csv(OUT_MERGED_ESG_TEXT_PATH, index=False)
-print(f"\nSaved ESG + text metrics → {OUT_MERGED_ESG_TEXT_PATH}")
+def _to_metrics(results):
+    # Extract ticker from model output name (e.g. "xel_2024_chunks" -> "XEL")
+    results["ticker"] = (
+        results["name"]
+        .str.split("_", n=1).str[0]
+        .str.upper()
+    )
+    return results[metrics_cols].copy()
 
 
-# 3) Merge in emissions totals
-EMISSIONS_PATH = "data/emissions_totals.csv"
-OUT_MAIN_DATASET_PATH = "data/main_dataset_2024.csv"
+def _tail_digest(f, offset):
+    f.seek(max(0, offset - _TAIL_CHECK))
+    return hashlib.blake2b(f.read(min(offset, _TAIL_CHECK)), digest_size=16).hexdigest()
+
+
+def read_new_results(state, path=RESULTS_PATH):
+    """
+    Rows appended to results.csv since the last build, and whether the file
+    had to be re-read from the start (it shrank or was rewritten).
+    """
+    seen = state["results"]
+    with open(path, "rb") as f:
+        header = f.readline()
+        size = os.fstat(f.fileno()).st_size
+
+        append_only = (
+            seen is not None
+            and seen["header"] == header.decode("utf-8")
+            and seen["offset"] <= size
+            and _tail_digest(f, seen["offset"]) == seen["tail"]
+        )
+        start = seen["offset"] if append_only else len(header)
+        f.seek(start)
+        body = f.read()
+
+        offset = start + len(body)
+        state["results"] = {"header": header.decode("utf-8"), "offset": offset, "tail": _tail_digest(f, offset)}
+
+    new = pd.read_csv(io.BytesIO(header + body)) if body.strip() else pd.read_csv(io.BytesIO(header))
+    return _to_metrics(new), not append_only
+
+
+def update_metrics(state):
+    """Upsert the new results into the metrics cache. Returns (metrics, changed tickers)."""
+    new, reset = read_new_results(state)
+    cache = _cache_path("text_metrics")
+    if reset or not os.path.exists(cache):
+        old = new.iloc[:0]
+        changed = None  # everything
+    else:
+        old = pd.read_parquet(cache)
+        changed = set(new["ticker"])
+
+    # newer results always win over older ones
+    metrics = pd.concat([old, new], ignore_index=True).drop_duplicates(subset=["ticker"], keep="last")
+    metrics = metrics.reset_index(drop=True)
+    if len(new) or reset:
+        metrics.to_parquet(cache, index=False)
+    return metrics, changed
+
 
-# Load emissions
-emissions = pd.read_csv(EMISSIONS_PATH)
+# ----------------------------------
+# 2) + 3) ESG scores and emissions, cached as Parquet
+# ----------------------------------
 
-# Normalize ticker and drop duplicates
-emissions["ticker"] = emissions["ticker"].astype(str).str.upper()
-emissions = emissions.drop_duplicates(subset=["ticker"])
+def _normalize_esg(esg):
+    # Normalize ESG ticker column
+    if "ticker" in esg.columns:
+        esg["ticker"] = esg["ticker"].astype(str).str.upper()
+    elif "Symbol" in esg.columns:
+        esg["ticker"] = esg["Symbol"].astype(str).str.upper()
+    else:
+        raise ValueError("Could not find a 'ticker' or 'Symbol' column in esg_scores.csv")
+    return esg
 
-# We only really need ticker + all_total_emissions (name is redundant with ESG)
-emissions_subset = emissions[["ticker", "all_total_emissions"]].copy()
 
+def _normalize_emissions(emissions):
+    # Normalize ticker and drop duplicates
+    emissions["ticker"] = emissions["ticker"].astype(str).str.upper()
+    emissions = emissions.drop_duplicates(subset=["ticker"])
+
+    # We only really need ticker + all_total_emissions (name is redundant with ESG)
+    return emissions[["ticker", "all_total_emissions"]].copy()
+
+
+def _ticker_fingerprints(df):
+    row_hashes = pd.util.hash_pandas_object(df, index=False).astype("uint64")
+    return {
+        ticker: hashlib.blake2b(hashes.to_numpy().tobytes(), digest_size=8).hexdigest()
+        for ticker, hashes in row_hashes.groupby(df["ticker"].to_numpy(), sort=False)
+    }
+
+
+def load_source(state, name, csv_path, normalize):
+    """
+    Typed table for one input CSV, from its Parquet cache unless the CSV
+    changed. Returns (table, changed tickers) where changed is an empty set
+    if the CSV is unchanged.
+    """
+    cache = _cache_path(name)
+    if state["sources"].get(csv_path) == _file_sig(csv_path) and os.path.exists(cache):
+        return pd.read_parquet(cache), set()
+
+    table = normalize(pd.read_csv(csv_path))
+    table.to_parquet(cache, index=False)
+
+    old = state["fingerprints"].get(name, {})
+    new = _ticker_fingerprints(table)
+    state["fingerprints"][name] = new
+    state["sources"][csv_path] = _file_sig(csv_path)
+    return table, {t for t in old.keys() | new.keys() if old.get(t) != new.get(t)}
+
+
+# ----------------------------------
 # Merge all together
-main_df = merged_esg_text.merge(emissions_subset, on="ticker", how="left")
+# ----------------------------------
+
+def merge_rows(esg, metrics, emissions):
+    # Merge ESG + text metrics, then emissions totals
+    merged_esg_text = esg.merge(metrics, on="ticker", how="inner")
+    return merged_esg_text.merge(emissions, on="ticker", how="left")
+
+
+def build(full=False, intermediates=False):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    state = load_state(full)
+
+    metrics, changed = update_metrics(state)
+    esg, esg_changed = load_source(state, "esg_scores", ESG_SCORES_PATH, _normalize_esg)
+    emissions, emissions_changed = load_source(state, "emissions_totals", EMISSIONS_PATH, _normalize_emissions)
+
+    main_cache = _cache_path("main_dataset")
+    if changed is None or not os.path.exists(main_cache):
+        main_df = merge_rows(esg, metrics, emissions)
+        print(f"Rebuilt all {main_df['ticker'].nunique()} tickers")
+    else:
+        changed |= esg_changed | emissions_changed
+        if not changed and os.path.exists(OUT_MAIN_DATASET_PATH):
+            save_state(state)
+            print(f"No changes, {OUT_MAIN_DATASET_PATH} is up to date")
+            return None
+
+        # recompute only the changed tickers and put them back in ESG row order
+        old = pd.read_parquet(main_cache)
+        fresh = merge_rows(
+            esg[esg["ticker"].isin(changed)],
+            metrics[metrics["ticker"].isin(changed)],
+            emissions[emissions["ticker"].isin(changed)],
+        )
+        main_df = pd.concat([old[~old["ticker"].isin(changed)], fresh], ignore_index=True)
+
+        # one row per ESG row: the k-th row of a ticker sits where its k-th ESG row is
+        esg_pos = pd.DataFrame({
+            "ticker": esg["ticker"].to_numpy(),
+            "_k": esg.groupby("ticker").cumcount().to_numpy(),
+            "_pos": range(len(esg)),
+        })
+        main_df["_k"] = main_df.groupby("ticker").cumcount()
+        main_df = (
+            main_df.merge(esg_pos, on=["ticker", "_k"], how="inner")
+                   .sort_values("_pos", kind="stable")
+                   .drop(columns=["_k", "_pos"])
+                   .reset_index(drop=True)
+        )
+        print(f"Recomputed {len(changed)} tickers: {', '.join(sorted(changed))}")
+
+    main_df.to_parquet(main_cache, index=False)
+
+    print(f"\nFinal main dataset shape (ESG + text + emissions): {main_df.shape}")
+
+    # Save main dataset
+    os.makedirs(os.path.dirname(OUT_MAIN_DATASET_PATH), exist_ok=True)
+    main_df.to_csv(OUT_MAIN_DATASET_PATH, index=False)
+    print(f"Saved main dataset → {OUT_MAIN_DATASET_PATH}")
+
+    if intermediates:
+        metrics.to_csv(OUT_METRICS_PATH, index=False)
+        main_df.drop(columns=["all_total_emissions"]).to_csv(OUT_MERGED_ESG_TEXT_PATH, index=False)
+        print(f"Saved text metrics → {OUT_METRICS_PATH}, ESG + text metrics → {OUT_MERGED_ESG_TEXT_PATH}")
+
+    save_state(state)
+    return main_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build data/main_dataset_2024.csv from results.csv, ESG scores and emissions.")
+    parser.add_argument("--full", action="store_true", help="ignore the caches and rebuild every ticker")
+    parser.add_argument("--intermediates", action="store_true",
+                        help=f"also write {OUT_METRICS_PATH} and {OUT_MERGED_ESG_TEXT_PATH}")
+    args = parser.parse_args()
+
+    build(full=args.full, intermediates=args.intermediates)
 
-print(f"\nFinal main dataset shape (ESG + text + emissions): {main_df.shape}")
-print("\nMain dataset example rows:")
-print(main_df.head())
 
-# Save main dataset
-os.makedirs(os.path.dirname(OUT_MAIN_DATASET_PATH), exist_ok=True)
-main_df.to_csv(OUT_MAIN_DATASET_PATH, index=False)
-print(f"\nSaved main dataset → {OUT_MAIN_DATASET_PATH}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Process-wide model registry.
+
+Loads each checkpoint once per process and hands the same object to every
+later caller. Entries are kept in LRU order; when a memory cap is set, the
+least recently used models are dropped until the resident weights fit again.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+
+
+def model_nbytes(model):
+    """Bytes held by a torch model's parameters and buffers."""
+    if hasattr(model, "nbytes"):
+        # non-torch backends (e.g. ONNX Runtime sessions) report their own size
+        return model.nbytes
+    tensors = chain(model.parameters(), model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ModelRegistry:
+    def __init__(self, loader, max_mb=None, sizer=None):
+        """
+        loader: model_name -> loaded object (e.g. a transformers pipeline)
+        max_mb: cap on the summed size of resident models, None = no cap
+        sizer:  loaded object -> size in bytes (defaults to obj.model weights)
+        """
+        self.loader = loader
+        self.max_bytes = int(max_mb * 1024 * 1024) if max_mb else None
+        self.sizer = sizer or (lambda obj: model_nbytes(obj.model))
+
+        self._entries = OrderedDict()
+        self._stats = {}
+        self._lock = threading.RLock()
+
+    def get(self, model_name):
+        with self._lock:
+            if model_name in self._entries:
+                self._entries.move_to_end(model_name)
+                self._stats[model_name]["hits"] += 1
+                return self._entries[model_name]
+
+            start = time.perf_counter()
+            obj = self.loader(model_name)
+            load_seconds = time.perf_counter() - start
+
+            stats = self._stats.setdefault(model_name, {"loads": 0, "hits": 0, "evictions": 0})
+            stats["loads"] += 1
+            stats["load_seconds"] = load_seconds
+            stats["size_bytes"] = self.sizer(obj)
+
+            self._entries[model_name] = obj
+            self._evict(keep=model_name)
+            return obj
+
+    def _evict(self, keep):
+        if self.max_bytes is None:
+            return
+
+        while self.resident_bytes() > self.max_bytes:
+            victim = next((name for name in self._entries if name != keep), None)
+            if victim is None:
+                # a single model larger than the cap still has to be served
+                break
+            del self._entries[victim]
+            self._stats[victim]["evictions"] += 1
+
+    def resident_bytes(self):
+        with self._lock:
+            return sum(self._stats[name]["size_bytes"] for name in self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, model_name):
+        return model_name in self._entries
+
+    def report(self):
+        """One row per model ever loaded: load time, resident size, hits, evictions."""
+        with self._lock:
+            return [
+                {
+                    "model": name,
+                    "resident": name in self._entries,
+                    "load_seconds": round(stats["load_seconds"], 3),
+                    "size_mb": round(stats["size_bytes"] / (1024 * 1024), 1),
+                    "loads": stats["loads"],
+                    "hits": stats["hits"],
+                    "evictions": stats["evictions"],
+                }
+                for name, stats in self._stats.items()
+            ]
+
+    def print_report(self):
+        print(f"\n{'model':60s} {'load_s':>8s} {'size_mb':>8s} {'loads':>6s} {'hits':>6s} {'evict':>6s}")
+        for row in self.report():
+            print(
+                f"{row['model']:60s} {row['load_seconds']:8.3f} {row['size_mb']:8.1f} "
+                f"{row['loads']:6d} {row['hits']:6d} {row['evictions']:6d}"
+            )
+        print(f"resident: {self.resident_bytes() / (1024 * 1024):.1f} MB")
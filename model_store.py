@@ -0,0 +1,191 @@
+"""
+Offline, memory-mapped store of the ClimateBERT checkpoints for multi-process scoring.
+
+Each checkpoint is converted once to model_store/<name>/ (weights.pt plus
+config and tokenizer files). Loading builds the model on the meta device
+and assigns tensors straight from torch.load(mmap=True), so the weights are
+read-only private mappings of the same file: every worker process shares
+the page-cache pages instead of holding its own copy, and a load after the
+first is little more than an mmap. Nothing touches the Hugging Face hub.
+
+    python model_store.py convert                   # the five heads in main.HEAD_MODELS
+    python model_store.py check --workers 4         # load time + unique/shared RSS per worker
+    python model_store.py check --workers 4 --baseline    # same with from_pretrained
+
+    MODEL_STORE=model_store SCORER_BACKEND=cpu python scheduler.py data/processed_txt_2024 --workers 4
+
+Sharing only holds on the CPU backends: moving the model to CUDA copies it.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+
+import torch
+from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+
+from inference_cache import local_revision
+
+MODEL_STORE_DIR = "model_store"
+WEIGHTS_FILE = "weights.pt"
+
+
+def store_dir(model_name, root=MODEL_STORE_DIR):
+    return os.path.join(root, model_name.strip("/").replace("/", "__"))
+
+
+def convert(model_name, root=MODEL_STORE_DIR):
+    """Write one checkpoint to the store. Skips work if already converted."""
+    out_dir = store_dir(model_name, root)
+    if os.path.exists(os.path.join(out_dir, WEIGHTS_FILE)):
+        return out_dir
+
+    os.makedirs(out_dir, exist_ok=True)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+    tokenizer = AutoTokenizer.from_pretrained(model_name, max_len=512)
+
+    # parameters and every buffer, including non-persistent ones (position_ids)
+    # that a model built on the meta device would otherwise lack
+    tensors = {name: t.detach().contiguous() for name, t in model.named_parameters()}
+    tensors.update({name: t.detach().contiguous() for name, t in model.named_buffers()})
+
+    tmp_path = os.path.join(out_dir, WEIGHTS_FILE + ".tmp")
+    torch.save(tensors, tmp_path)
+
+    # remember which checkpoint revision the store came from, for inference-cache keys
+    model.config.source_revision = getattr(model.config, "_commit_hash", None) or local_revision(model_name)
+    model.config.save_pretrained(out_dir)
+    tokenizer.save_pretrained(out_dir)
+    os.replace(tmp_path, os.path.join(out_dir, WEIGHTS_FILE))
+    return out_dir
+
+
+def _assign(model, name, tensor):
+    module_name, _, attr = name.rpartition(".")
+    module = model.get_submodule(module_name)
+    if attr in module._parameters:
+        module._parameters[attr] = torch.nn.Parameter(tensor, requires_grad=False)
+    else:
+        module._buffers[attr] = tensor
+
+
+def load(model_name, root=MODEL_STORE_DIR):
+    """(model, tokenizer) from the store; the weights are mmap-backed."""
+    if not has(model_name, root):
+        raise FileNotFoundError(f"{model_name} is not in {root}; run python model_store.py convert")
+    out_dir = store_dir(model_name, root)
+    config = AutoConfig.from_pretrained(out_dir, local_files_only=True)
+    tokenizer = AutoTokenizer.from_pretrained(out_dir, max_len=512, local_files_only=True)
+
+    with torch.device("meta"):
+        model = AutoModelForSequenceClassification.from_config(config)
+    tensors = torch.load(os.path.join(out_dir, WEIGHTS_FILE), mmap=True, weights_only=True, map_location="cpu")
+    for name, tensor in tensors.items():
+        _assign(model, name, tensor)
+
+    missing = [name for name, t in [*model.named_parameters(), *model.named_buffers()] if t.is_meta]
+    if missing:
+        raise ValueError(f"{out_dir}/{WEIGHTS_FILE} has no tensors for {missing[:5]}; re-run convert")
+
+    # share inference-cache entries with from_pretrained loads of the same checkpoint
+    model.cache_name = model_name
+    model.cache_revision = getattr(config, "source_revision", None) or local_revision(out_dir)
+    return model.eval(), tokenizer
+
+
+def has(model_name, root=MODEL_STORE_DIR):
+    return os.path.exists(os.path.join(store_dir(model_name, root), WEIGHTS_FILE))
+
+
+# ----------------------------------
+# Memory check
+# ----------------------------------
+
+def rss_breakdown(pid="self"):
+    """MB of resident memory from /proc/<pid>/smaps_rollup: rss, pss, shared, unique (private)."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss_mb": fields.get("Rss", 0.0),
+        "pss_mb": fields.get("Pss", 0.0),
+        "shared_mb": fields.get("Shared_Clean", 0.0) + fields.get("Shared_Dirty", 0.0),
+        "unique_mb": fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0),
+    }
+
+
+def _worker(model_names, root, baseline, ready, done, results):
+    torch.set_num_threads(1)
+    start = time.perf_counter()
+    models = []
+    for name in model_names:
+        if baseline:
+            model = AutoModelForSequenceClassification.from_pretrained(name).eval()
+            tokenizer = AutoTokenizer.from_pretrained(name, max_len=512)
+        else:
+            model, tokenizer = load(name, root)
+        models.append((model, tokenizer))
+    load_seconds = time.perf_counter() - start
+
+    # a forward pass per model, so every weight page is actually resident
+    with torch.inference_mode():
+        for model, tokenizer in models:
+            model(**tokenizer(["climate risk disclosure"] * 4, return_tensors="pt"))
+
+    # measure only once every worker has loaded, so shared pages count as shared
+    ready.wait()
+    results.put({"pid": os.getpid(), "load_s": round(load_seconds, 3), **rss_breakdown()})
+    done.wait()
+
+
+def check(model_names, workers=4, root=MODEL_STORE_DIR, baseline=False):
+    ctx = mp.get_context("spawn")
+    ready = ctx.Barrier(workers + 1)
+    done = ctx.Event()
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(model_names, root, baseline, ready, done, results)) for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+    ready.wait()
+    rows = [results.get() for _ in procs]
+    done.set()
+    for proc in procs:
+        proc.join()
+    return sorted(rows, key=lambda row: row["pid"])
+
+
+def main():
+    import main as scorer
+
+    parser = argparse.ArgumentParser(description="Memory-mapped local store of the scoring checkpoints.")
+    parser.add_argument("cmd", choices=["convert", "check"])
+    parser.add_argument("--root", default=MODEL_STORE_DIR)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--baseline", action="store_true", help="check: load with from_pretrained instead")
+    args = parser.parse_args()
+
+    model_names = list(scorer.HEAD_MODELS.values())
+    if args.cmd == "convert":
+        for name in model_names:
+            print(f"{name} -> {convert(name, args.root)}")
+        return
+
+    rows = check(model_names, args.workers, args.root, args.baseline)
+    print(f"{'pid':>8s} {'load_s':>7s} {'rss_mb':>8s} {'pss_mb':>8s} {'shared_mb':>10s} {'unique_mb':>10s}")
+    for row in rows:
+        print(f"{row['pid']:8d} {row['load_s']:7.2f} {row['rss_mb']:8.1f} {row['pss_mb']:8.1f} "
+              f"{row['shared_mb']:10.1f} {row['unique_mb']:10.1f}")
+    print(json.dumps({
+        "source": "from_pretrained" if args.baseline else args.root,
+        "total_pss_mb": round(sum(row["pss_mb"] for row in rows), 1),
+        "total_unique_mb": round(sum(row["unique_mb"] for row in rows), 1),
+    }))
+
+
+if __name__ == "__main__":
+    main()
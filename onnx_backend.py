@@ -0,0 +1,248 @@
+"""
+CPU inference backend: ONNX Runtime export with optional dynamic int8 quantization.
+
+Each ClimateBERT classifier is exported once to onnx_models/<name>/model.onnx
+(and model.int8.onnx when quantized). `load_onnx_pipe` returns an object that
+behaves like the transformers text-classification pipeline used in main.py,
+so run_binary_classifier, relatedness and climatetcfd work unchanged.
+
+Accuracy check (fp32 torch vs ONNX fp32 vs ONNX int8 on the chunk corpus):
+
+    python onnx_backend.py [--limit 200] [--intra-op 4] [--inter-op 1]
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import onnxruntime as ort
+import torch
+from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+
+from inference_cache import local_revision
+
+ONNX_DIR = "onnx_models"
+CHUNK_DIR = "data/processed_txt_2024"
+
+
+def export_dir(model_name, onnx_dir=ONNX_DIR):
+    return os.path.join(onnx_dir, model_name.strip("/").replace("/", "__"))
+
+
+def export_onnx(model_name, onnx_dir=ONNX_DIR):
+    """Export a sequence classifier to ONNX (fp32). Skips work if already exported."""
+    out_dir = export_dir(model_name, onnx_dir)
+    onnx_path = os.path.join(out_dir, "model.onnx")
+    if os.path.exists(onnx_path):
+        return out_dir
+
+    os.makedirs(out_dir, exist_ok=True)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+    tokenizer = AutoTokenizer.from_pretrained(model_name, max_len=512)
+
+    dummy = tokenizer(["climate risk disclosure"], return_tensors="pt")
+    with torch.inference_mode():
+        torch.onnx.export(
+            model,
+            (dummy["input_ids"], dummy["attention_mask"]),
+            onnx_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"},
+            },
+            opset_version=17,
+            dynamo=False,
+        )
+
+    # remember which checkpoint revision the export came from
+    model.config.source_revision = getattr(model.config, "_commit_hash", None) or local_revision(model_name)
+    model.config.save_pretrained(out_dir)
+    tokenizer.save_pretrained(out_dir)
+    return out_dir
+
+
+def quantize_int8(out_dir):
+    """Dynamic (weight-only, int8) quantization of an exported model."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    int8_path = os.path.join(out_dir, "model.int8.onnx")
+    if not os.path.exists(int8_path):
+        quantize_dynamic(
+            os.path.join(out_dir, "model.onnx"),
+            int8_path,
+            weight_type=QuantType.QInt8,
+        )
+    return int8_path
+
+
+class OnnxOutput:
+    def __init__(self, logits):
+        self.logits = logits
+
+
+class OnnxSequenceClassifier:
+    """
+    Minimal stand-in for a transformers sequence classifier backed by an
+    ONNX Runtime session: model(**batch).logits, .config, .device, .eval().
+    """
+
+    def __init__(self, onnx_path, config, intra_op_threads=0, inter_op_threads=0,
+                 cache_name=None, cache_revision=None):
+        options = ort.SessionOptions()
+        # 0 lets ONNX Runtime pick based on the machine
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.config = config
+        self.device = torch.device("cpu")
+        self.nbytes = os.path.getsize(onnx_path)
+
+        # key inference-cache entries to the source checkpoint + backend
+        self.cache_name = cache_name or config._name_or_path
+        self.cache_revision = cache_revision
+    def eval(self):
+        return self
+
+    def __call__(self, input_ids, attention_mask, **_):
+        logits = self.session.run(
+            ["logits"],
+            {
+                "input_ids": np.asarray(input_ids, dtype=np.int64),
+                "attention_mask": np.asarray(attention_mask, dtype=np.int64),
+            },
+        )[0]
+        return OnnxOutput(torch.from_numpy(logits))
+
+
+class OnnxTextClassificationPipeline:
+    """
+    Drop-in for pipeline("text-classification", ...): accepts a string, a list
+    of strings or a KeyDataset and yields {"label", "score"} per input, in order.
+    """
+
+    def __init__(self, model, tokenizer, batch_size=16, max_length=512):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def _predict(self, texts):
+        batch = self.tokenizer(
+            texts,
+            truncation=True,
+            padding=True,
+            max_length=self.max_length,
+            return_tensors="np",
+        )
+        probs = self.model(batch["input_ids"], batch["attention_mask"]).logits.softmax(dim=-1)
+        scores, label_ids = probs.max(dim=-1)
+        id2label = self.model.config.id2label
+        return [
+            {"label": id2label[label_id], "score": score}
+            for label_id, score in zip(label_ids.tolist(), scores.tolist())
+        ]
+
+    def _iter(self, inputs):
+        batch = []
+        for text in inputs:
+            batch.append(text)
+            if len(batch) == self.batch_size:
+                yield from self._predict(batch)
+                batch = []
+        if batch:
+            yield from self._predict(batch)
+
+    def __call__(self, inputs, batch_size=None):
+        if batch_size:
+            self.batch_size = batch_size
+        if isinstance(inputs, str):
+            return self._predict([inputs])[0]
+        if isinstance(inputs, list):
+            return list(self._iter(inputs))
+        return self._iter(inputs)
+
+
+def load_onnx_pipe(model_name, quantize=False, intra_op_threads=0, inter_op_threads=0, onnx_dir=ONNX_DIR):
+    out_dir = export_onnx(model_name, onnx_dir)
+    onnx_path = quantize_int8(out_dir) if quantize else os.path.join(out_dir, "model.onnx")
+
+    config = AutoConfig.from_pretrained(out_dir)
+    tokenizer = AutoTokenizer.from_pretrained(out_dir, max_len=512)
+    model = OnnxSequenceClassifier(
+        onnx_path, config, intra_op_threads, inter_op_threads,
+        cache_name=model_name,
+        cache_revision=f"{getattr(config, 'source_revision', 'local')}+{'onnx-int8' if quantize else 'onnx'}",
+    )
+    return OnnxTextClassificationPipeline(model, tokenizer)
+
+
+# ----------------------------------
+# Accuracy / throughput check
+# ----------------------------------
+
+def load_corpus(chunk_dir=CHUNK_DIR, limit=None):
+    texts = []
+    for path in sorted(glob.glob(os.path.join(chunk_dir, "*_chunks.txt"))):
+        with open(path, "r", encoding="utf-8") as f:
+            texts.extend(line for line in f.read().splitlines() if line)
+    return texts[:limit] if limit else texts
+
+
+def timed_labels(pipe, texts):
+    start = time.perf_counter()
+    labels = [out["label"] for out in pipe(texts, batch_size=16)]
+    return labels, len(texts) / (time.perf_counter() - start)
+
+
+def compare_backends(model_names, texts, intra_op_threads=0, inter_op_threads=0):
+    from main import _load_pipe_torch
+
+    rows = []
+    for model_name in model_names:
+        reference, ref_rate = timed_labels(_load_pipe_torch(model_name, device="cpu"), texts)
+        row = {"model": model_name, "torch_fp32_chunks_per_s": ref_rate}
+
+        for quantize in (False, True):
+            tag = "onnx_int8" if quantize else "onnx_fp32"
+            pipe = load_onnx_pipe(model_name, quantize, intra_op_threads, inter_op_threads)
+            labels, rate = timed_labels(pipe, texts)
+            row[f"{tag}_agreement"] = sum(a == b for a, b in zip(reference, labels)) / max(len(texts), 1)
+            row[f"{tag}_chunks_per_s"] = rate
+
+        rows.append(row)
+    return rows
+
+
+def main():
+    from main import HEAD_MODELS
+
+    parser = argparse.ArgumentParser(description="Compare ONNX fp32/int8 labels against fp32 torch.")
+    parser.add_argument("--chunk-dir", default=CHUNK_DIR)
+    parser.add_argument("--limit", type=int, default=None, help="only check the first N chunks")
+    parser.add_argument("--intra-op", type=int, default=0)
+    parser.add_argument("--inter-op", type=int, default=0)
+    args = parser.parse_args()
+
+    texts = load_corpus(args.chunk_dir, args.limit)
+    print(f"Checking {len(texts)} chunks from {args.chunk_dir}")
+
+    rows = compare_backends(HEAD_MODELS.values(), texts, args.intra_op, args.inter_op)
+
+    print(f"\n{'model':52s} {'fp32 agree':>10s} {'int8 agree':>10s} {'torch/s':>8s} {'fp32/s':>8s} {'int8/s':>8s}")
+    for row in rows:
+        print(
+            f"{row['model']:52s} {row['onnx_fp32_agreement']:10.4f} {row['onnx_int8_agreement']:10.4f} "
+            f"{row['torch_fp32_chunks_per_s']:8.1f} {row['onnx_fp32_chunks_per_s']:8.1f} "
+            f"{row['onnx_int8_chunks_per_s']:8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Parallel, page-streaming PDF text extraction.
+
+A report is written to a temp file once, then split into page ranges that
+worker processes open and extract independently (PyMuPDF is single-threaded
+per document, so processes are the only way to use more than one core).
+Page texts come back in page order through a bounded window of in-flight
+ranges, so the caller can chunk a 300-page report while holding only a few
+pages of text at a time.
+
+All documents share one process pool, so extraction of several reports
+(e.g. from the download threads in fetch_async) is spread over the same
+workers instead of each report starting its own pool.
+"""
+
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+PAGES_PER_TASK = 8
+# ranges in flight per document, bounds the page text held in memory
+WINDOW = 4
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(workers=None):
+    """The shared extraction pool (created on first use, `workers` defaults to os.cpu_count())."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # not fork: the caller runs fetcher threads, and forking a threaded
+            # process can leave a lock held forever in the child
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"))
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def extract_page_range(path, start, stop):
+    """Plain text of pages [start, stop) of the PDF at `path` (runs in a worker process)."""
+    with fitz.open(path) as doc:
+        return [doc[i].get_text("text") or "" for i in range(start, stop)]
+
+
+def iter_pdf_pages(pdf_bytes, pages_per_task=PAGES_PER_TASK, window=WINDOW, pool=None):
+    """
+    Yield the text of every page of a PDF, in order, extracted in parallel.
+    At most `window` ranges of `pages_per_task` pages are extracted ahead of
+    the consumer.
+    """
+    pool = pool or get_pool()
+
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_bytes)
+
+        with fitz.open(path) as doc:
+            n_pages = doc.page_count
+
+        ranges = deque((start, min(start + pages_per_task, n_pages)) for start in range(0, n_pages, pages_per_task))
+        in_flight = deque()
+        try:
+            while ranges or in_flight:
+                while ranges and len(in_flight) < window:
+                    start, stop = ranges.popleft()
+                    in_flight.append(pool.submit(extract_page_range, path, start, stop))
+                yield from in_flight.popleft().result()
+        finally:
+            # consumer stopped early or a range failed: don't leave work for a deleted file
+            for future in in_flight:
+                future.cancel()
+            for future in in_flight:
+                if not future.cancelled():
+                    future.exception()
+    finally:
+        os.remove(path)
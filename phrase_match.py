@@ -0,0 +1,178 @@
+"""
+Single-pass multi-phrase counting (Aho-Corasick).
+
+All green/red terms are compiled into one automaton, so each chunk is
+scanned once instead of once per regex. Counts are the same as
+len(re.findall(rf"\\b{re.escape(term)}\\b", text, re.IGNORECASE)) for every
+term, including terms that start or end in a non-word character ("1.5°",
+"may "), where \\b means the neighbouring character must be a word character.
+
+Uses pyahocorasick when it is installed, otherwise a pure-Python automaton
+(same results, slower).
+"""
+
+import json
+import os
+import re
+from collections import deque
+from multiprocessing import Pool
+
+import pandas as pd
+
+try:
+    import ahocorasick
+except ImportError:  # optional, pure-Python fallback below
+    ahocorasick = None
+
+# next to this module, so imports from outside the repo still find it
+TERMS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "terms.json")
+
+
+def load_terms(path=TERMS_PATH):
+    """{group: [terms]} from a JSON file, e.g. {"green": [...], "red": [...]}."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _is_word(ch):
+    # same definition as \w for str patterns in re
+    return ch.isalnum() or ch == "_"
+
+
+class _PyAutomaton:
+    """Minimal Aho-Corasick automaton with pyahocorasick's add_word/iter interface."""
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+
+    def add_word(self, word, value):
+        node = 0
+        for ch in word:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            node = nxt
+        self.out[node].append(value)
+
+    def make_automaton(self):
+        # breadth-first, so every fail target is finished before it is used
+        queue = deque(self.goto[0].values())  # depth-1 nodes fail to the root
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def iter(self, text):
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for end, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for value in out[node]:
+                yield end, value
+
+
+class PhraseMatcher:
+    def __init__(self, groups):
+        """groups: {group name: [terms]}; a term may appear in several groups."""
+        self.groups = {name: list(terms) for name, terms in groups.items()}
+        self.terms = list(dict.fromkeys(t for terms in self.groups.values() for t in terms if t))
+
+        # exactly the regexes word_counts used, for texts where lower() changes length
+        self._patterns = [re.compile(rf"\b{re.escape(t)}\b", flags=re.IGNORECASE) for t in self.terms]
+
+        automaton = ahocorasick.Automaton() if ahocorasick is not None else _PyAutomaton()
+        by_key = {}
+        for i, term in enumerate(self.terms):
+            by_key.setdefault(term.lower(), []).append(i)
+        for key, ids in by_key.items():
+            automaton.add_word(key, (len(key), ids))
+        automaton.make_automaton()
+        self._automaton = automaton
+
+        # which side of each term needs a \b check: the term's own edge character
+        # decides whether the neighbour must be a non-word or a word character
+        self._edges = [(_is_word(t[0]), _is_word(t[-1])) for t in self.terms]
+
+    def count_terms(self, text):
+        """Hits per term (list aligned with self.terms)."""
+        counts = [0] * len(self.terms)
+        if not isinstance(text, str) or not text:
+            return counts
+
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # rare characters whose lowercase form is longer: offsets would not line up
+            return [len(p.findall(text)) for p in self._patterns]
+
+        n = len(text)
+        last_end = [0] * len(self.terms)
+        for end, (length, ids) in self._automaton.iter(lowered):
+            start = end - length + 1
+            stop = end + 1
+            for i in ids:
+                # regex findall never reports overlapping matches of one term
+                if start < last_end[i]:
+                    continue
+                first_word, last_word = self._edges[i]
+                before = start > 0 and _is_word(text[start - 1])
+                after = stop < n and _is_word(text[stop])
+                if before == first_word or after == last_word:
+                    continue
+                counts[i] += 1
+                last_end[i] = stop
+        return counts
+
+    def count(self, text):
+        """{term: hits} plus {"<group>_hits": total} for every group."""
+        counts = dict(zip(self.terms, self.count_terms(text)))
+        for name, terms in self.groups.items():
+            counts[f"{name}_hits"] = sum(counts[t] for t in terms if t)
+        return counts
+
+    def count_frame(self, texts, workers=None, chunksize=2000):
+        """
+        Per-term columns plus <group>_hits for every text, as a DataFrame
+        aligned with `texts`. Chunks of `chunksize` texts are counted in
+        parallel over `workers` processes (1 = in this process).
+        """
+        texts = list(texts)
+        batches = [texts[i:i + chunksize] for i in range(0, len(texts), chunksize)]
+        if workers == 1 or len(batches) <= 1:
+            rows = [row for batch in batches for row in _count_batch(self, batch)]
+        else:
+            with Pool(workers, initializer=_init_worker, initargs=(self.groups,)) as pool:
+                rows = [row for part in pool.imap(_count_worker_batch, batches) for row in part]
+
+        df = pd.DataFrame(rows, columns=self.terms)
+        for name, terms in self.groups.items():
+            df[f"{name}_hits"] = df[list(dict.fromkeys(t for t in terms if t))].sum(axis=1)
+        return df
+
+
+def _count_batch(matcher, texts):
+    return [matcher.count_terms(text) for text in texts]
+
+
+_worker_matcher = None
+
+
+def _init_worker(groups):
+    global _worker_matcher
+    _worker_matcher = PhraseMatcher(groups)
+
+
+def _count_worker_batch(texts):
+    return _count_batch(_worker_matcher, texts)
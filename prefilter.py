@@ -0,0 +1,328 @@
+"""
+Cheap lexical gate in front of the climate detector.
+
+A logistic regression over hashed word n-grams (plus a few shape tokens for
+numeric tables and table-of-contents lines), trained on past detector
+output: a chunk in data/processed_txt_2024/<T>_2024_chunks.txt is positive
+if the detector kept it, i.e. it is in data/model_outputs/<T>_2024_chunks_related.txt.
+Chunks the gate scores below its threshold are treated as detector "no"
+without running the transformer; everything else still goes to the detector.
+
+    python prefilter.py train --target-recall 0.995     # fit, pick threshold, save data/prefilter.npz
+    python prefilter.py report --out prefilter_recall.csv
+
+train picks the threshold from out-of-fold scores (folds split by ticker, so
+a report is never scored by a model that saw it), and prints the recall
+report: for each threshold the share of chunks (and characters, a proxy for
+detector tokens) that would be skipped, the share of detector-kept chunks
+that would still reach the detector, and how far that moves each report's
+relatedness. Skipped chunks count as a confident "no", so relatedness only
+stays put if the gate skips chunks the detector was confident about; which
+chunks those are is read from data/probs/<name>.npz where it exists.
+
+main.py uses the gate when PREFILTER points at a saved model.
+"""
+
+import argparse
+import glob
+import os
+import re
+import zlib
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.optimize import minimize
+
+from aggregate import DEFAULT_THRESHOLD, PROBS_DIR
+from funcs import read_chunk_lines, unquote_related
+
+PREFILTER_PATH = "data/prefilter.npz"
+CHUNK_DIR = "data/processed_txt_2024"
+OUTPUTS_DIR = "data/model_outputs"
+
+N_FEATURES = 2 ** 18
+NGRAMS = 2
+L2 = 1e-6
+FOLDS = 5
+REPORT_THRESHOLDS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.03, 0.05, 0.075, 0.1, 0.15, 0.2, 0.25, 0.3, 0.4, 0.5]
+
+_TOKEN = re.compile(r"[a-z]+|\d+(?:[.,]\d+)*|[^\w\s]")
+
+
+# ----------------------------------
+# Features
+# ----------------------------------
+
+def _bucket(value, edges):
+    return int(np.searchsorted(edges, value, side="right"))
+
+
+def doc_terms(text, ngrams=NGRAMS):
+    """Word n-grams (numbers collapsed to <num>) plus shape tokens."""
+    tokens = ["<num>" if t[0].isdigit() else t for t in _TOKEN.findall(text.lower())]
+    words = [t for t in tokens if t[0].isalpha() or t == "<num>"]
+    terms = list(tokens)
+    for n in range(2, ngrams + 1):
+        terms.extend(" ".join(words[i:i + n]) for i in range(len(words) - n + 1))
+
+    # numeric tables and "...... 12" contents lines look alike whatever the words
+    n_tokens = max(len(tokens), 1)
+    terms.append(f"__num_share_{_bucket(tokens.count('<num>') / n_tokens, [0.05, 0.1, 0.2, 0.3, 0.5])}")
+    terms.append(f"__punct_share_{_bucket((len(tokens) - len(words)) / n_tokens, [0.05, 0.1, 0.2, 0.3, 0.5])}")
+    terms.append(f"__length_{_bucket(len(tokens), [10, 25, 50, 100])}")
+    return terms
+
+
+def vectorize(texts, n_features=N_FEATURES, ngrams=NGRAMS):
+    """CSR of log(1 + tf) over hashed terms, rows L2-normalized."""
+    indptr = [0]
+    indices = []
+    data = []
+    mask = n_features - 1
+    for text in texts:
+        counts = {}
+        for term in doc_terms(text, ngrams):
+            # crc32 rather than hash(): stable across processes
+            j = zlib.crc32(term.encode("utf-8")) & mask
+            counts[j] = counts.get(j, 0) + 1
+        indices.extend(counts.keys())
+        data.extend(counts.values())
+        indptr.append(len(indices))
+
+    X = sp.csr_matrix(
+        (np.log1p(np.array(data, dtype=np.float64)), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+        shape=(len(indptr) - 1, n_features),
+    )
+    norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sp.diags(1.0 / norms) @ X
+
+
+# ----------------------------------
+# Model
+# ----------------------------------
+
+class Prefilter:
+    def __init__(self, weights, bias, threshold=0.0, n_features=N_FEATURES, ngrams=NGRAMS):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = float(bias)
+        self.threshold = float(threshold)
+        self.n_features = n_features
+        self.ngrams = ngrams
+
+    @classmethod
+    def fit(cls, texts, labels, l2=L2, n_features=N_FEATURES, ngrams=NGRAMS, X=None):
+        X = vectorize(texts, n_features, ngrams) if X is None else X
+        y = np.asarray(labels, dtype=np.float64)
+        n = X.shape[0]
+
+        def loss(params):
+            w, b = params[:-1], params[-1]
+            z = X @ w + b
+            p = 1.0 / (1.0 + np.exp(-z))
+            value = np.mean(np.logaddexp(0.0, z) - y * z) + 0.5 * l2 * w @ w
+            residual = (p - y) / n
+            grad = np.empty_like(params)
+            grad[:-1] = X.T @ residual + l2 * w
+            grad[-1] = residual.sum()
+            return value, grad
+
+        result = minimize(loss, np.zeros(n_features + 1), jac=True, method="L-BFGS-B", options={"maxiter": 500})
+        return cls(result.x[:-1], result.x[-1], n_features=n_features, ngrams=ngrams)
+
+    def scores(self, texts=None, X=None):
+        """Probability that the detector would keep each chunk."""
+        X = vectorize(texts, self.n_features, self.ngrams) if X is None else X
+        return 1.0 / (1.0 + np.exp(-(X @ self.weights + self.bias)))
+
+    def keep(self, texts):
+        """Boolean mask of the chunks that still need the detector."""
+        texts = list(texts)
+        if not texts:
+            return np.zeros(0, dtype=bool)
+        return self.scores(texts) >= self.threshold
+
+    def save(self, path=PREFILTER_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # most hashed columns never occur, store only the non-zero weights
+        nonzero = np.flatnonzero(self.weights)
+        np.savez_compressed(
+            path,
+            index=nonzero.astype(np.int64),
+            weights=self.weights[nonzero],
+            bias=np.array(self.bias),
+            threshold=np.array(self.threshold),
+            n_features=np.array(self.n_features),
+            ngrams=np.array(self.ngrams),
+        )
+
+    @classmethod
+    def load(cls, path=PREFILTER_PATH):
+        with np.load(path) as data:
+            weights = np.zeros(int(data["n_features"]), dtype=np.float64)
+            weights[data["index"]] = data["weights"]
+            return cls(weights, float(data["bias"]), float(data["threshold"]),
+                       int(data["n_features"]), int(data["ngrams"]))
+
+
+# ----------------------------------
+# Training data and recall report
+# ----------------------------------
+
+def load_training_data(chunk_dir=CHUNK_DIR, outputs_dir=OUTPUTS_DIR, probs_dir=PROBS_DIR):
+    """
+    One row per chunk of every report that has detector output:
+    ticker, text, label (1 = kept by the detector) and confident (the
+    detector's top score was >= DEFAULT_THRESHOLD; assumed True for reports
+    without stored probabilities).
+    """
+    rows = []
+    for related_path in sorted(glob.glob(os.path.join(outputs_dir, "*_chunks_related.txt"))):
+        chunk_path = os.path.join(chunk_dir, os.path.basename(related_path).replace("_related", ""))
+        if not os.path.exists(chunk_path):
+            continue
+        ticker = os.path.basename(related_path).split("_")[0].upper()
+        with open(related_path, encoding="utf-8") as f:
+            kept = {unquote_related(line) for line in f.read().splitlines()}
+        lines = read_chunk_lines(chunk_path)
+        confident = _confident_lines(chunk_path, len(lines), probs_dir)
+        for line, is_confident in zip(lines, confident):
+            text = unquote_related(line)
+            if text.strip().strip('"'):
+                rows.append((ticker, text, int(text in kept), bool(is_confident)))
+    return pd.DataFrame(rows, columns=["ticker", "text", "label", "confident"])
+
+
+def _confident_lines(chunk_path, n_lines, probs_dir=PROBS_DIR):
+    """Per chunk line, whether the stored detector score clears DEFAULT_THRESHOLD."""
+    name = os.path.splitext(os.path.basename(chunk_path))[0]
+    probs_path = os.path.join(probs_dir, f"{name}.npz")
+    if os.path.exists(probs_path):
+        with np.load(probs_path) as data:
+            relate = data["relate"]
+        # rows are chunk lines (funcs.read_chunk_lines); a stale file is ignored
+        if len(relate) == n_lines:
+            return relate.max(axis=1) >= DEFAULT_THRESHOLD
+    return np.ones(n_lines, dtype=bool)
+
+
+def out_of_fold_scores(df, folds=FOLDS, l2=L2, X=None):
+    """Gate scores for every chunk from models that never saw its ticker."""
+    X = vectorize(df["text"]) if X is None else X
+    tickers = np.array(sorted(df["ticker"].unique()))
+    fold_of = dict(zip(tickers, np.arange(len(tickers)) % folds))
+    fold = df["ticker"].map(fold_of).to_numpy()
+
+    scores = np.zeros(len(df))
+    labels = df["label"].to_numpy()
+    for k in range(min(folds, len(tickers))):
+        test = fold == k
+        model = Prefilter.fit(None, labels[~test], l2=l2, X=X[~test])
+        scores[test] = model.scores(X=X[test])
+    return scores
+
+
+def recall_report(labels, scores, lengths, thresholds=REPORT_THRESHOLDS, groups=None, confident=None):
+    """
+    Per threshold: chunks and characters the detector would skip, the recall
+    of detector-kept chunks (those that still reach the detector), and the
+    change in relatedness when skipped chunks count as a confident "no":
+    mean over reports (`groups`, one report if None) and the largest.
+    `confident` marks the chunks the detector scored >= DEFAULT_THRESHOLD
+    (all of them if None).
+    """
+    labels = np.asarray(labels, dtype=bool)
+    lengths = np.asarray(lengths, dtype=np.float64)
+    confident = np.ones(len(labels), dtype=bool) if confident is None else np.asarray(confident, dtype=bool)
+    groups = np.zeros(len(labels), dtype=np.int64) if groups is None else pd.factorize(np.asarray(groups))[0]
+    n_groups = groups.max() + 1 if len(groups) else 0
+
+    def relatedness(kept, total):
+        kept = np.bincount(groups, weights=kept, minlength=n_groups)
+        total = np.bincount(groups, weights=total, minlength=n_groups)
+        return np.divide(kept, total, out=np.zeros(n_groups), where=total > 0)
+
+    ungated = relatedness(labels, confident)
+    rows = []
+    for threshold in thresholds:
+        skipped = scores < threshold
+        lost = int((skipped & labels).sum())
+        change = relatedness(labels & ~skipped, confident | skipped) - ungated
+        rows.append({
+            "threshold": threshold,
+            "skipped_chunks": float(skipped.mean()) if len(skipped) else 0.0,
+            "skipped_chars": float(lengths[skipped].sum() / lengths.sum()) if lengths.sum() else 0.0,
+            "recall": 1.0 - lost / labels.sum() if labels.sum() else 1.0,
+            "lost_chunks": lost,
+            "relate_change": float(change.mean()) if n_groups else 0.0,
+            "max_relate_change": float(change[np.abs(change).argmax()]) if n_groups else 0.0,
+        })
+    return pd.DataFrame(rows)
+
+
+def pick_threshold(report, target_recall):
+    """Highest threshold whose recall is still >= target_recall (0 if none is)."""
+    ok = report[report["recall"] >= target_recall]
+    return float(ok["threshold"].max()) if len(ok) else 0.0
+
+
+def _print_report(report, threshold):
+    print(f"\n{'threshold':>9s} {'skip chunks':>12s} {'skip chars':>11s} {'recall':>8s} {'lost':>6s} "
+          f"{'relate chg':>10s} {'max chg':>8s}")
+    for row in report.itertuples():
+        mark = "  <-" if row.threshold == threshold else ""
+        print(f"{row.threshold:9.3f} {row.skipped_chunks:12.1%} {row.skipped_chars:11.1%} "
+              f"{row.recall:8.2%} {row.lost_chunks:6d} {row.relate_change:+10.4f} {row.max_relate_change:+8.4f}{mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and evaluate the lexical prefilter for the climate detector.")
+    parser.add_argument("--model", default=PREFILTER_PATH)
+    parser.add_argument("--chunk-dir", default=CHUNK_DIR)
+    parser.add_argument("--outputs-dir", default=OUTPUTS_DIR)
+    parser.add_argument("--out", default=None, help="write the recall report to this CSV")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    train = sub.add_parser("train", help="fit on every report, threshold from out-of-fold recall")
+    train.add_argument("--target-recall", type=float, default=0.995)
+    train.add_argument("--threshold", type=float, default=None, help="fixed threshold instead of --target-recall")
+    train.add_argument("--l2", type=float, default=L2)
+    train.add_argument("--folds", type=int, default=FOLDS)
+
+    sub.add_parser("report", help="recall of a saved model against the current detector outputs")
+    args = parser.parse_args()
+
+    df = load_training_data(args.chunk_dir, args.outputs_dir)
+    if df.empty:
+        raise SystemExit(f"No chunk files in {args.chunk_dir} with detector output in {args.outputs_dir}")
+    print(f"{len(df)} chunks from {df['ticker'].nunique()} reports, {df['label'].mean():.1%} kept by the detector")
+
+    X = vectorize(df["text"])
+    lengths = df["text"].str.len().to_numpy()
+
+    if args.cmd == "train":
+        scores = out_of_fold_scores(df, args.folds, args.l2, X=X)
+        report = recall_report(df["label"], scores, lengths, groups=df["ticker"], confident=df["confident"])
+        threshold = args.threshold if args.threshold is not None else pick_threshold(report, args.target_recall)
+
+        model = Prefilter.fit(None, df["label"], l2=args.l2, X=X)
+        model.threshold = threshold
+        model.save(args.model)
+        print(f"Out-of-fold recall report ({args.folds} folds by ticker):")
+        _print_report(report, threshold)
+        print(f"\nSaved {args.model} with threshold {threshold}")
+    else:
+        model = Prefilter.load(args.model)
+        # in-sample if these reports were in the training data
+        thresholds = sorted({*REPORT_THRESHOLDS, model.threshold})
+        report = recall_report(df["label"], model.scores(X=X), lengths, thresholds, df["ticker"], df["confident"])
+        _print_report(report, model.threshold)
+
+    if args.out:
+        report.to_csv(args.out, index=False)
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,113 @@
+"""
+Chunk the Kaggle sustainability_reports corpus into the training text format:
+one quoted 500-character line per chunk, a blank line between companies.
+
+    python process_text.py                              # full output + the first-5 sample
+    python process_text.py --samples 5 50 --workers 8   # any number of first-N samples
+
+The CSV is read BATCH_ROWS rows at a time and the batches are chunked in a
+process pool. At most WINDOW batches per worker are in flight and results
+are written in submission order, so memory stays flat however large the CSV
+is and the output is the same, row for row, as a serial run. The full output
+and every sample are written in that single pass.
+"""
+
+import argparse
+import os
+from collections import deque
+from multiprocessing import Pool
+
 import pandas as pd
-import textwrap
+
 import funcs
 
-reports = pd.read_csv("data/kaggle_old/sustainability_reports.csv")
-preprocessed_content = reports['preprocessed_content']
+REPORTS_CSV = "data/kaggle_old/sustainability_reports.csv"
+FULL_OUTPUT = "data/kaggle_old/processed_reports_text.txt"
+SAMPLE_OUTPUT = "data/kaggle_old/processed_reports_sample_{n}.txt"
+TEXT_COLUMN = "preprocessed_content"
+
+BATCH_ROWS = 64
+# batches in flight per worker: bounds the raw and chunked text held in memory
+WINDOW = 2
+
+
+def chunk_batch(texts, width=500):
+    """One block of output per row: its chunk lines, then the blank line between companies."""
+    return ["".join(line + "\n" for line in funcs.split_and_quote(text, width=width)) + "\n" for text in texts]
+
+
+def iter_row_batches(path=REPORTS_CSV, batch_rows=BATCH_ROWS):
+    for batch in pd.read_csv(path, usecols=[TEXT_COLUMN], chunksize=batch_rows):
+        yield batch[TEXT_COLUMN].tolist()
+
+
+def iter_chunked(batches, workers=None, window=WINDOW):
+    """
+    Yield the output block of every row, in input order, chunking batches in
+    `workers` processes (1 = in this process) with at most `window` batches
+    per worker submitted ahead of the consumer.
+    """
+    if workers == 1:
+        for texts in batches:
+            yield from chunk_batch(texts)
+        return
+
+    workers = workers or os.cpu_count()
+    with Pool(workers) as pool:
+        in_flight = deque()
+        for texts in batches:
+            in_flight.append(pool.apply_async(chunk_batch, (texts,)))
+            if len(in_flight) >= window * workers:
+                yield from in_flight.popleft().get()
+        while in_flight:
+            yield from in_flight.popleft().get()
 
-# Apply to each row
-reports["processed_lines"] = reports["preprocessed_content"].apply(funcs.split_and_quote)
 
-# 1) Save FULL DATASET
-full_output_path = "data/kaggle_old/processed_reports_text.txt"
+def write_outputs(blocks, full_path=FULL_OUTPUT, samples=(5,)):
+    """
+    Write every block to `full_path` and the first n to the sample file for
+    each n in `samples`, in one pass. Files are written to .tmp and only
+    replace the old outputs once complete. Returns the number of rows.
+    """
+    paths = {full_path: None}
+    paths.update({SAMPLE_OUTPUT.format(n=n): n for n in samples})
+    files = {path: open(path + ".tmp", "w", encoding="utf-8") for path in paths}
+    n_rows = 0
+    try:
+        for block in blocks:
+            for path, f in files.items():
+                limit = paths[path]
+                if limit is None or n_rows < limit:
+                    f.write(block)
+            n_rows += 1
+    except BaseException:
+        for path, f in files.items():
+            f.close()
+            os.remove(path + ".tmp")
+        raise
 
-with open(full_output_path, "w", encoding="utf-8") as f:
-    for lines in reports["processed_lines"]:
-        for line in lines:
-            f.write(line + "\n")
-        f.write("\n")   # blank line between companies
+    for path, f in files.items():
+        f.close()
+        os.replace(path + ".tmp", path)
+    return n_rows
 
-print("Saved full dataset to:", full_output_path)
 
+def main():
+    parser = argparse.ArgumentParser(description="Chunk sustainability_reports.csv into the training text format.")
+    parser.add_argument("--csv", default=REPORTS_CSV)
+    parser.add_argument("--out", default=FULL_OUTPUT)
+    parser.add_argument("--samples", type=int, nargs="*", default=[5], help="also write the first N companies, for each N")
+    parser.add_argument("--workers", type=int, default=None, help="chunking processes (default os.cpu_count(), 1 = serial)")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS, help="CSV rows read and chunked per task")
+    args = parser.parse_args()
 
-# 2) Save SAMPLE OF 5 COMPANIES
-# Choose first 5 — OR use: reports.sample(5, random_state=42)
-sample_df = reports.iloc[:5]
+    blocks = iter_chunked(iter_row_batches(args.csv, args.batch_rows), args.workers)
+    n_rows = write_outputs(blocks, args.out, args.samples)
 
-sample_output_path = "data/kaggle_old/processed_reports_sample_5.txt"
+    print(f"Saved full dataset ({n_rows} companies) to: {args.out}")
+    for n in args.samples:
+        print(f"Saved sample of {min(n, n_rows)} companies to: {SAMPLE_OUTPUT.format(n=n)}")
 
-with open(sample_output_path, "w", encoding="utf-8") as f:
-    for lines in sample_df["processed_lines"]:
-        for line in lines:
-            f.write(line + "\n")
-        f.write("\n")   # blank line between companies
 
-print("Saved sample dataset to:", sample_output_path)
+if __name__ == "__main__":
+    main()
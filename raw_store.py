@@ -0,0 +1,141 @@
+"""
+Local content-addressed store of downloaded report bytes.
+
+    data/raw/objects/<hh>/<sha256>     raw PDF/HTML bytes, one file per distinct content
+    data/raw/manifest.sqlite           url -> sha256, ETag, Last-Modified, fetch time
+
+Re-scrapes send If-None-Match / If-Modified-Since from the manifest, and a
+304 is served from the local copy, so changing the chunk width or the
+extractor never needs the network:
+
+    python data_scrape.py --rechunk      # re-extract every stored report locally
+    python data_scrape.py --refresh      # conditional re-fetch of every URL
+"""
+
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+RAW_DIR = "data/raw"
+
+
+def content_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+class RawStore:
+    def __init__(self, root=RAW_DIR):
+        self.root = root
+        self.objects = os.path.join(root, "objects")
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(self.objects, exist_ok=True)
+            self._conn = sqlite3.connect(os.path.join(self.root, "manifest.sqlite"), check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS manifest (
+                    url TEXT PRIMARY KEY,
+                    hash TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_type TEXT,
+                    fetched_at REAL NOT NULL,
+                    checked_at REAL NOT NULL
+                )
+                """
+            )
+        return self._conn
+
+    # ---------- objects ----------
+
+    def path(self, key):
+        return os.path.join(self.objects, key[:2], key)
+
+    def has(self, key):
+        return os.path.exists(self.path(key))
+
+    def put(self, content):
+        """Store `content` (if not already present) and return its hash."""
+        key = content_hash(content)
+        path = self.path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write + rename so a crash never leaves a truncated object under a valid hash
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp, path)
+        return key
+
+    def get(self, key):
+        with open(self.path(key), "rb") as f:
+            return f.read()
+
+    # ---------- manifest ----------
+
+    def entry(self, url):
+        """Manifest row for `url` as a dict, or None if it was never stored (or its object is gone)."""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT hash, etag, last_modified, content_type, fetched_at, checked_at FROM manifest WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if row is None or not self.has(row[0]):
+            return None
+        keys = ["hash", "etag", "last_modified", "content_type", "fetched_at", "checked_at"]
+        return dict(zip(keys, row))
+
+    def load_url(self, url):
+        """Stored bytes for `url`, or None."""
+        entry = self.entry(url)
+        return self.get(entry["hash"]) if entry else None
+
+    def urls(self):
+        with self._lock:
+            return [row[0] for row in self._connect().execute("SELECT url FROM manifest ORDER BY url")]
+
+    def conditional_headers(self, url):
+        """If-None-Match / If-Modified-Since for a re-fetch of `url` ({} if nothing is stored)."""
+        entry = self.entry(url)
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def save_response(self, url, content, headers):
+        """Store a 200 response body and record its validators. Returns the content hash."""
+        key = self.put(content)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO manifest "
+                    "(url, hash, etag, last_modified, content_type, fetched_at, checked_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (url, key, headers.get("ETag"), headers.get("Last-Modified"),
+                     headers.get("Content-Type"), now, now),
+                )
+        return key
+
+    def not_modified(self, url):
+        """Handle a 304 for `url`: mark it checked and return the stored bytes."""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("UPDATE manifest SET checked_at = ? WHERE url = ?", (time.time(), url))
+        return self.load_url(url)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
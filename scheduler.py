@@ -0,0 +1,323 @@
+"""
+Resumable multi-worker scoring of many *_chunks.txt files.
+
+Work is tracked in a SQLite queue (data/score_queue.sqlite by default):
+
+    python scheduler.py data/processed_txt_2024 --workers 4
+    python scheduler.py "data/processed_txt_2024/x*_chunks.txt" --workers 2
+
+Each worker process keeps its own warm models (main.registry) and claims one
+file at a time. Restarting the command re-enqueues nothing that is already
+known and skips finished files. Claims carry a heartbeat, so files held by a
+crashed worker are picked up again once the lease expires (a file that has
+crashed its worker MAX_ATTEMPTS times is marked failed). Several machines
+can run the same command against one queue on a shared filesystem: the queue,
+and the inference cache as the workers open it, use SQLite's rollback
+journal rather than WAL, so they work over network mounts.
+
+Finished rows are appended to results.csv in enqueue order, under a file
+lock, and each row is written exactly once.
+"""
+
+import argparse
+import csv
+import fcntl
+import glob
+import io
+import json
+import multiprocessing as mp
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from aggregate import RESULT_COLUMNS
+
+QUEUE_PATH = "data/score_queue.sqlite"
+RESULTS_PATH = "results.csv"
+LEASE_SECONDS = 600
+MAX_ATTEMPTS = 3
+
+
+# ----------------------------------
+# Queue
+# ----------------------------------
+
+def connect(queue_path=QUEUE_PATH):
+    # autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+    conn = sqlite3.connect(queue_path, timeout=60, isolation_level=None)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            path TEXT NOT NULL UNIQUE,
+            status TEXT NOT NULL DEFAULT 'pending',
+            worker TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            heartbeat REAL,
+            result TEXT,
+            error TEXT
+        )
+        """
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    return conn
+
+
+@contextmanager
+def transaction(conn):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def expand_inputs(inputs):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(glob.glob(os.path.join(item, "*_chunks.txt"))))
+        else:
+            paths.extend(sorted(glob.glob(item)))
+    # the UNIQUE key must not depend on the working directory the command ran from
+    return [os.path.realpath(path) for path in paths]
+
+
+def enqueue(conn, paths):
+    with transaction(conn):
+        before = conn.total_changes
+        conn.executemany("INSERT OR IGNORE INTO jobs (path) VALUES (?)", [(path,) for path in paths])
+        return conn.total_changes - before
+
+
+def claim(conn, worker, lease=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+    """
+    Claim the next pending file, or one whose worker stopped heartbeating.
+    A file whose lease has already expired `max_attempts` times (it keeps
+    killing its worker) is marked failed instead, so export moves past it.
+    """
+    now = time.time()
+    with transaction(conn):
+        conn.execute(
+            """
+            UPDATE jobs SET status = 'failed',
+                            error = 'lease expired after ' || attempts || ' attempts, worker died'
+            WHERE status = 'running' AND heartbeat < ? AND attempts >= ?
+            """,
+            (now - lease, max_attempts),
+        )
+        row = conn.execute(
+            """
+            SELECT path FROM jobs
+            WHERE status = 'pending' OR (status = 'running' AND heartbeat < ?)
+            ORDER BY seq LIMIT 1
+            """,
+            (now - lease,),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', worker = ?, heartbeat = ?, attempts = attempts + 1 WHERE path = ?",
+            (worker, now, row[0]),
+        )
+        return row[0]
+
+
+def heartbeat(conn, path, worker):
+    with transaction(conn):
+        conn.execute(
+            "UPDATE jobs SET heartbeat = ? WHERE path = ? AND worker = ? AND status = 'running'",
+            (time.time(), path, worker),
+        )
+
+
+def finish(conn, path, worker, row):
+    with transaction(conn):
+        conn.execute(
+            "UPDATE jobs SET status = 'scored', result = ?, error = NULL WHERE path = ? AND worker = ?",
+            (json.dumps(row), path, worker),
+        )
+
+
+def fail(conn, path, worker, error, max_attempts=MAX_ATTEMPTS):
+    with transaction(conn):
+        conn.execute(
+            """
+            UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                            error = ?
+            WHERE path = ? AND worker = ?
+            """,
+            (max_attempts, error, path, worker),
+        )
+
+
+def status_counts(conn):
+    return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+# ----------------------------------
+# results.csv export
+# ----------------------------------
+
+@contextmanager
+def file_lock(path):
+    with open(path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def format_rows(rows, header):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=RESULT_COLUMNS)
+    if header:
+        writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+    return buf.getvalue().encode("utf-8")
+
+
+def export_results(conn, results_path=RESULTS_PATH):
+    """
+    Append scored rows to results.csv in enqueue order and mark them done.
+    Rows behind a file that is still pending/running wait for it, so the CSV
+    order matches the input order no matter which worker finishes first.
+    """
+    with file_lock(results_path + ".lock"), transaction(conn):
+        ready = []
+        for path, status, result in conn.execute(
+            "SELECT path, status, result FROM jobs WHERE status != 'done' ORDER BY seq"
+        ):
+            if status == "failed":
+                continue
+            if status != "scored":
+                break
+            ready.append((path, json.loads(result)))
+
+        if not ready:
+            return 0
+
+        rows = format_rows([row for _, row in ready], header=False)
+        size = os.path.getsize(results_path) if os.path.exists(results_path) else 0
+
+        # if a previous export wrote the rows but died before committing, the
+        # bytes after the last recorded size (the whole file before the first
+        # export) end with exactly these rows, after a header if the file was
+        # empty then. The live size already includes them, so it can't tell.
+        recorded = conn.execute("SELECT value FROM meta WHERE key = ?", (results_path,)).fetchone()
+        start = int(recorded[0]) if recorded is not None else 0
+        already_written = False
+        if size > start:
+            with open(results_path, "rb") as f:
+                f.seek(start)
+                already_written = f.read().endswith(rows)
+
+        if not already_written:
+            payload = format_rows([row for _, row in ready], header=size == 0)
+            with open(results_path, "ab") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            (results_path, str(os.path.getsize(results_path))),
+        )
+        conn.executemany("UPDATE jobs SET status = 'done' WHERE path = ?", [(path,) for path, _ in ready])
+        return len(ready)
+
+
+# ----------------------------------
+# Workers
+# ----------------------------------
+
+def worker_loop(queue_path, results_path, lease):
+    # imported here so each worker process loads (and keeps) its own models
+    import main
+    from inference_cache import InferenceCache
+
+    if main.cache is not None:
+        # workers on other machines may share this cache; WAL breaks over network mounts
+        main.cache = InferenceCache(main.cache.path, journal_mode="DELETE")
+
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    conn = connect(queue_path)
+    heads = None
+
+    while True:
+        path = claim(conn, worker, lease)
+        if path is None:
+            break
+
+        stop = threading.Event()
+
+        def beat():
+            beat_conn = connect(queue_path)
+            while not stop.wait(lease / 3):
+                heartbeat(beat_conn, path, worker)
+            beat_conn.close()
+
+        beater = threading.Thread(target=beat, daemon=True)
+        beater.start()
+
+        print(f"[{worker}] Processing {path} ...")
+        try:
+            heads = heads or main.load_heads()
+            row = main.run_all_metrics_for_file(path, heads=heads)
+        except Exception as e:
+            print(f"[{worker}] !! Failed {path}: {e}")
+            fail(conn, path, worker, repr(e))
+        else:
+            finish(conn, path, worker, row)
+        finally:
+            stop.set()
+            beater.join()
+
+        export_results(conn, results_path)
+
+    conn.close()
+
+
+def run(inputs, workers=1, queue_path=QUEUE_PATH, results_path=RESULTS_PATH, lease=LEASE_SECONDS):
+    conn = connect(queue_path)
+    added = enqueue(conn, expand_inputs(inputs))
+    print(f"Queued {added} new files, status: {status_counts(conn)}")
+
+    if workers <= 1:
+        worker_loop(queue_path, results_path, lease)
+    else:
+        # spawn so CUDA/tokenizer state is never forked
+        ctx = mp.get_context("spawn")
+        procs = [ctx.Process(target=worker_loop, args=(queue_path, results_path, lease)) for _ in range(workers)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+
+    exported = export_results(conn, results_path)
+    print(f"Exported {exported} remaining rows, status: {status_counts(conn)}")
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score many *_chunks.txt files with N resumable workers.")
+    parser.add_argument("inputs", nargs="+", help="directories (scans *_chunks.txt) or glob patterns")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--queue", default=QUEUE_PATH)
+    parser.add_argument("--results", default=RESULTS_PATH)
+    parser.add_argument("--lease", type=float, default=LEASE_SECONDS,
+                        help="seconds without a heartbeat before a claimed file is retried")
+    args = parser.parse_args()
+
+    run(args.inputs, args.workers, args.queue, args.results, args.lease)
+
+
+if __name__ == "__main__":
+    main()
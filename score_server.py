@@ -0,0 +1,366 @@
+"""
+Warm local scoring service: the five ClimateBERT heads stay loaded and rows
+from concurrent requests are merged into shared micro-batches.
+
+    python score_server.py                         # http://127.0.0.1:8077, SCORER_BACKEND as in main.py
+    python score_server.py --max-wait-ms 20 --max-queue 8192
+    python score_server.py stats                   # latency / batching stats of a running server
+
+    SCORE_SERVER=http://127.0.0.1:8077 python main.py data/processed_txt_2024/*_chunks.txt
+
+With SCORE_SERVER set, main.load_heads returns stand-in models (like the
+ONNX backend's) whose forward pass is a POST to the server, so score_file,
+predict_heads and the inference cache work unchanged. Only the tokenizer is
+loaded in the client.
+
+The batcher thread waits until the queued rows fill a token budget
+(rows x longest row, as in batching.py) or the oldest request has waited
+--max-wait-ms, then runs each head once over every queued row for it.
+When more than --max-queue rows are waiting, requests get a 503 with
+Retry-After and the client backs off.
+
+Endpoints: GET /models, GET /stats, POST /logits {"head", "input_ids": [[...], ...]}.
+"""
+
+import argparse
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+import torch
+
+from batching import MAX_BATCH_SIZE, MAX_BATCH_TOKENS, token_budget_batches
+
+HOST = "127.0.0.1"
+PORT = 8077
+MAX_WAIT_MS = 10
+MAX_QUEUE_ROWS = 4096
+LATENCY_WINDOW = 10000
+
+
+class QueueFull(Exception):
+    pass
+
+
+class _Job:
+    __slots__ = ("head", "rows", "future", "arrived")
+
+    def __init__(self, head, rows):
+        self.head = head
+        self.rows = rows
+        self.future = Future()
+        self.arrived = time.monotonic()
+
+
+# ----------------------------------
+# Server
+# ----------------------------------
+
+class MicroBatcher:
+    """Merges queued requests into token-budget batches, one forward pass per head per batch."""
+
+    def __init__(self, tokenizer, models, max_tokens=MAX_BATCH_TOKENS, max_batch_size=MAX_BATCH_SIZE,
+                 max_wait=MAX_WAIT_MS / 1000, max_queue=MAX_QUEUE_ROWS):
+        self.tokenizer = tokenizer
+        self.models = models
+        self.max_tokens = max_tokens
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+
+        self._jobs = deque()
+        self._queued_rows = 0
+        self._queued_tokens = 0
+        self._cond = threading.Condition()
+        self._lock = threading.Lock()
+        self._latency = deque(maxlen=LATENCY_WINDOW)
+        self._queue_wait = deque(maxlen=LATENCY_WINDOW)
+        self._counts = {"requests": 0, "rows": 0, "rejected": 0, "batches": 0, "forward_passes": 0,
+                        "padded_tokens": 0, "budget_tokens": 0, "jobs_per_batch": 0}
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, head, rows):
+        if head not in self.models:
+            raise KeyError(head)
+        job = _Job(head, rows)
+        with self._cond:
+            # an empty queue takes any request, however large
+            if self._queued_rows and self._queued_rows + len(rows) > self.max_queue:
+                with self._lock:
+                    self._counts["rejected"] += 1
+                raise QueueFull()
+            self._jobs.append(job)
+            self._queued_rows += len(rows)
+            self._queued_tokens += sum(len(row) for row in rows)
+            self._cond.notify()
+        with self._lock:
+            self._counts["requests"] += 1
+            self._counts["rows"] += len(rows)
+        return job.future
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self._latency.append(seconds)
+
+    def _take(self):
+        """Block until a batch is due, then pop its jobs (FIFO, at least one)."""
+        with self._cond:
+            while not self._jobs:
+                self._cond.wait()
+            deadline = self._jobs[0].arrived + self.max_wait
+            # queued_tokens is a lower bound on the padded size, good enough to stop waiting
+            while self._queued_tokens < self.max_tokens and (remaining := deadline - time.monotonic()) > 0:
+                self._cond.wait(remaining)
+
+            jobs = [self._jobs.popleft()]
+            tokens = sum(len(row) for row in jobs[0].rows)
+            while self._jobs and tokens + sum(len(row) for row in self._jobs[0].rows) <= self.max_tokens:
+                jobs.append(self._jobs.popleft())
+                tokens += sum(len(row) for row in jobs[-1].rows)
+            self._queued_rows -= sum(len(job.rows) for job in jobs)
+            self._queued_tokens -= tokens
+        return jobs
+
+    def _loop(self):
+        while True:
+            jobs = self._take()
+            now = time.monotonic()
+            with self._lock:
+                self._queue_wait.extend(now - job.arrived for job in jobs)
+                self._counts["batches"] += 1
+                self._counts["jobs_per_batch"] += len(jobs)
+
+            for head in dict.fromkeys(job.head for job in jobs):
+                head_jobs = [job for job in jobs if job.head == head]
+                try:
+                    logits = self._forward(head, [row for job in head_jobs for row in job.rows])
+                except Exception as e:
+                    for job in head_jobs:
+                        job.future.set_exception(e)
+                    continue
+                start = 0
+                for job in head_jobs:
+                    job.future.set_result(logits[start:start + len(job.rows)])
+                    start += len(job.rows)
+
+    def _forward(self, head, rows):
+        model = self.models[head]
+        logits = [None] * len(rows)
+        lengths = [len(row) for row in rows]
+        with torch.inference_mode():
+            for batch_rows in token_budget_batches(lengths, self.max_tokens, self.max_batch_size):
+                batch = self.tokenizer.pad({"input_ids": [rows[i] for i in batch_rows]}, return_tensors="pt")
+                out = model(**batch.to(model.device)).logits.float().cpu().numpy()
+                for i, row in zip(batch_rows, out):
+                    logits[i] = row
+                with self._lock:
+                    self._counts["forward_passes"] += 1
+                    self._counts["padded_tokens"] += len(batch_rows) * max(lengths[i] for i in batch_rows)
+                    self._counts["budget_tokens"] += self.max_tokens
+        return np.stack(logits) if logits else np.zeros((0, model.config.num_labels), dtype=np.float32)
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+            latency = np.array(self._latency)
+            queue_wait = np.array(self._queue_wait)
+
+        def pct(values, q):
+            return round(float(np.percentile(values, q)) * 1000, 2) if len(values) else None
+
+        batches = max(counts["batches"], 1)
+        return {
+            **{key: counts[key] for key in ("requests", "rows", "rejected", "batches", "forward_passes")},
+            "queued_rows": self._queued_rows,
+            "latency_p50_ms": pct(latency, 50),
+            "latency_p99_ms": pct(latency, 99),
+            "queue_wait_p50_ms": pct(queue_wait, 50),
+            "queue_wait_p99_ms": pct(queue_wait, 99),
+            # padded tokens per forward pass as a share of the token budget
+            "batch_fill_ratio": round(counts["padded_tokens"] / counts["budget_tokens"], 3) if counts["budget_tokens"] else None,
+            "requests_per_batch": round(counts["jobs_per_batch"] / batches, 2),
+        }
+
+
+def model_info(tokenizer, models):
+    from inference_cache import model_key
+
+    info = {"tokenizer": tokenizer.name_or_path, "heads": {}}
+    for head, model in models.items():
+        name, revision = model_key(model)
+        info["heads"][head] = {"config": model.config.to_dict(), "cache_name": name, "cache_revision": revision}
+    return info
+
+
+def make_handler(batcher, info):
+    class Handler(BaseHTTPRequestHandler):
+        # keep-alive, so each client reuses one connection
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/models":
+                self._send(200, info)
+            elif self.path == "/stats":
+                self._send(200, batcher.stats())
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/logits":
+                self._send(404, {"error": "not found"})
+                return
+            start = time.monotonic()
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                future = batcher.submit(request["head"], request["input_ids"])
+            except QueueFull:
+                self._send(503, {"error": "queue full"}, {"Retry-After": "1"})
+                return
+            except (KeyError, ValueError) as e:
+                self._send(400, {"error": f"bad request: {e}"})
+                return
+
+            try:
+                logits = future.result()
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+                return
+            batcher.record_latency(time.monotonic() - start)
+            self._send(200, {"logits": logits.tolist()})
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(host=HOST, port=PORT, max_wait_ms=MAX_WAIT_MS, max_queue=MAX_QUEUE_ROWS, max_tokens=MAX_BATCH_TOKENS):
+    import main
+
+    tokenizer, models = main.load_local_heads()
+    batcher = MicroBatcher(tokenizer, models, max_tokens=max_tokens, max_wait=max_wait_ms / 1000, max_queue=max_queue)
+    server = ThreadingHTTPServer((host, port), make_handler(batcher, model_info(tokenizer, models)))
+    server.daemon_threads = True
+    print(f"Scoring {', '.join(models)} on http://{host}:{port} (max wait {max_wait_ms} ms, queue {max_queue} rows)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(batcher.stats(), indent=2))
+
+
+# ----------------------------------
+# Client
+# ----------------------------------
+
+class ScoreClient:
+    def __init__(self, url, timeout=600, max_retries=30):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        # one keep-alive connection per thread; requests.Session is not thread-safe
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def get(self, path):
+        resp = self.session.get(self.url + path, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    def logits(self, head, rows):
+        """Logits (n_rows, n_labels) of `head` for unpadded token id rows."""
+        for attempt in range(self.max_retries + 1):
+            resp = self.session.post(self.url + "/logits", json={"head": head, "input_ids": rows}, timeout=self.timeout)
+            if resp.status_code == 503 and attempt < self.max_retries:
+                # backpressure: the server queue is full
+                time.sleep(float(resp.headers.get("Retry-After", 1)) * min(2 ** attempt, 8) / 8)
+                continue
+            resp.raise_for_status()
+            return np.asarray(resp.json()["logits"], dtype=np.float32)
+
+
+class RemoteSequenceClassifier:
+    """
+    Stand-in for a transformers sequence classifier whose forward pass runs
+    on the scoring server: model(**batch).logits, .config, .device, .eval().
+    """
+
+    def __init__(self, client, head, config, cache_name, cache_revision):
+        self.client = client
+        self.head = head
+        self.config = config
+        self.device = torch.device("cpu")
+        self.nbytes = 0
+        # cache entries are shared with local runs of the same checkpoint and backend
+        self.cache_name = cache_name
+        self.cache_revision = cache_revision
+
+    def eval(self):
+        return self
+
+    def __call__(self, input_ids, attention_mask, **_):
+        from transformers.modeling_outputs import SequenceClassifierOutput
+
+        # send rows without padding; the server pads them with other requests' rows
+        lengths = attention_mask.sum(dim=1).tolist()
+        rows = [ids[:n].tolist() for ids, n in zip(input_ids, lengths)]
+        return SequenceClassifierOutput(logits=torch.from_numpy(self.client.logits(self.head, rows)))
+
+
+def remote_heads(url):
+    """(tokenizer, {head: RemoteSequenceClassifier}) for main.score_file, backed by a running server."""
+    from transformers import AutoTokenizer, PretrainedConfig
+
+    client = ScoreClient(url)
+    info = client.get("/models")
+    tokenizer = AutoTokenizer.from_pretrained(info["tokenizer"], max_len=512)
+    models = {
+        head: RemoteSequenceClassifier(
+            client, head, PretrainedConfig.from_dict(spec["config"]), spec["cache_name"], spec["cache_revision"]
+        )
+        for head, spec in info["heads"].items()
+    }
+    return tokenizer, models
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm ClimateBERT scoring service with micro-batching.")
+    parser.add_argument("cmd", nargs="?", choices=["serve", "stats"], default="serve")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS, help="longest a request waits for batch-mates")
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE_ROWS, help="queued rows before answering 503")
+    parser.add_argument("--max-tokens", type=int, default=MAX_BATCH_TOKENS, help="token budget per forward pass")
+    args = parser.parse_args()
+
+    if args.cmd == "stats":
+        print(json.dumps(ScoreClient(f"http://{args.host}:{args.port}").get("/stats"), indent=2))
+    else:
+        serve(args.host, args.port, args.max_wait_ms, args.max_queue, args.max_tokens)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+Persistent positional inverted index over the chunk corpus.
+
+Indexes every line of data/processed_txt_2024/*_chunks.txt and
+data/model_outputs/*.txt once, so a new term list is answered from postings
+instead of a full re-scan:
+
+    python term_index.py build                               # or update, same thing
+    python term_index.py query "scope 3" "science-based target" --by ticker
+    python term_index.py terms terms.json --by ticker        # green/red lists
+
+Text is tokenized into lowercase words (\\w+) and single punctuation marks,
+with positions per chunk, and a phrase matches consecutive tokens. So
+"science-based target" and "1.5°" are exact token sequences, but whitespace
+is not indexed: "1.5 °" also matches "1.5°", and a trailing space in a term
+("may ") is ignored. phrase_match.PhraseMatcher has the exact \\b semantics.
+
+Re-running build only indexes files that are new or changed (size/mtime)
+and drops files that disappeared.
+"""
+
+import argparse
+import glob
+import os
+import re
+import sqlite3
+import time
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+INDEX_PATH = "data/term_index.sqlite"
+SOURCES = {
+    "chunks": "data/processed_txt_2024/*_chunks.txt",
+    "model_outputs": "data/model_outputs/*.txt",
+}
+
+# sqlite's default limit on bound parameters is 999
+_LOOKUP_BATCH = 500
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+
+def _ticker(path):
+    # TICKER_2024_chunks.txt / TICKER_2024_chunks_related.txt; None for pooled files like specific_data.txt
+    parts = os.path.basename(path).split("_")
+    return parts[0] if len(parts) > 2 and parts[1].isdigit() else None
+
+
+class TermIndex:
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS files (
+                file_id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE,
+                source TEXT NOT NULL,
+                ticker TEXT,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS docs (
+                doc_id INTEGER PRIMARY KEY,
+                file_id INTEGER NOT NULL,
+                line INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS docs_file ON docs (file_id);
+            CREATE TABLE IF NOT EXISTS terms (
+                term_id INTEGER PRIMARY KEY,
+                term TEXT NOT NULL UNIQUE
+            );
+            -- positions: uint32 token offsets of the term in the doc
+            CREATE TABLE IF NOT EXISTS postings (
+                term_id INTEGER NOT NULL,
+                doc_id INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                positions BLOB NOT NULL,
+                PRIMARY KEY (term_id, doc_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+            """
+        )
+        self._term_ids = dict(self.conn.execute("SELECT term, term_id FROM terms"))
+        self._docs = None  # doc_id -> path/line/ticker, loaded on first query
+
+    def close(self):
+        self.conn.close()
+
+    # ----------------------------------
+    # Building
+    # ----------------------------------
+
+    def update(self, sources=None):
+        """Index new/changed files of every source glob, drop deleted ones. Returns (#indexed, #removed)."""
+        sources = sources or SOURCES
+        seen = set()
+        indexed = 0
+        for source, pattern in sources.items():
+            for path in sorted(glob.glob(pattern)):
+                path = os.path.normpath(path)
+                seen.add(path)
+                stat = os.stat(path)
+                row = self.conn.execute("SELECT size, mtime FROM files WHERE path = ?", (path,)).fetchone()
+                if row is not None and row == (stat.st_size, stat.st_mtime):
+                    continue
+                self._index_file(path, source, stat)
+                indexed += 1
+                print(f"indexed {path}")
+
+        self._docs = None
+        removed = 0
+        for (path,) in self.conn.execute("SELECT path FROM files").fetchall():
+            if path not in seen:
+                with self.conn:
+                    self._remove_file(path)
+                removed += 1
+        return indexed, removed
+
+    def _remove_file(self, path):
+        row = self.conn.execute("SELECT file_id FROM files WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            return
+        self.conn.execute(
+            "DELETE FROM postings WHERE doc_id IN (SELECT doc_id FROM docs WHERE file_id = ?)", row
+        )
+        self.conn.execute("DELETE FROM docs WHERE file_id = ?", row)
+        self.conn.execute("DELETE FROM files WHERE file_id = ?", row)
+
+    def _term_id(self, term):
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            term_id = self.conn.execute("INSERT INTO terms (term) VALUES (?)", (term,)).lastrowid
+            self._term_ids[term] = term_id
+        return term_id
+
+    def _index_file(self, path, source, stat):
+        with self.conn:
+            self._remove_file(path)
+            file_id = self.conn.execute(
+                "INSERT INTO files (path, source, ticker, size, mtime) VALUES (?, ?, ?, ?, ?)",
+                (path, source, _ticker(path), stat.st_size, stat.st_mtime),
+            ).lastrowid
+
+            rows = []
+            with open(path, encoding="utf-8") as f:
+                for line_no, line in enumerate(f):
+                    text = line.strip().strip('"')
+                    if not text:
+                        continue
+                    doc_id = self.conn.execute(
+                        "INSERT INTO docs (file_id, line) VALUES (?, ?)", (file_id, line_no)
+                    ).lastrowid
+
+                    positions = defaultdict(list)
+                    for pos, token in enumerate(tokenize(text)):
+                        positions[token].append(pos)
+                    for token, pos in positions.items():
+                        rows.append((self._term_id(token), doc_id, len(pos), np.array(pos, dtype=np.uint32).tobytes()))
+
+            self.conn.executemany(
+                "INSERT INTO postings (term_id, doc_id, tf, positions) VALUES (?, ?, ?, ?)", rows
+            )
+
+    # ----------------------------------
+    # Queries
+    # ----------------------------------
+
+    def _postings(self, term_id, doc_ids=None):
+        """{doc_id: positions} for a term, optionally only in `doc_ids`."""
+        if doc_ids is None:
+            rows = self.conn.execute("SELECT doc_id, positions FROM postings WHERE term_id = ?", (term_id,))
+            return {doc_id: np.frombuffer(blob, dtype=np.uint32) for doc_id, blob in rows}
+
+        doc_ids = sorted(doc_ids)
+        found = {}
+        for start in range(0, len(doc_ids), _LOOKUP_BATCH):
+            part = doc_ids[start:start + _LOOKUP_BATCH]
+            rows = self.conn.execute(
+                f"SELECT doc_id, positions FROM postings WHERE term_id = ? AND doc_id IN ({','.join('?' * len(part))})",
+                [term_id, *part],
+            )
+            found.update((doc_id, np.frombuffer(blob, dtype=np.uint32)) for doc_id, blob in rows)
+        return found
+
+    def doc_counts(self, phrase):
+        """{doc_id: occurrences of phrase} for every chunk containing it."""
+        tokens = tokenize(phrase)
+        if not tokens:
+            return {}
+
+        if len(tokens) == 1:
+            term_id = self._term_ids.get(tokens[0])
+            if term_id is None:
+                return {}
+            return dict(self.conn.execute("SELECT doc_id, tf FROM postings WHERE term_id = ?", (term_id,)))
+
+        term_ids = [self._term_ids.get(token) for token in tokens]
+        if None in term_ids:
+            return {}
+
+        # read the rarest token in full, the others only in the docs still in the running,
+        # so "aims to" never decodes the postings of "to"
+        doc_freq = {
+            term_id: self.conn.execute("SELECT COUNT(*) FROM postings WHERE term_id = ?", (term_id,)).fetchone()[0]
+            for term_id in set(term_ids)
+        }
+        postings = {}
+        docs = None
+        for term_id in sorted(set(term_ids), key=doc_freq.get):
+            postings[term_id] = self._postings(term_id, docs)
+            docs = set(postings[term_id])
+            if not docs:
+                return {}
+        postings = [postings[term_id] for term_id in term_ids]
+
+        # all candidate docs at once: key = doc_id << 32 | position
+        def keys(plist):
+            ids = sorted(docs)
+            return np.concatenate([(np.int64(d) << 32) + plist[d].astype(np.int64) for d in ids])
+
+        starts = keys(postings[0])
+        for offset, plist in enumerate(postings[1:], start=1):
+            starts = starts[np.isin(starts + offset, keys(plist))]
+
+        counts = {}
+        last_end = {}
+        for key in starts.tolist():
+            doc_id, start = key >> 32, key & 0xFFFFFFFF
+            # non-overlapping occurrences, like re.findall
+            if start > last_end.get(doc_id, -1):
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+                last_end[doc_id] = start + len(tokens) - 1
+        return counts
+
+    def _doc_table(self, doc_ids, source=None):
+        if self._docs is None:
+            self._docs = pd.read_sql_query(
+                "SELECT d.doc_id, d.line, f.path, f.source, f.ticker FROM docs d JOIN files f USING (file_id)",
+                self.conn,
+                index_col="doc_id",
+            )
+        df = self._docs.loc[list(doc_ids)].reset_index()
+        if source is not None:
+            df = df[df["source"] == source].copy()
+        return df
+
+    def count(self, phrases, by="ticker", source="chunks"):
+        """
+        Hits of each phrase grouped by "ticker", "file" or "doc" (one row per
+        chunk: path + line). Restricted to one source ("chunks",
+        "model_outputs") unless source=None.
+        """
+        keys = {"ticker": ["ticker"], "file": ["path"], "doc": ["path", "line"]}[by]
+        frames = []
+        for phrase in phrases:
+            counts = self.doc_counts(phrase)
+            if not counts:
+                continue
+            docs = self._doc_table(counts.keys(), source)
+            docs["term"] = phrase
+            docs["hits"] = docs["doc_id"].map(counts)
+            frames.append(docs)
+
+        if not frames:
+            return pd.DataFrame(columns=keys + list(phrases))
+        hits = pd.concat(frames).pivot_table(index=keys, columns="term", values="hits", aggfunc="sum", fill_value=0)
+        return hits.reindex(columns=list(phrases), fill_value=0).reset_index()
+
+    def count_groups(self, groups, by="ticker", source="chunks"):
+        """count() for {group: [terms]} (e.g. terms.json) plus <group>_hits totals."""
+        terms = list(dict.fromkeys(t.strip() for ts in groups.values() for t in ts if t.strip()))
+        df = self.count(terms, by, source)
+        for name, ts in groups.items():
+            cols = list(dict.fromkeys(t.strip() for t in ts if t.strip()))
+            df[f"{name}_hits"] = df[cols].sum(axis=1) if len(df) else 0
+        return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Positional inverted index over chunk files.")
+    parser.add_argument("--index", default=INDEX_PATH)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("build", help="index new or changed files")
+
+    query = sub.add_parser("query", help="count phrases")
+    query.add_argument("phrases", nargs="+")
+    query.add_argument("--by", choices=["ticker", "file", "doc"], default="ticker")
+    query.add_argument("--source", default="chunks", help='"chunks", "model_outputs" or "all"')
+
+    terms = sub.add_parser("terms", help="count a JSON term list, e.g. terms.json")
+    terms.add_argument("path")
+    terms.add_argument("--by", choices=["ticker", "file", "doc"], default="ticker")
+    terms.add_argument("--source", default="chunks")
+    terms.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    index = TermIndex(args.index)
+    if args.cmd == "build":
+        indexed, removed = index.update()
+        print(f"Indexed {indexed} files, removed {removed}")
+    else:
+        source = None if args.source == "all" else args.source
+        start = time.perf_counter()
+        if args.cmd == "query":
+            df = index.count(args.phrases, args.by, source)
+        else:
+            from phrase_match import load_terms
+
+            df = index.count_groups(load_terms(args.path), args.by, source)
+        elapsed = time.perf_counter() - start
+
+        if args.cmd == "terms" and args.out:
+            df.to_csv(args.out, index=False)
+            print(f"Wrote {len(df)} rows to {args.out}")
+        else:
+            print(df.to_string(index=False))
+        print(f"({elapsed * 1000:.0f} ms)")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Sparse document-term matrices and corpus-contrast statistics.
+
+Builds a scipy CSR matrix (one row per chunk, one column per unigram or
+n-gram) over any set of model output files, e.g. *_related.txt or
+specific_data.txt, and compares groups of rows:
+
+    python term_matrix.py data/model_outputs/specific_data.txt data/model_outputs/nonspecific_data.txt
+    python term_matrix.py "data/model_outputs/*_related.txt" --group-by ticker --target XOM --ngrams 2
+
+Tokens are model_outputs.tokenize (lowercase words, STOPWORDS removed);
+n-grams are built over those tokens. Tokenizing runs in a process pool, and
+the finished matrix is cached under data/term_matrix_cache keyed by the
+input files (path, size, mtime) and the settings, so re-running an analysis
+with a different statistic or group only loads the cache.
+
+Statistics, for a target group against the rest:
+    log_odds   log-odds ratio with an informative Dirichlet prior (the
+               corpus frequencies), as a z-score (Monroe et al. 2008)
+    chi2       Pearson chi-square of the 2x2 term/group table, signed by
+               whether the term is over-represented in the target
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+import model_outputs
+
+CACHE_DIR = "data/term_matrix_cache"
+# bump when the cached docs/X layout changes, so old caches are rebuilt
+CACHE_VERSION = 2
+BATCH_DOCS = 2000
+
+
+# ----------------------------------
+# Tokenizing
+# ----------------------------------
+
+def doc_terms(text, ngrams=1):
+    tokens = model_outputs.tokenize(text)
+    terms = list(tokens)
+    for n in range(2, ngrams + 1):
+        terms.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+    return terms
+
+
+def _vectorize_batch(args):
+    """CSR pieces of one batch of docs with a batch-local vocabulary."""
+    texts, ngrams = args
+    vocab = {}
+    indptr = [0]
+    indices = []
+    data = []
+    for text in texts:
+        counts = {}
+        for term in doc_terms(text, ngrams):
+            j = vocab.setdefault(term, len(vocab))
+            counts[j] = counts.get(j, 0) + 1
+        indices.extend(counts.keys())
+        data.extend(counts.values())
+        indptr.append(len(indices))
+    return list(vocab), np.array(indptr, dtype=np.int64), np.array(indices, dtype=np.int64), np.array(data, dtype=np.int32)
+
+
+# ----------------------------------
+# Building
+# ----------------------------------
+
+def expand_paths(inputs):
+    paths = []
+    for item in inputs:
+        paths.extend(sorted(glob.glob(item)) or [item])
+    return [os.path.normpath(path) for path in paths]
+
+
+def load_docs(paths):
+    """
+    One row per non-empty line: path, ticker, doc, text (quotes stripped like
+    model_outputs). doc numbers the documents of a file, blank lines skipped,
+    so it is not the line number term_index stores.
+    """
+    rows = []
+    for path in paths:
+        base = os.path.basename(path)
+        parts = base.split("_")
+        ticker = parts[0] if len(parts) > 2 and parts[1].isdigit() else None
+        for doc, text in enumerate(model_outputs.load_documents(Path(path))):
+            rows.append((path, ticker, doc, text))
+    return pd.DataFrame(rows, columns=["path", "ticker", "doc", "text"])
+
+
+def cache_key(paths, ngrams, min_df):
+    h = hashlib.blake2b(digest_size=16)
+    settings = {"version": CACHE_VERSION, "ngrams": ngrams, "min_df": min_df, "stopwords": sorted(model_outputs.STOPWORDS)}
+    h.update(json.dumps(settings).encode())
+    for path in paths:
+        stat = os.stat(path)
+        h.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+class TermMatrix:
+    """docs: DataFrame (path, ticker, doc); X: csr (n_docs x n_terms); vocab: array of terms."""
+
+    def __init__(self, docs, X, vocab):
+        self.docs = docs
+        self.X = X
+        self.vocab = np.asarray(vocab, dtype=object)
+
+    @classmethod
+    def build(cls, inputs, ngrams=1, min_df=1, workers=None, cache_dir=CACHE_DIR):
+        paths = expand_paths(inputs)
+        key = cache_key(paths, ngrams, min_df)
+        if cache_dir:
+            cached = cls.load(os.path.join(cache_dir, key))
+            if cached is not None:
+                return cached
+
+        docs = load_docs(paths)
+        texts = docs.pop("text").tolist()
+        batches = [(texts[i:i + BATCH_DOCS], ngrams) for i in range(0, len(texts), BATCH_DOCS)]
+        if workers == 1 or len(batches) <= 1:
+            parts = [_vectorize_batch(batch) for batch in batches]
+        else:
+            with Pool(workers) as pool:
+                parts = pool.map(_vectorize_batch, batches)
+
+        # merge batch vocabularies: remap local column ids to global ones
+        vocab = {}
+        blocks = []
+        for local_vocab, indptr, indices, data in parts:
+            remap = np.fromiter((vocab.setdefault(term, len(vocab)) for term in local_vocab),
+                                dtype=np.int64, count=len(local_vocab))
+            blocks.append((indptr, remap[indices], data))
+        X = sp.vstack(
+            [sp.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, len(vocab))) for indptr, indices, data in blocks],
+            format="csr",
+        ) if blocks else sp.csr_matrix((0, 0), dtype=np.int32)
+        vocab = np.array(list(vocab), dtype=object)
+
+        if min_df > 1:
+            keep = np.flatnonzero(np.bincount(X.indices, minlength=X.shape[1]) >= min_df)
+            X, vocab = X[:, keep], vocab[keep]
+
+        matrix = cls(docs, X.tocsr(), vocab)
+        if cache_dir:
+            matrix.save(os.path.join(cache_dir, key))
+        return matrix
+
+    def save(self, prefix):
+        os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+        sp.save_npz(prefix + ".X.npz", self.X)
+        np.save(prefix + ".vocab.npy", self.vocab.astype(str))
+        self.docs.to_parquet(prefix + ".docs.parquet", index=False)
+
+    @classmethod
+    def load(cls, prefix):
+        if not os.path.exists(prefix + ".docs.parquet"):
+            return None
+        return cls(
+            pd.read_parquet(prefix + ".docs.parquet"),
+            sp.load_npz(prefix + ".X.npz").tocsr(),
+            np.load(prefix + ".vocab.npy"),
+        )
+
+    # ----------------------------------
+    # Grouping
+    # ----------------------------------
+
+    def group_counts(self, labels):
+        """Term counts summed per group: (groups, csr n_groups x n_terms)."""
+        codes, groups = pd.factorize(pd.Series(labels).fillna("(none)"), sort=True)
+        indicator = sp.csr_matrix(
+            (np.ones(len(codes), dtype=np.int64), (codes, np.arange(len(codes)))),
+            shape=(len(groups), len(codes)),
+        )
+        return list(groups), (indicator @ self.X).tocsr()
+
+    def top_terms(self, labels=None, n=50):
+        """Most frequent terms overall, or the top `n` of every group (group, term, count)."""
+        if labels is None:
+            totals = np.asarray(self.X.sum(axis=0)).ravel()
+            order = np.argsort(-totals, kind="stable")[:n]
+            return pd.DataFrame({"term": self.vocab[order], "count": totals[order]})
+
+        groups, counts = self.group_counts(labels)
+        frames = []
+        for group, row in zip(groups, counts):
+            row = row.toarray().ravel()
+            order = np.argsort(-row, kind="stable")[:n]
+            frames.append(pd.DataFrame({"group": group, "term": self.vocab[order], "count": row[order]}))
+        return pd.concat(frames, ignore_index=True)
+
+    def contrast(self, labels, target, stat="log_odds", prior=None):
+        """
+        Score every term for `target` against all other groups. Returns a
+        DataFrame (term, target_count, rest_count, score) sorted by score,
+        most target-like first.
+        """
+        labels = pd.Series(labels).fillna("(none)").to_numpy()
+        mask = labels == target
+        if not mask.any():
+            raise ValueError(f"no documents in group {target!r}")
+
+        y_i = np.asarray(self.X[mask].sum(axis=0), dtype=np.float64).ravel()
+        y_j = np.asarray(self.X[~mask].sum(axis=0), dtype=np.float64).ravel()
+        if stat == "log_odds":
+            score = log_odds_dirichlet(y_i, y_j, prior)
+        elif stat == "chi2":
+            score = chi_square(y_i, y_j)
+        else:
+            raise ValueError(f"unknown statistic {stat!r}")
+
+        df = pd.DataFrame({"term": self.vocab, "target_count": y_i, "rest_count": y_j, "score": score})
+        return df.sort_values("score", ascending=False, kind="stable").reset_index(drop=True)
+
+
+# ----------------------------------
+# Statistics
+# ----------------------------------
+
+def log_odds_dirichlet(y_i, y_j, prior=None, alpha0=None):
+    """
+    z-scored log-odds ratio with an informative Dirichlet prior.
+    `prior` is the per-term background count (defaults to y_i + y_j),
+    scaled to `alpha0` pseudo-counts (defaults to the prior's total).
+    """
+    prior = y_i + y_j if prior is None else np.asarray(prior, dtype=np.float64)
+    alpha0 = prior.sum() if alpha0 is None else alpha0
+    alpha = prior * (alpha0 / prior.sum())
+    n_i, n_j = y_i.sum(), y_j.sum()
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta = (np.log((y_i + alpha) / (n_i + alpha0 - y_i - alpha))
+                 - np.log((y_j + alpha) / (n_j + alpha0 - y_j - alpha)))
+        var = 1.0 / (y_i + alpha) + 1.0 / (y_j + alpha)
+        z = delta / np.sqrt(var)
+    return np.nan_to_num(z)
+
+
+def chi_square(y_i, y_j):
+    """Signed Pearson chi-square per term (2x2: term vs other terms, target vs rest)."""
+    n_i, n_j = y_i.sum(), y_j.sum()
+    a, b = y_i, y_j
+    c, d = n_i - y_i, n_j - y_j
+    n = n_i + n_j
+    with np.errstate(divide="ignore", invalid="ignore"):
+        chi2 = n * (a * d - b * c) ** 2 / ((a + b) * (c + d) * (a + c) * (b + d))
+    return np.nan_to_num(np.sign(a * d - b * c) * chi2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Document-term matrix and corpus contrast over model output files.")
+    parser.add_argument("inputs", nargs="+", help="files or glob patterns")
+    parser.add_argument("--ngrams", type=int, default=1, help="longest n-gram (1 = unigrams only)")
+    parser.add_argument("--min-df", type=int, default=1, help="drop terms in fewer chunks than this")
+    parser.add_argument("--group-by", choices=["path", "ticker"], default="path")
+    parser.add_argument("--target", default=None, help="group to contrast against the rest (default: first group)")
+    parser.add_argument("--stat", choices=["log_odds", "chi2"], default="log_odds")
+    parser.add_argument("--top", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--out", default=None, help="write the full contrast table to this CSV")
+    args = parser.parse_args()
+
+    matrix = TermMatrix.build(args.inputs, args.ngrams, args.min_df, args.workers,
+                              cache_dir=None if args.no_cache else CACHE_DIR)
+    print(f"{matrix.X.shape[0]} chunks x {matrix.X.shape[1]} terms, {matrix.X.nnz} non-zeros")
+
+    labels = matrix.docs[args.group_by]
+    groups = sorted(labels.fillna("(none)").unique())
+    if len(groups) < 2:
+        print(f"\n=== TOP {args.top} TERMS ===")
+        print(matrix.top_terms(n=args.top).to_string(index=False))
+        return
+
+    target = args.target if args.target is not None else groups[0]
+    df = matrix.contrast(labels, target, args.stat)
+    print(f"\n=== TOP {args.top} TERMS — {target} vs rest ({args.stat}) ===")
+    print(df.head(args.top).to_string(index=False))
+    print(f"\n=== TOP {args.top} TERMS — rest vs {target} ({args.stat}) ===")
+    print(df.iloc[::-1].head(args.top).to_string(index=False))
+
+    if args.out:
+        df.to_csv(args.out, index=False)
+        print(f"Wrote {len(df)} terms to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import fetch_async
+from raw_store import RawStore
+
+
+def fetch(app, paths, rounds=1, **kwargs):
+    """
+    Run fetch_all against `app` on a local server, `rounds` times in a row
+    (same URLs). Returns [(stats, {path: body})] per round.
+    """
+
+    async def main():
+        async with TestServer(app, host="127.0.0.1") as server:
+            jobs = [{"url": str(server.make_url(path)), "path": path} for path in paths]
+            out = []
+            for _ in range(rounds):
+                results = {}
+                stats = await fetch_async.fetch_all(
+                    jobs, lambda job, body, results=results: results.__setitem__(job["path"], body), **kwargs
+                )
+                out.append((stats, results))
+        return out
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("concurrency, per_host, expected", [(16, 2, 2), (3, 10, 3)])
+def test_concurrency_limits(concurrency, per_host, expected):
+    state = {"active": 0, "peak": 0}
+
+    async def handler(request):
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.05)
+        state["active"] -= 1
+        return web.Response(body=request.path.encode())
+
+    app = web.Application()
+    app.router.add_get("/{name}", handler)
+    paths = [f"/r{i}" for i in range(10)]
+
+    [(stats, results)] = fetch(app, paths, concurrency=concurrency, per_host=per_host)
+    assert state["peak"] == expected
+    assert stats.ok == 10 and results == {path: path.encode() for path in paths}
+
+
+def test_retries_then_gives_up_on_permanent_errors():
+    calls = {"flaky": 0, "missing": 0}
+
+    async def flaky(request):
+        calls["flaky"] += 1
+        if calls["flaky"] <= 2:
+            return web.Response(status=503, headers={"Retry-After": "0"})
+        return web.Response(body=b"report")
+
+    async def missing(request):
+        calls["missing"] += 1
+        return web.Response(status=404)
+
+    app = web.Application()
+    app.router.add_get("/flaky", flaky)
+    app.router.add_get("/missing", missing)
+
+    [(stats, results)] = fetch(app, ["/flaky", "/missing"], retries=4)
+    assert results == {"/flaky": b"report"}
+    assert calls == {"flaky": 3, "missing": 1}
+    assert stats.retries == 2 and stats.ok == 1 and stats.failed == 1
+
+
+def test_retries_are_bounded():
+    async def down(request):
+        return web.Response(status=503, headers={"Retry-After": "0"})
+
+    app = web.Application()
+    app.router.add_get("/down", down)
+
+    [(stats, results)] = fetch(app, ["/down"], retries=2)
+    assert results == {} and stats.retries == 2 and stats.failed == 1
+
+
+def test_conditional_get_served_from_store(tmp_path):
+    seen = []
+
+    async def handler(request):
+        seen.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.Response(body=b"%PDF-report", headers={"ETag": '"v1"'})
+
+    app = web.Application()
+    app.router.add_get("/report.pdf", handler)
+    store = RawStore(str(tmp_path / "raw"))
+
+    (first, first_results), (second, second_results) = fetch(app, ["/report.pdf"], rounds=2, store=store)
+    assert first_results == {"/report.pdf": b"%PDF-report"} and first.ok == 1
+
+    # the re-fetch sends the stored ETag and the 304 is answered from disk
+    assert second_results == {"/report.pdf": b"%PDF-report"}
+    assert second.not_modified == 1 and second.ok == 0
+    assert seen == [None, '"v1"']
+    store.close()
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+import torch
+from transformers import AutoTokenizer
+from transformers.modeling_outputs import SequenceClassifierOutput
+
+import aggregate
+import benchmarks
+import main
+
+
+class FixedClassifier:
+    """Stand-in head that gives every chunk the same label."""
+
+    def __init__(self, labels, label):
+        self.config = type("Config", (), {"id2label": dict(enumerate(labels))})()
+        self.device = torch.device("cpu")
+        self._logits = torch.tensor([10.0 if name == label else 0.0 for name in labels])
+
+    def __call__(self, input_ids, attention_mask=None):
+        return SequenceClassifierOutput(logits=self._logits.expand(len(input_ids), -1))
+
+
+@pytest.fixture(scope="module")
+def tokenizer(tmp_path_factory):
+    return AutoTokenizer.from_pretrained(benchmarks.fixture_model(str(tmp_path_factory.mktemp("tiny"))))
+
+
+def heads(tokenizer, detector_label):
+    return tokenizer, {
+        "relate": FixedClassifier(["no", "yes"], detector_label),
+        "spec": FixedClassifier(["non", "spec"], "spec"),
+        "senti": FixedClassifier(["opportunity", "neutral", "risk"], "risk"),
+        "commit": FixedClassifier(["no", "yes"], "yes"),
+        "tcfd": FixedClassifier(aggregate.TCFD_CATEGORIES, "metrics"),
+    }
+
+
+@pytest.fixture
+def chunk_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "cache", None)
+    monkeypatch.setattr(main, "gate", None)
+    monkeypatch.setattr(main, "fanout", None)
+    path = tmp_path / "acme_2024_chunks.txt"
+    path.write_text('"scope 1 emissions fell"\n"the board met twice"\n', encoding="utf-8")
+    return str(path)
+
+
+def test_no_chunk_passes_detector(tokenizer, chunk_file, tmp_path):
+    row = main.score_file(chunk_file, heads=heads(tokenizer, "no"), probs_dir=str(tmp_path / "probs"))
+    assert row["relate"] == 0 and row["spec"] == 0 and row["metrics"] == 0
+
+    # the stored arrays aggregate the same way
+    report = aggregate.load_report_probs(str(tmp_path / "probs" / "acme_2024_chunks.npz"))
+    assert report["candidates"].dtype == np.int64 and len(report["candidates"]) == 0
+    assert aggregate.aggregate_report(report) == row
+
+
+def test_every_chunk_passes_detector(tokenizer, chunk_file, tmp_path):
+    row = main.score_file(chunk_file, heads=heads(tokenizer, "yes"), probs_dir=str(tmp_path / "probs"))
+    assert row["relate"] == 1 and row["spec"] == 1 and row["metrics"] == 1
+
+
+class OffTopicDetector(FixedClassifier):
+    """Stand-in detector: a confident "no" for chunks with `token_id`, "yes" for the rest."""
+
+    def __init__(self, token_id):
+        super().__init__(["no", "yes"], "yes")
+        self.token_id = token_id
+
+    def __call__(self, input_ids, attention_mask=None):
+        off_topic = (input_ids == self.token_id).any(dim=-1)
+        return SequenceClassifierOutput(logits=torch.where(off_topic[:, None], self._logits.flip(0), self._logits))
+
+
+class SkipLast:
+    """Stand-in prefilter that lets every chunk but the last through."""
+
+    def keep(self, texts):
+        return np.arange(len(texts)) < len(texts) - 1
+
+
+def test_prefiltered_chunks_score_as_detector_no(tokenizer, chunk_file, tmp_path, monkeypatch):
+    # "the board met twice" is off topic; the detector says no to it
+    scorer = heads(tokenizer, "yes")
+    scorer[1]["relate"] = OffTopicDetector(tokenizer.convert_tokens_to_ids("board"))
+    ungated = main.score_file(chunk_file, heads=scorer, probs_dir=str(tmp_path / "ungated"))
+    assert ungated["relate"] == 0.5
+
+    # the gate skips it: same result, without running the detector on it
+    monkeypatch.setattr(main, "gate", SkipLast())
+    row = main.score_file(chunk_file, heads=scorer, probs_dir=str(tmp_path / "probs"))
+    assert row == ungated
+
+    report = aggregate.load_report_probs(str(tmp_path / "probs" / "acme_2024_chunks.npz"))
+    assert report["prefiltered"].tolist() == [1] and report["candidates"].tolist() == [0]
+    assert aggregate.aggregate_report(report) == row
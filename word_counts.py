@@ -1,37 +1,27 @@
+import argparse
+import os
+
 import pandas as pd
 import re
 from collections import Counter
 
-# Load dataset
-df = pd.read_csv("data/comp_reports_compiled.csv")
+import chunk_store
+from phrase_match import TERMS_PATH, PhraseMatcher, load_terms
 
-# Ensure text is string
-df["text"] = df["text"].astype(str)
+# input before the chunk store existed, still read when the store hasn't been built
+COMPILED_CSV = "data/comp_reports_compiled.csv"
 
 # ----------------------------------
-# Your terms (case-insensitive)
+# Your terms (case-insensitive), from terms.json
 # ----------------------------------
-GREEN_TERMS = [
-    "science-based target", "sbti",
-    "scope 1", "scope 2", "scope 3",
-    "absolute emissions", "net zero",
-    "1.5°", "1.5c", "paris aligned", "paris-aligned",
-    "independent assurance", "limited assurance", "reasonable assurance",
-    "internal carbon price", "carbon pricing",
-    "tcfd", "scenario analysis",
-]
-
-RED_TERMS = [
-    "aims to", "seeks to", "intends to", "aspire to",
-    "where feasible", "where appropriate", "subject to",
-    "forward-looking statements",
-    "may ", "might ", "could ",  # note the space matters
-    "emissions intensity", "offsets", "carbon credits",
-]
+_TERMS = load_terms(TERMS_PATH)
+GREEN_TERMS = _TERMS["green"]
+RED_TERMS = _TERMS["red"]  # note the space in "may ", "might ", "could " matters
 
 # ----------------------------------
 # Precompile regex patterns
 # Each term → a case-insensitive regex
+# (the reference semantics; counting itself uses one PhraseMatcher pass per chunk)
 # ----------------------------------
 GREEN_PATTERNS = [re.compile(rf"\b{re.escape(t)}\b", flags=re.IGNORECASE) for t in GREEN_TERMS]
 RED_PATTERNS   = [re.compile(rf"\b{re.escape(t)}\b", flags=re.IGNORECASE) for t in RED_TERMS]
@@ -53,34 +43,90 @@ def count_matches(text, patterns):
 # ----------------------------------
 # Apply to each row
 # ----------------------------------
-df["green_count"] = df["text"].apply(lambda t: count_matches(t, GREEN_PATTERNS))
-df["red_count"]   = df["text"].apply(lambda t: count_matches(t, RED_PATTERNS))
-df["word_count"]  = df["text"].apply(lambda t: len(t.split()))
+def add_counts(df, terms=None, workers=None, chunksize=2000):
+    """
+    Add green_count / red_count / word_count columns (and one column per term)
+    to a DataFrame with a "text" column. All terms are found in a single pass
+    per chunk, in parallel over `workers` processes.
+    """
+    matcher = PhraseMatcher(terms or {"green": GREEN_TERMS, "red": RED_TERMS})
+    counts = matcher.count_frame(df["text"], workers=workers, chunksize=chunksize)
+    counts.index = df.index
+
+    df = df.join(counts[matcher.terms].add_prefix("term:"))
+    df["green_count"] = counts["green_hits"]
+    df["red_count"]   = counts["red_hits"]
+    df["word_count"]  = df["text"].str.split().str.len()
+    return df
 
 
 # ----------------------------------
 # Aggregate scores at company-level
 # ----------------------------------
-company_stats = (
-    df.groupby("ticker")
-      .agg(
-          total_chunks     = ("text", "count"),
-          total_words      = ("word_count", "sum"),
-          green_hits       = ("green_count", "sum"),
-          red_hits         = ("red_count", "sum"),
-      )
-      .reset_index()
-)
-
-# Ratios
-company_stats["green_per_1000w"] = company_stats["green_hits"] / (company_stats["total_words"] / 1000 + 1e-9)
-company_stats["red_per_1000w"]   = company_stats["red_hits"] / (company_stats["total_words"] / 1000 + 1e-9)
-company_stats["green_red_ratio"] = company_stats["green_hits"] / (company_stats["red_hits"] + 1e-9)
+def company_stats(df):
+    stats = (
+        df.groupby("ticker")
+          .agg(
+              total_chunks     = ("text", "count"),
+              total_words      = ("word_count", "sum"),
+              green_hits       = ("green_count", "sum"),
+              red_hits         = ("red_count", "sum"),
+          )
+          .reset_index()
+    )
 
+    # Ratios
+    stats["green_per_1000w"] = stats["green_hits"] / (stats["total_words"] / 1000 + 1e-9)
+    stats["red_per_1000w"]   = stats["red_hits"] / (stats["total_words"] / 1000 + 1e-9)
+    stats["green_red_ratio"] = stats["green_hits"] / (stats["red_hits"] + 1e-9)
+    return stats
+
+
+def term_totals(df):
+    """Hits per term per company (columns added by add_counts)."""
+    term_cols = [c for c in df.columns if c.startswith("term:")]
+    totals = df.groupby("ticker")[term_cols].sum()
+    totals.columns = [c[len("term:"):] for c in term_cols]
+    return totals.reset_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Green/red term counts per company.")
+    parser.add_argument("--input", default=chunk_store.STORE_DIR,
+                        help="chunk store directory, or a CSV like data/comp_reports_compiled.csv")
+    parser.add_argument("--terms", default=TERMS_PATH, help="JSON file with green/red term lists")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--term-counts", default=None, help="also write per-term hits per company to this CSV")
+    args = parser.parse_args()
+
+    # Load dataset
+    if os.path.isdir(args.input):
+        df = chunk_store.read_chunks(args.input, columns=["ticker", "text"])
+    elif os.path.isfile(args.input):
+        df = pd.read_csv(args.input)
+    elif args.input == chunk_store.STORE_DIR and os.path.isfile(COMPILED_CSV):
+        # fresh checkout: the store is only there after build_chunk_dataset.py
+        print(f"No chunk store at {args.input}, reading {COMPILED_CSV}")
+        df = pd.read_csv(COMPILED_CSV)
+    else:
+        parser.error(f"{args.input} does not exist; run build_chunk_dataset.py first to build the chunk store")
+
+    # Ensure text is string
+    df["text"] = df["text"].astype(str)
+
+    df = add_counts(df, load_terms(args.terms), workers=args.workers)
+
+    # ----------------------------------
+    # Sort for quick inspection
+    # ----------------------------------
+    company_stats_sorted = company_stats(df).sort_values("green_red_ratio", ascending=False)
+
+    print(company_stats_sorted)
+
+    if args.term_counts:
+        term_totals(df).to_csv(args.term_counts, index=False)
+        print(f"Wrote per-term counts to {args.term_counts}")
 
-# ----------------------------------
-# Sort for quick inspection
-# ----------------------------------
-company_stats_sorted = company_stats.sort_values("green_red_ratio", ascending=False)
 
-print(company_stats_sorted)
+if __name__ == "__main__":
+    main()